@@ -10,9 +10,11 @@ from .models import (
     AffiliatePayment,
     CoinPlan,
     CoinSubscription,
+    DailyRevenueRollup,
     PaymentDetail,
     Server,
     ServerOwner,
+    StripeEvent,
     StripePlan,
     StripeSubscription,
     Subscriber,
@@ -84,6 +86,7 @@ class StripePlanInline(admin.StackedInline):
         "description",
         "interval_count",
         "subscriber_count",
+        "active_subscriber_count",
         "status",
         "discord_role_id",
         "permission_description",
@@ -125,6 +128,7 @@ class CoinPlanInline(admin.StackedInline):
         "description",
         "interval_count",
         "subscriber_count",
+        "active_subscriber_count",
         "status",
         "discord_role_id",
         "permission_description",
@@ -485,6 +489,7 @@ class AffiliateInviteeInline(admin.TabularInline):
     model = AffiliateInvitee
     readonly_fields = [
         "invitee_discord_id",
+        "subscriber",
     ]
 
     def has_delete_permission(self, request, obj=None):
@@ -519,9 +524,13 @@ class AffiliateAdmin(admin.ModelAdmin):
     list_display = [
         "subscriber",
         "affiliate_link",
+        "invite_count",
+        "active_count",
+        "conversion_rate",
         "total_commissions_paid",
         "last_payment_date",
     ]
+    list_select_related = ["subscriber"]
     readonly_fields = [
         "subscriber",
         "affiliate_link",
@@ -533,6 +542,9 @@ class AffiliateAdmin(admin.ModelAdmin):
         "total_coin_commissions_paid",
         "pending_commissions",
         "pending_coin_commissions",
+        "invite_count",
+        "active_count",
+        "converted_count",
     ]
     search_fields = ["subscriber__username", "subscriber__email"]
     search_help_text = "Search by username or email"
@@ -562,6 +574,17 @@ class AffiliateAdmin(admin.ModelAdmin):
                 ),
             },
         ),
+        (
+            "Invitations",
+            {
+                "classes": ("wide",),
+                "fields": (
+                    "invite_count",
+                    "active_count",
+                    "converted_count",
+                ),
+            },
+        ),
     )
     view_on_site = False
     inlines = [
@@ -570,5 +593,128 @@ class AffiliateAdmin(admin.ModelAdmin):
         AffiliateInviteeInline,
     ]
 
+    def get_queryset(self, request):
+        """Annotate the affiliates with their conversion rate.
+
+        Args:
+            request: The current request.
+
+        Returns:
+            QuerySet: The affiliates annotated by ``AffiliateQuerySet.with_stats``.
+        """
+        return super().get_queryset(request).with_stats()
+
+    @admin.display(description="Conversion rate", ordering="conversion_rate")
+    def conversion_rate(self, obj):
+        """Return the conversion rate of the affiliate's invitees."""
+        return f"{obj.conversion_rate}%"
+
+
+@admin.register(StripeEvent)
+class StripeEventAdmin(admin.ModelAdmin):
+    """Admin class for inspecting and replaying Stripe webhook events."""
+
+    list_display = [
+        "event_id",
+        "type",
+        "status",
+        "attempts",
+        "created",
+        "processed_at",
+    ]
+    list_filter = [
+        "status",
+        "type",
+    ]
+    search_fields = ["event_id"]
+    search_help_text = "Search by event ID"
+    readonly_fields = [
+        "event_id",
+        "type",
+        "payload",
+        "status",
+        "attempts",
+        "error",
+        "processed_at",
+        "created",
+    ]
+    actions = ["replay_events"]
+
+    @admin.action(description="Replay selected failed events")
+    def replay_events(self, request, queryset):
+        """Queue the selected failed events to be processed again.
+
+        Processed events are left alone, since applying them twice would count
+        their payments twice.
+
+        Args:
+            request: The current request.
+            queryset (QuerySet): The selected events.
+        """
+        count = queryset.filter(status=StripeEvent.EventStatus.FAILED).update(
+            status=StripeEvent.EventStatus.PENDING,
+            attempts=0,
+            error="",
+        )
+        self.message_user(request, f"{count} event(s) queued for processing.")
+
+    def has_add_permission(self, request, obj=None):
+        """Determine whether the user has permission to add StripeEvent instances.
+
+        Args:
+            request: The current request.
+            obj (optional): The object being edited.
+
+        Returns:
+            bool: True if the user has permission to add, False otherwise.
+        """
+        return False
+
+
+@admin.register(DailyRevenueRollup)
+class DailyRevenueRollupAdmin(admin.ModelAdmin):
+    """Admin class for inspecting the daily revenue rollups."""
+
+    list_display = [
+        "day",
+        "serverowner",
+        "provider",
+        "plan_id",
+        "new_subscriptions",
+        "renewals",
+        "churned_subscriptions",
+        "gross_amount",
+    ]
+    list_filter = [
+        "provider",
+        "day",
+    ]
+    list_select_related = ["serverowner"]
+    date_hierarchy = "day"
+
+    def has_add_permission(self, request, obj=None):
+        """Determine whether the user has permission to add DailyRevenueRollup instances.
+
+        Args:
+            request: The current request.
+            obj (optional): The object being edited.
+
+        Returns:
+            bool: False, the rollups are only recorded by the subscriptions.
+        """
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        """Determine whether the user has permission to change DailyRevenueRollup instances.
+
+        Args:
+            request: The current request.
+            obj (optional): The object being edited.
+
+        Returns:
+            bool: False, the rollups are only recorded by the subscriptions.
+        """
+        return False
+
 
 admin.site.unregister(Group)
@@ -0,0 +1,257 @@
+"""Shared HTTP client for calls to external APIs.
+
+All requests to CoinPayments and Discord go through ``outbound``. It keeps one
+pooled ``requests.Session`` per upstream host, so connections are reused across
+calls, sets connect and read timeouts on every request, retries idempotent
+requests with exponential backoff and records the latency of each call.
+"""
+
+import logging
+import threading
+import time
+from urllib.parse import urlencode, urlsplit
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from .utils import create_hmac_signature
+
+logger = logging.getLogger(__name__)
+
+# Status codes worth retrying since the upstream may answer the next attempt
+RETRY_STATUS_CODES = frozenset({429, 500, 502, 503, 504})
+
+# CoinPayments commands that only read data and are safe to send again
+COINPAYMENTS_IDEMPOTENT_COMMANDS = frozenset(
+    {"get_basic_info", "get_tx_info", "get_tx_info_multi"},
+)
+
+
+class CallMetrics:
+    """Thread-safe latency metrics of outbound calls, grouped by host and name.
+
+    Each group records the number of calls, the failed calls, the retries and
+    the total and slowest latency in seconds.
+    """
+
+    def __init__(self):
+        """Initialize empty metrics."""
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def record(self, host, name, elapsed, *, failed=False, retries=0):
+        """Record the outcome of one call.
+
+        Args:
+            host (str): The upstream host.
+            name (str): The name of the call.
+            elapsed (float): Seconds spent on the call, retries included.
+            failed (bool): Whether the call ended with an error.
+            retries (int): The number of retried attempts.
+        """
+        with self._lock:
+            call = self._calls.setdefault(
+                (host, name),
+                {"calls": 0, "failed": 0, "retries": 0, "total": 0.0, "max": 0.0},
+            )
+            call["calls"] += 1
+            call["failed"] += int(failed)
+            call["retries"] += retries
+            call["total"] += elapsed
+            call["max"] = max(call["max"], elapsed)
+
+    def snapshot(self):
+        """Return a copy of the recorded metrics.
+
+        Returns:
+            dict: The metrics of each call keyed by ``(host, name)``.
+        """
+        with self._lock:
+            return {key: dict(call) for key, call in self._calls.items()}
+
+    def reset(self):
+        """Forget all the recorded metrics."""
+        with self._lock:
+            self._calls.clear()
+
+
+class OutboundClient:
+    """HTTP client keeping a pooled, keep-alive session per upstream host.
+
+    Timeouts, retries and pool sizes are read from the ``OUTBOUND_HTTP_*``
+    settings when each request is made.
+
+    Attributes:
+        metrics (CallMetrics): The latency metrics of the calls made.
+    """
+
+    def __init__(self):
+        """Initialize the client without any open session."""
+        self.metrics = CallMetrics()
+        self._lock = threading.Lock()
+        self._sessions = {}
+
+    def session(self, url):
+        """Return the session of the host of a URL, creating it when needed.
+
+        Args:
+            url (str): The URL to be requested.
+
+        Returns:
+            Session: The session shared by all requests to the host.
+        """
+        parts = urlsplit(url)
+        key = (parts.scheme, parts.netloc)
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.OUTBOUND_HTTP_POOL_SIZE,
+                )
+                session.mount(f"{parts.scheme}://", adapter)
+                self._sessions[key] = session
+        return session
+
+    def close(self):
+        """Close the sessions and their pooled connections."""
+        with self._lock:
+            sessions, self._sessions = self._sessions, {}
+        for session in sessions.values():
+            session.close()
+
+    def request(
+        self,
+        method,
+        url,
+        *,
+        name=None,
+        idempotent=None,
+        retry_status_codes=RETRY_STATUS_CODES,
+        **kwargs,
+    ):
+        """Send a request through the pooled session of the host.
+
+        Args:
+            method (str): The HTTP method.
+            url (str): The URL to request.
+            name (str): The name of the call in the metrics, the URL path by default.
+            idempotent (bool): Whether the request may be retried after a connection
+                error, a timeout or a retryable status code. Defaults to True for
+                GET requests only.
+            retry_status_codes (frozenset): The status codes worth retrying,
+                ``RETRY_STATUS_CODES`` by default.
+            **kwargs: Passed on to ``Session.request``.
+
+        Returns:
+            Response: The response of the last attempt.
+
+        Raises:
+            RequestException: If the last attempt fails to get a response.
+        """
+        if idempotent is None:
+            idempotent = method.upper() in {"GET", "HEAD", "OPTIONS"}
+        kwargs.setdefault(
+            "timeout",
+            (
+                settings.OUTBOUND_HTTP_CONNECT_TIMEOUT,
+                settings.OUTBOUND_HTTP_READ_TIMEOUT,
+            ),
+        )
+        parts = urlsplit(url)
+        name = name or parts.path
+        attempts = 1 + (settings.OUTBOUND_HTTP_RETRIES if idempotent else 0)
+        session = self.session(url)
+
+        started = time.monotonic()
+        for attempt in range(attempts - 1):
+            try:
+                response = session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                response = None
+            if response is not None:
+                if response.status_code not in retry_status_codes:
+                    self._record(
+                        parts.netloc,
+                        name,
+                        started,
+                        attempt,
+                        failed=not response.ok,
+                    )
+                    return response
+                response.close()
+            delay = settings.OUTBOUND_HTTP_BACKOFF * 2**attempt
+            logger.warning(
+                "Retrying %s %s in %.2fs (attempt %d of %d)",
+                method,
+                name,
+                delay,
+                attempt + 2,
+                attempts,
+            )
+            time.sleep(delay)
+
+        # The last attempt returns its response or raises its error
+        try:
+            response = session.request(method, url, **kwargs)
+        except (requests.ConnectionError, requests.Timeout):
+            self._record(parts.netloc, name, started, attempts - 1, failed=True)
+            raise
+        self._record(parts.netloc, name, started, attempts - 1, failed=not response.ok)
+        return response
+
+    def get(self, url, **kwargs):
+        """Send a GET request, see ``request``."""
+        return self.request("GET", url, **kwargs)
+
+    def post(self, url, **kwargs):
+        """Send a POST request, see ``request``."""
+        return self.request("POST", url, **kwargs)
+
+    def _record(self, host, name, started, retries, *, failed):
+        """Record and log the latency of a finished call."""
+        elapsed = time.monotonic() - started
+        self.metrics.record(host, name, elapsed, failed=failed, retries=retries)
+        logger.debug("%s %s took %.3fs", host, name, elapsed)
+
+
+outbound = OutboundClient()
+
+
+def coinpayments_request(cmd, public_key, secret_key, **fields):
+    """Send a signed command to the CoinPayments API.
+
+    Commands in ``COINPAYMENTS_IDEMPOTENT_COMMANDS`` are retried on failure;
+    commands that create transactions or withdrawals are sent only once.
+
+    Args:
+        cmd (str): The API command, e.g. ``get_tx_info_multi``.
+        public_key (str): The public API key of the serverowner.
+        secret_key (str): The secret API key signing the request.
+        **fields: The arguments of the command.
+
+    Returns:
+        dict: The decoded JSON response.
+
+    Raises:
+        RequestException: If the request fails or returns an error status code.
+        ValueError: If the response is not valid JSON.
+    """
+    data = urlencode(
+        {"version": 1, "cmd": cmd, **fields, "key": public_key, "format": "json"},
+    )
+    headers = {
+        "Content-Type": "application/x-www-form-urlencoded",
+        "HMAC": create_hmac_signature(data, secret_key),
+    }
+    response = outbound.post(
+        settings.COINPAYMENTS_API_URL,
+        data=data,
+        headers=headers,
+        name=cmd,
+        idempotent=cmd in COINPAYMENTS_IDEMPOTENT_COMMANDS,
+    )
+    response.raise_for_status()
+    return response.json()
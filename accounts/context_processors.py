@@ -1,13 +1,60 @@
 """Context processors for adding template context data."""
 
+from django.core.cache import cache
+
 from .models import Server
 
+# Seconds the choice server of a serverowner is cached for
+CHOICE_SERVER_CACHE_TIMEOUT = 60 * 60
+
+# Default of cache lookups, to tell a cache miss from a cached None
+_MISSING = object()
+
+
+def choice_server_cache_key(user_id):
+    """Return the cache key of the choice server of a user.
+
+    Args:
+        user_id (int): The ID of the user.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"choice-server:{user_id}"
+
+
+def invalidate_choice_server(user_id):
+    """Remove the cached choice server of a user.
+
+    Args:
+        user_id (int): The ID of the user.
+    """
+    cache.delete(choice_server_cache_key(user_id))
+
+
+def get_choice_server(user):
+    """Get the choice server of a serverowner, using the cache when possible.
+
+    Args:
+        user (User): The serverowner user.
+
+    Returns:
+        Server or None: The chosen server, or None if no server is chosen yet.
+    """
+    key = choice_server_cache_key(user.pk)
+    server = cache.get(key, _MISSING)
+    if server is _MISSING:
+        server = Server.objects.filter(owner__user=user, choice_server=True).first()
+        cache.set(key, server, CHOICE_SERVER_CACHE_TIMEOUT)
+    return server
+
 
 def choice_server(request):
     """Add the chosen server to the context.
 
     Retrieves the server owned by the authenticated user that has been marked as
-    the choice server.
+    the choice server. Only serverowners have a choice server, and it is cached
+    per user until one of their servers changes.
 
     Returns:
         dict: A dictionary containing the 'choice_server' key with the chosen server
@@ -15,13 +62,7 @@ def choice_server(request):
     """
     choice_server = None
 
-    if request.user.is_authenticated:
-        try:
-            choice_server = Server.objects.get(
-                owner__user=request.user,
-                choice_server=True,
-            )
-        except Server.DoesNotExist:
-            choice_server = None
+    if request.user.is_authenticated and request.user.is_serverowner:
+        choice_server = get_choice_server(request.user)
 
     return {"choice_server": choice_server}
@@ -0,0 +1,146 @@
+"""Count providers of the list pagers and header figures of a serverowner.
+
+Exact ``COUNT(*)`` queries over the subscribers, subscriptions and payments of
+a large serverowner dominate the latency of its list pages. The provider set
+by ``settings.COUNT_PROVIDER`` answers them instead:
+
+- ``CountProvider`` counts exactly, on every request.
+- ``CachedCountProvider`` caches the counts of each serverowner until one of
+  its subscriptions, subscribers, plans, affiliates or payments changes.
+- ``EstimatedCountProvider`` uses the row estimate of the PostgreSQL planner,
+  and counts exactly below ``settings.COUNT_ESTIMATE_THRESHOLD`` rows.
+"""
+
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.utils.module_loading import import_string
+
+# Seconds the counts of a serverowner are cached for, unless invalidated first
+COUNT_CACHE_TIMEOUT = 60 * 15
+
+
+def counts_version_cache_key(serverowner_id):
+    """Return the cache key of the version of the counts of a serverowner.
+
+    Args:
+        serverowner_id (UUID): The ID of the serverowner.
+
+    Returns:
+        str: The cache key.
+    """
+    return f"counts-version:{serverowner_id}"
+
+
+def invalidate_counts(serverowner_id):
+    """Drop the cached counts of a serverowner once the transaction commits.
+
+    The version in the keys of the counts is changed rather than deleting each
+    count, whose names are not known here.
+
+    Args:
+        serverowner_id (UUID): The ID of the serverowner.
+    """
+    transaction.on_commit(
+        lambda: cache.set(
+            counts_version_cache_key(serverowner_id),
+            time.time_ns(),
+            None,
+        ),
+    )
+
+
+def get_count_provider():
+    """Return an instance of the count provider set by ``settings.COUNT_PROVIDER``."""
+    return import_string(settings.COUNT_PROVIDER)()
+
+
+class CountProvider:
+    """Provider counting exactly on every request."""
+
+    def count(self, queryset, serverowner_id, name):
+        """Count the rows of a queryset of a serverowner.
+
+        Args:
+            queryset (QuerySet): The rows to count.
+            serverowner_id (UUID): The ID of the serverowner the rows belong to.
+            name (str): The name of the count, unique for the serverowner.
+
+        Returns:
+            int: The number of rows.
+        """
+        return queryset.count()
+
+    def get_figures(self, serverowner_id, name, compute):
+        """Get figures of a serverowner computed together, e.g. by one query.
+
+        Args:
+            serverowner_id (UUID): The ID of the serverowner.
+            name (str): The name of the figures, unique for the serverowner.
+            compute (callable): Function computing the figures.
+
+        Returns:
+            The figures returned by ``compute``.
+        """
+        return compute()
+
+
+class CachedCountProvider(CountProvider):
+    """Provider caching the counts and figures of each serverowner.
+
+    The cached values of a serverowner are dropped by ``invalidate_counts``
+    whenever the state of its subscriptions or its other records change.
+    """
+
+    def count(self, queryset, serverowner_id, name):
+        """Count the rows of a queryset of a serverowner, from the cache if possible."""
+        return self.get_figures(
+            serverowner_id,
+            name,
+            lambda: super(CachedCountProvider, self).count(
+                queryset,
+                serverowner_id,
+                name,
+            ),
+        )
+
+    def get_figures(self, serverowner_id, name, compute):
+        """Get figures of a serverowner, from the cache if possible."""
+        version = cache.get(counts_version_cache_key(serverowner_id), 0)
+        key = f"counts:{serverowner_id}:{version}:{name}"
+        figures = cache.get(key)
+        if figures is None:
+            figures = compute()
+            cache.set(key, figures, COUNT_CACHE_TIMEOUT)
+        return figures
+
+
+class EstimatedCountProvider(CountProvider):
+    """Provider estimating the counts of large querysets with the query planner.
+
+    Like the ``reltuples`` estimate of a whole table, the planner's estimate
+    of a filtered query comes from the table statistics and costs no scan. It
+    is only used from ``settings.COUNT_ESTIMATE_THRESHOLD`` rows on PostgreSQL,
+    smaller counts being cheap enough to be exact. Figures such as amounts
+    cannot be estimated and are computed exactly.
+    """
+
+    def count(self, queryset, serverowner_id, name):
+        """Count the rows of a queryset of a serverowner, approximately when large."""
+        connection = connections[queryset.db]
+        if connection.vendor != "postgresql":
+            return queryset.count()
+
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f"EXPLAIN (FORMAT JSON) {sql}", params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        estimate = plan[0]["Plan"]["Plan Rows"]
+        if estimate < settings.COUNT_ESTIMATE_THRESHOLD:
+            return queryset.count()
+        return estimate
@@ -17,7 +17,7 @@ def onboarding_completed(view_func):
     def wrapper(request, *args, **kwargs):
         """Wrapper function to check onboarding status before executing the view."""
         try:
-            serverowner = request.user.serverowner
+            serverowner = request.profile.serverowner
 
             # Check if referral name is missing
             if not serverowner.subdomain:
@@ -77,7 +77,7 @@ def stripe_onboarding_required(view_func):
     def wrapper(request, *args, **kwargs):
         """Wrapper function to check stripe onboarding status before executing the view."""
         try:
-            serverowner = request.user.serverowner
+            serverowner = request.profile.serverowner
             if serverowner.coinpayment_onboarding:
                 return redirect("dashboard")
         except ObjectDoesNotExist:
@@ -0,0 +1,407 @@
+"""Client of the Discord API aware of its rate limits.
+
+Discord answers each request with the ``X-RateLimit-Bucket`` the route belongs
+to, the ``X-RateLimit-Remaining`` requests of the bucket and when it resets, and
+a ``429 Too Many Requests`` with a ``Retry-After`` delay once a limit is hit.
+``discord_api`` tracks these buckets and delays a request while its bucket is
+empty, rather than sending it only to be rejected. A request which would wait
+longer than ``settings.DISCORD_RATE_LIMIT_MAX_WAIT`` seconds fails with a
+``DiscordRateLimitedError`` instead of holding its worker.
+
+The buckets are kept by the class set by ``settings.DISCORD_RATE_LIMIT_BUCKETS``:
+``LocalBuckets`` shares them between the threads of a process and
+``CacheBuckets`` between all the workers through the cache (Redis). Requests
+made with the access token of a user are counted separately for each token,
+as Discord limits each token on its own.
+"""
+
+import hashlib
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from django.utils.module_loading import import_string
+
+from .clients import RETRY_STATUS_CODES, outbound
+
+logger = logging.getLogger(__name__)
+
+HTTP_STATUS_TOO_MANY_REQUESTS = 429
+
+# Discord API endpoints of the profile of a user signing in, keyed by name
+DISCORD_PROFILE_ENDPOINTS = {
+    "user": "/users/@me",
+    "guilds": "/users/@me/guilds",
+}
+
+
+class DiscordRateLimitedError(Exception):
+    """A Discord request which would have to wait too long for its rate limit.
+
+    Attributes:
+        route (str): The method and path of the request.
+        retry_after (float): Seconds until the rate limit resets.
+    """
+
+    def __init__(self, route, retry_after):
+        """Initialize the error with the route and its delay."""
+        super().__init__(f"{route} is rate limited for {retry_after:.2f}s")
+        self.route = route
+        self.retry_after = retry_after
+
+
+class RateLimitMetrics:
+    """Thread-safe throttling metrics of the Discord requests, grouped by route.
+
+    Each route records the requests delayed before being sent and the seconds
+    they waited, the ``429`` responses received and the requests rejected
+    for waiting too long.
+    """
+
+    def __init__(self):
+        """Initialize empty metrics."""
+        self._lock = threading.Lock()
+        self._routes = {}
+
+    def record(self, route, *, waited=0.0, limited=False, rejected=False):
+        """Record the throttling of one request.
+
+        Args:
+            route (str): The method and path of the request.
+            waited (float): Seconds the request was delayed for.
+            limited (bool): Whether Discord answered with a ``429``.
+            rejected (bool): Whether the request was not sent.
+        """
+        with self._lock:
+            metrics = self._routes.setdefault(
+                route,
+                {"throttled": 0, "waited": 0.0, "limited": 0, "rejected": 0},
+            )
+            metrics["throttled"] += int(waited > 0)
+            metrics["waited"] += waited
+            metrics["limited"] += int(limited)
+            metrics["rejected"] += int(rejected)
+
+    def snapshot(self):
+        """Return a copy of the recorded metrics.
+
+        Returns:
+            dict: The metrics of each route.
+        """
+        with self._lock:
+            return {route: dict(metrics) for route, metrics in self._routes.items()}
+
+    def reset(self):
+        """Forget all the recorded metrics."""
+        with self._lock:
+            self._routes.clear()
+
+
+class LocalBuckets:
+    """Rate-limit buckets shared by the threads of a process.
+
+    A bucket is known by a key, the bucket of the route and the identity of
+    the caller, and holds the number of requests left until it resets.
+    """
+
+    def __init__(self):
+        """Initialize the buckets without any known route."""
+        self._lock = threading.Lock()
+        self._routes = {}
+        self._buckets = {}
+
+    def get_bucket(self, route):
+        """Return the bucket Discord reported for a route, if any."""
+        return self._routes.get(route)
+
+    def set_bucket(self, route, bucket):
+        """Remember the bucket Discord reported for a route."""
+        self._routes[route] = bucket
+
+    def reserve(self, key, now):
+        """Take a request from a bucket.
+
+        Args:
+            key (str): The key of the bucket.
+            now (float): The current Unix time.
+
+        Returns:
+            float: Seconds to wait for the bucket to reset when it is empty,
+            else 0 and the request is counted.
+        """
+        with self._lock:
+            remaining, reset_at = self._buckets.get(key, (None, 0.0))
+            if reset_at <= now:
+                return 0.0
+            if remaining > 0:
+                self._buckets[key] = (remaining - 1, reset_at)
+                return 0.0
+            return reset_at - now
+
+    def update(self, key, remaining, reset_at):
+        """Set the requests left in a bucket until it resets.
+
+        Args:
+            key (str): The key of the bucket.
+            remaining (int): The number of requests left.
+            reset_at (float): The Unix time the bucket resets at.
+        """
+        with self._lock:
+            self._buckets[key] = (remaining, reset_at)
+
+
+class CacheBuckets(LocalBuckets):
+    """Rate-limit buckets shared by all the workers through the cache.
+
+    The bucket of each route rarely changes and is kept in process once read
+    from the cache, while the requests left in each bucket are counted in the
+    cache with atomic decrements, expiring once the bucket resets.
+    """
+
+    def get_bucket(self, route):
+        """Return the bucket Discord reported for a route, if any."""
+        bucket = super().get_bucket(route)
+        if bucket is None:
+            bucket = cache.get(f"discord-ratelimit:route:{route}")
+            if bucket is not None:
+                super().set_bucket(route, bucket)
+        return bucket
+
+    def set_bucket(self, route, bucket):
+        """Remember the bucket Discord reported for a route."""
+        if super().get_bucket(route) != bucket:
+            super().set_bucket(route, bucket)
+            cache.set(f"discord-ratelimit:route:{route}", bucket, None)
+
+    def reserve(self, key, now):
+        """Take a request from a bucket, see ``LocalBuckets.reserve``."""
+        reset_at = cache.get(f"discord-ratelimit:{key}:reset")
+        if reset_at is None or reset_at <= now:
+            return 0.0
+        try:
+            remaining = cache.decr(f"discord-ratelimit:{key}:remaining")
+        except ValueError:
+            # The bucket has just expired
+            return 0.0
+        if remaining >= 0:
+            return 0.0
+        return reset_at - now
+
+    def update(self, key, remaining, reset_at):
+        """Set the requests left in a bucket, see ``LocalBuckets.update``."""
+        timeout = max(1, int(reset_at - time.time()) + 1)
+        cache.set_many(
+            {
+                f"discord-ratelimit:{key}:remaining": remaining,
+                f"discord-ratelimit:{key}:reset": reset_at,
+            },
+            timeout,
+        )
+
+
+class DiscordClient:
+    """Client of the Discord API delaying requests to stay within rate limits.
+
+    Requests are sent through the pooled ``outbound`` client. A ``429`` is
+    retried after its ``Retry-After`` delay up to
+    ``settings.DISCORD_RATE_LIMIT_RETRIES`` times.
+
+    Attributes:
+        metrics (RateLimitMetrics): The throttling metrics of the requests.
+    """
+
+    def __init__(self):
+        """Initialize the client with empty metrics."""
+        self.metrics = RateLimitMetrics()
+
+    @cached_property
+    def buckets(self):
+        """LocalBuckets: The buckets of ``settings.DISCORD_RATE_LIMIT_BUCKETS``."""
+        return import_string(settings.DISCORD_RATE_LIMIT_BUCKETS)()
+
+    def request(self, method, path, *, access_token=None, **kwargs):
+        """Send a request to the Discord API once its rate limit allows it.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The path of the endpoint, e.g. ``/users/@me``.
+            access_token (str): The OAuth2 access token of the user, if any.
+            **kwargs: Passed on to ``OutboundClient.request``.
+
+        Returns:
+            Response: The response of Discord.
+
+        Raises:
+            DiscordRateLimitedError: If the request would wait longer than
+                ``settings.DISCORD_RATE_LIMIT_MAX_WAIT`` seconds.
+            RequestException: If the request fails to get a response.
+        """
+        route = f"{method} {path}"
+        identity = ""
+        if access_token:
+            kwargs["headers"] = {
+                **kwargs.get("headers", {}),
+                "Authorization": f"Bearer {access_token}",
+            }
+            identity = hashlib.sha256(access_token.encode()).hexdigest()[:16]
+        kwargs.setdefault("name", route)
+
+        for _ in range(settings.DISCORD_RATE_LIMIT_RETRIES + 1):
+            self.acquire(route, identity)
+            response = outbound.request(
+                method,
+                f"{settings.DISCORD_API_URL}{path}",
+                retry_status_codes=RETRY_STATUS_CODES - {HTTP_STATUS_TOO_MANY_REQUESTS},
+                **kwargs,
+            )
+            retry_after = self.update(route, identity, response)
+            if response.status_code != HTTP_STATUS_TOO_MANY_REQUESTS:
+                return response
+        self.metrics.record(route, rejected=True)
+        raise DiscordRateLimitedError(route, retry_after)
+
+    def get(self, path, **kwargs):
+        """Send a GET request, see ``request``."""
+        return self.request("GET", path, **kwargs)
+
+    def post(self, path, **kwargs):
+        """Send a POST request, see ``request``."""
+        return self.request("POST", path, **kwargs)
+
+    def acquire(self, route, identity):
+        """Wait until the buckets of a request allow it to be sent.
+
+        Args:
+            route (str): The method and path of the request.
+            identity (str): The hashed access token of the request, if any.
+
+        Raises:
+            DiscordRateLimitedError: If the request would wait too long.
+        """
+        waited = 0.0
+        while True:
+            now = time.time()
+            delay = max(
+                self.buckets.reserve(f"global:{identity}", now),
+                self.buckets.reserve(self.get_key(route, identity), now),
+            )
+            if delay <= 0:
+                break
+            if waited + delay > settings.DISCORD_RATE_LIMIT_MAX_WAIT:
+                self.metrics.record(route, waited=waited, rejected=True)
+                raise DiscordRateLimitedError(route, delay)
+            logger.info("Delaying Discord %s by %.2fs for its rate limit", route, delay)
+            time.sleep(delay)
+            waited += delay
+        if waited:
+            self.metrics.record(route, waited=waited)
+
+    def update(self, route, identity, response):
+        """Track the rate limit headers of a response.
+
+        Args:
+            route (str): The method and path of the request.
+            identity (str): The hashed access token of the request, if any.
+            response (Response): The response of Discord.
+
+        Returns:
+            float: The ``Retry-After`` seconds of a ``429``, else 0.
+        """
+        headers = response.headers
+        bucket = headers.get("X-RateLimit-Bucket")
+        if bucket:
+            self.buckets.set_bucket(route, bucket)
+        now = time.time()
+
+        if response.status_code == HTTP_STATUS_TOO_MANY_REQUESTS:
+            retry_after = float(headers.get("Retry-After", 1))
+            key = (
+                f"global:{identity}"
+                if headers.get("X-RateLimit-Global") == "true"
+                else self.get_key(route, identity)
+            )
+            self.buckets.update(key, 0, now + retry_after)
+            self.metrics.record(route, limited=True)
+            logger.warning("Discord %s is rate limited for %.2fs", route, retry_after)
+            return retry_after
+
+        if "X-RateLimit-Remaining" in headers:
+            self.buckets.update(
+                self.get_key(route, identity),
+                int(headers["X-RateLimit-Remaining"]),
+                now + float(headers.get("X-RateLimit-Reset-After", 0)),
+            )
+        return 0.0
+
+    def get_key(self, route, identity):
+        """Return the key of the bucket of a route for an identity."""
+        return f"{self.buckets.get_bucket(route) or route}:{identity}"
+
+
+discord_api = DiscordClient()
+
+
+def discord_token_request(code, redirect_uri, scope):
+    """Exchange a Discord OAuth2 authorization code for an access token.
+
+    Args:
+        code (str): The authorization code of the callback.
+        redirect_uri (str): The redirect URI the code was issued for.
+        scope (str): The space separated scopes of the token.
+
+    Returns:
+        Response: The response of the token endpoint.
+
+    Raises:
+        DiscordRateLimitedError: If the token endpoint is rate limited for too long.
+    """
+    return discord_api.post(
+        "/oauth2/token",
+        data={
+            "client_id": settings.DISCORD_CLIENT_ID,
+            "client_secret": settings.DISCORD_CLIENT_SECRET,
+            "grant_type": "authorization_code",
+            "code": code,
+            "redirect_uri": redirect_uri,
+            "scope": scope,
+        },
+        name="oauth2_token",
+    )
+
+
+def discord_profile_requests(access_token, names):
+    """Fetch parts of the Discord profile of a user concurrently.
+
+    The requests of ``DISCORD_PROFILE_ENDPOINTS`` run in parallel through the
+    pooled session of the Discord host, so they take about one round trip
+    instead of one per request.
+
+    Args:
+        access_token (str): The OAuth2 access token of the user.
+        names (list): The names of the endpoints to request, e.g. ``user``
+            and ``guilds``.
+
+    Returns:
+        dict: The response of each endpoint keyed by name.
+
+    Raises:
+        DiscordRateLimitedError: If an endpoint is rate limited for too long.
+        RequestException: If a request fails to get a response.
+    """
+    with ThreadPoolExecutor(
+        max_workers=len(names),
+        thread_name_prefix="discord-profile",
+    ) as executor:
+        futures = {
+            name: executor.submit(
+                discord_api.get,
+                DISCORD_PROFILE_ENDPOINTS[name],
+                access_token=access_token,
+            )
+            for name in names
+        }
+    return {name: future.result() for name, future in futures.items()}
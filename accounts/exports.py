@@ -0,0 +1,241 @@
+"""Streaming exports of the subscribers, affiliate payments and invitees of a serverowner.
+
+The rows of an export are read with a server-side cursor, ``EXPORT_CHUNK_SIZE``
+rows at a time, and written out as CSV or JSON Lines as they are read, so memory
+stays flat however many rows an export holds. Exports of more than
+``settings.EXPORT_STREAMING_ROW_LIMIT`` rows are written to a gzip file by the
+``export_to_file`` task instead, and the serverowner is emailed a download link.
+"""
+
+import csv
+import gzip
+import json
+import tempfile
+from dataclasses import dataclass
+from urllib.parse import urljoin
+
+from celery import shared_task
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import storages
+from django.core.mail import EmailMultiAlternatives
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+
+from .models import AffiliateInvitee, AffiliatePayment, ServerOwner, Subscriber
+
+# Rows fetched from the database cursor at a time
+EXPORT_CHUNK_SIZE = 2000
+
+# Content types and file extensions of the export formats
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "jsonl": "application/jsonl",
+}
+
+# First characters which make spreadsheets evaluate a CSV cell as a formula
+CSV_FORMULA_PREFIXES = ("=", "+", "-", "@", "\t", "\r")
+
+
+@dataclass(frozen=True)
+class Export:
+    """An exportable list of the records of a serverowner.
+
+    Attributes:
+        model (type): The model of the records.
+        owner_lookup (str): The lookup from the model to the serverowner.
+        columns (tuple): The header and field path of each column, related
+            fields being joined in the same query.
+        list_url_name (str): The URL name of the page listing the records.
+    """
+
+    model: type
+    owner_lookup: str
+    columns: tuple
+    list_url_name: str
+
+    @property
+    def headers(self):
+        """list: The header of each column."""
+        return [header for header, _ in self.columns]
+
+    def get_queryset(self, serverowner):
+        """Get the values of the records of a serverowner, oldest first.
+
+        Args:
+            serverowner (ServerOwner): The serverowner.
+
+        Returns:
+            QuerySet: A tuple of the column values of each record.
+        """
+        return (
+            self.model.objects.filter(**{self.owner_lookup: serverowner})
+            .order_by("created", "pk")
+            .values_list(*(path for _, path in self.columns))
+        )
+
+    def rows(self, serverowner):
+        """Iterate over the column values of the records of a serverowner.
+
+        Args:
+            serverowner (ServerOwner): The serverowner.
+
+        Yields:
+            tuple: The column values of a record.
+        """
+        yield from self.get_queryset(serverowner).iterator(
+            chunk_size=EXPORT_CHUNK_SIZE,
+        )
+
+
+EXPORTS = {
+    "subscribers": Export(
+        Subscriber,
+        "subscribed_via",
+        (
+            ("id", "id"),
+            ("username", "username"),
+            ("email", "email"),
+            ("discord_id", "discord_id"),
+            ("stripe_customer_id", "stripe_customer_id"),
+            ("joined", "created"),
+        ),
+        "subscribers",
+    ),
+    "payments": Export(
+        AffiliatePayment,
+        "serverowner",
+        (
+            ("id", "id"),
+            ("affiliate_discord_id", "affiliate_id"),
+            ("affiliate", "affiliate__subscriber__username"),
+            ("subscriber", "subscriber__username"),
+            ("amount", "amount"),
+            ("coin_amount", "coin_amount"),
+            ("paid", "paid"),
+            ("date_payment_confirmed", "date_payment_confirmed"),
+            ("created", "created"),
+        ),
+        "confirmed_affiliate_payment",
+    ),
+    "invitees": Export(
+        AffiliateInvitee,
+        "affiliate__serverowner",
+        (
+            ("invitee_discord_id", "invitee_discord_id"),
+            ("subscriber", "subscriber__username"),
+            ("affiliate_discord_id", "affiliate_id"),
+            ("affiliate", "affiliate__subscriber__username"),
+            ("invited", "created"),
+        ),
+        "affiliates",
+    ),
+}
+
+
+class Echo:
+    """File-like object returning what is written, for ``csv.writer`` to format lines."""
+
+    def write(self, value):
+        """Return the written value."""
+        return value
+
+
+def csv_cell(value):
+    """Format a value as a CSV cell which spreadsheets do not evaluate.
+
+    Args:
+        value: The value of the cell.
+
+    Returns:
+        The value, with text starting like a formula prefixed with a quote.
+    """
+    if isinstance(value, str) and value.startswith(CSV_FORMULA_PREFIXES):
+        return f"'{value}"
+    return value
+
+
+def export_lines(name, export_format, serverowner):
+    """Iterate over the lines of an export of a serverowner.
+
+    Args:
+        name (str): The name of the export, a key of ``EXPORTS``.
+        export_format (str): The format, a key of ``EXPORT_FORMATS``.
+        serverowner (ServerOwner): The serverowner whose records are exported.
+
+    Yields:
+        str: A line of the export, with its line terminator.
+    """
+    export = EXPORTS[name]
+    if export_format == "csv":
+        writer = csv.writer(Echo())
+        yield writer.writerow(export.headers)
+        for row in export.rows(serverowner):
+            yield writer.writerow([csv_cell(value) for value in row])
+    else:
+        headers = export.headers
+        for row in export.rows(serverowner):
+            yield (
+                json.dumps(dict(zip(headers, row, strict=True)), cls=DjangoJSONEncoder)
+                + "\n"
+            )
+
+
+def export_filename(name, export_format):
+    """Return the file name of an export made now.
+
+    Args:
+        name (str): The name of the export.
+        export_format (str): The format of the export.
+
+    Returns:
+        str: The file name, e.g. ``subscribers-20240131-120000.csv``.
+    """
+    return f"{name}-{timezone.now():%Y%m%d-%H%M%S}.{export_format}"
+
+
+@shared_task(name="export_to_file")
+def export_to_file(serverowner_id, name, export_format, base_url):
+    """Task to write an export to a gzip file and email its link to the serverowner.
+
+    The file is compressed while the rows are read, into a temporary file, and
+    saved to the ``exports`` storage under the ID of the serverowner.
+
+    Args:
+        serverowner_id (str): The ID of the serverowner.
+        name (str): The name of the export, a key of ``EXPORTS``.
+        export_format (str): The format, a key of ``EXPORT_FORMATS``.
+        base_url (str): The absolute URL of the site, for the download link.
+
+    Returns:
+        str: The path of the file in the ``exports`` storage.
+    """
+    serverowner = ServerOwner.objects.get(pk=serverowner_id)
+    filename = f"{export_filename(name, export_format)}.gz"
+    with tempfile.TemporaryFile() as file:
+        with gzip.GzipFile(filename=filename[:-3], mode="wb", fileobj=file) as gz:
+            for line in export_lines(name, export_format, serverowner):
+                gz.write(line.encode())
+        file.seek(0)
+        path = storages["exports"].save(f"{serverowner.pk}/{filename}", File(file))
+    download_path = reverse("export_download", args=[path.rsplit("/", 1)[-1]])
+
+    subject = render_to_string("emails/export_ready_subject.txt").strip()
+    context = {
+        "serverowner": serverowner,
+        "name": name,
+        "download_url": urljoin(base_url, download_path),
+    }
+    text_content = render_to_string("emails/export_ready_body.txt", context)
+    html_content = render_to_string("emails/export_ready_body.html", context)
+    email = EmailMultiAlternatives(
+        subject,
+        text_content,
+        settings.DEFAULT_FROM_EMAIL,
+        [serverowner.email],
+    )
+    email.attach_alternative(html_content, "text/html")
+    email.send()
+    return path
@@ -7,6 +7,7 @@ from django import forms
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 
+from .context_processors import invalidate_choice_server
 from .models import AccessCode, CoinPlan, PaymentDetail, Server, ServerOwner, StripePlan
 
 
@@ -109,7 +110,7 @@ class OnboardingForm(forms.Form):
             forms.ValidationError: If the referral name is not unique or doesn't match the pattern.
         """
         referral = self.cleaned_data.get("referral")
-        if ServerOwner.objects.filter(subdomain__iexact=referral).exists():
+        if ServerOwner.objects.with_subdomain(referral).exists():
             msg = "This referral name has already been chosen."
             raise forms.ValidationError(msg)
         if not re.match(r"^[a-z0-9_]+$", referral):
@@ -169,6 +170,7 @@ class OnboardingForm(forms.Form):
 
         server.choice_server = True
         server.save()
+        invalidate_choice_server(user.pk)
 
         access_code = self.cleaned_data["access_code"]
         code = AccessCode.objects.get(code=access_code)
@@ -0,0 +1,203 @@
+"""Module for Django management command to benchmark the subscription indexes."""
+
+import random
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.utils import timezone
+
+from accounts.models import (
+    ServerOwner,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
+
+# Subscriptions seeded per subscriber and subscribers per serverowner
+SUBSCRIPTIONS_PER_SUBSCRIBER = 100
+SUBSCRIBERS_PER_SERVEROWNER = 100
+
+# Number of rows inserted per INSERT statement
+SEED_BATCH_SIZE = 10000
+
+# Share of the seeded subscriptions in each status
+STATUS_WEIGHTS = {
+    StripeSubscription.SubscriptionStatus.EXPIRED: 70,
+    StripeSubscription.SubscriptionStatus.ACTIVE: 20,
+    StripeSubscription.SubscriptionStatus.CANCELED: 8,
+    StripeSubscription.SubscriptionStatus.PENDING: 2,
+}
+
+
+class Command(BaseCommand):
+    """Management command to compare query plans with and without the subscription indexes.
+
+    Subscriptions are seeded and the hot subscription queries explained with
+    the indexes of ``BaseSubscription.Meta`` and after dropping them, all in a
+    transaction which is rolled back, so the database is left untouched.
+    """
+
+    help = "Explain the hot subscription queries with and without their indexes"
+
+    def add_arguments(self, parser):
+        """Add command line arguments for the size of the seeded dataset."""
+        parser.add_argument(
+            "--rows",
+            type=int,
+            default=1000000,
+            help="Number of subscriptions to seed, 1,000,000 by default",
+        )
+
+    def handle(self, *args, **options):
+        """Handle command execution."""
+        with transaction.atomic():
+            self.seed(options["rows"])
+            after = self.explain_queries()
+            self.drop_indexes()
+            before = self.explain_queries()
+            transaction.set_rollback(True)
+
+        for label, plan in after.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(label))
+            self.stdout.write("Without the subscription indexes:")
+            self.stdout.write(before[label])
+            self.stdout.write("With the subscription indexes:")
+            self.stdout.write(plan)
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully explained {len(after)} queries over {options['rows']} subscriptions.",
+            ),
+        )
+
+    def seed(self, rows):
+        """Insert serverowners, plans, subscribers and their subscriptions.
+
+        Args:
+            rows (int): The number of subscriptions to insert.
+        """
+        rng = random.Random(0)
+        now = timezone.now()
+        subscriber_count = max(1, rows // SUBSCRIPTIONS_PER_SUBSCRIBER)
+        serverowner_count = max(1, subscriber_count // SUBSCRIBERS_PER_SERVEROWNER)
+
+        # Bulk inserts skip the signal creating the profile of each user
+        users = User.objects.bulk_create(
+            User(username=f"explain-{index}")
+            for index in range(serverowner_count + subscriber_count)
+        )
+        serverowners = ServerOwner.objects.bulk_create(
+            ServerOwner(
+                user=user,
+                discord_id=f"explain-{index}",
+                username=f"explain-{index}",
+                subdomain=f"explain-{index}",
+                email=f"explain-{index}@example.com",
+            )
+            for index, user in enumerate(users[:serverowner_count])
+        )
+        plans = StripePlan.objects.bulk_create(
+            StripePlan(
+                serverowner=serverowner,
+                name="Plan",
+                amount=10,
+                description="Explain plan",
+                interval_count=1,
+                discord_role_id="1",
+            )
+            for serverowner in serverowners
+        )
+        subscribers = Subscriber.objects.bulk_create(
+            (
+                Subscriber(
+                    user=user,
+                    discord_id=f"explain-{index}",
+                    username=f"explain-{index}",
+                    email=f"explain-{index}@example.com",
+                    subscribed_via=serverowners[index % serverowner_count],
+                )
+                for index, user in enumerate(users[serverowner_count:])
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+
+        statuses = rng.choices(
+            list(STATUS_WEIGHTS),
+            weights=list(STATUS_WEIGHTS.values()),
+            k=rows,
+        )
+        StripeSubscription.objects.bulk_create(
+            (
+                StripeSubscription(
+                    subscriber=subscribers[index % subscriber_count],
+                    subscribed_via=serverowners[index % serverowner_count],
+                    plan=plans[index % serverowner_count],
+                    subscription_id=f"sub_{index}",
+                    session_id=f"cs_{index}",
+                    status=status,
+                    expiration_date=now + timedelta(days=rng.randint(-365, 30)),
+                )
+                for index, status in enumerate(statuses)
+            ),
+            batch_size=SEED_BATCH_SIZE,
+        )
+
+        table = StripeSubscription._meta.db_table  # noqa: SLF001
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {connection.ops.quote_name(table)}")
+
+    def explain_queries(self):
+        """Explain the hot subscription queries.
+
+        Returns:
+            dict: The query plan of each query, keyed by a description of the query.
+        """
+        subscriber = Subscriber.objects.filter(username__startswith="explain-").first()
+        plan = StripePlan.objects.filter(description="Explain plan").first()
+        queries = {
+            "Active subscriptions of a subscriber": (
+                StripeSubscription.active_subscriptions.filter(subscriber=subscriber)
+            ),
+            "Active subscriptions of a serverowner": (
+                StripeSubscription.active_subscriptions.filter(
+                    subscribed_via=plan.serverowner_id,
+                )
+            ),
+            "Subscriptions of a plan": StripeSubscription.objects.filter(
+                plan=plan,
+                subscribed_via=plan.serverowner_id,
+            ),
+            "Expired active subscriptions": (
+                StripeSubscription.active_subscriptions.filter(
+                    expiration_date__lte=timezone.now(),
+                )
+            ),
+            "Pending subscriptions to poll": (
+                StripeSubscription.pending_subscriptions.exclude(
+                    subscription_id="",
+                ).order_by("subscribed_via", "created")
+            ),
+            "Subscription by subscription ID": StripeSubscription.objects.filter(
+                subscription_id="sub_0",
+            ),
+            "Subscription by checkout session ID": StripeSubscription.objects.filter(
+                session_id="cs_0",
+            ),
+        }
+        return {label: queryset.explain() for label, queryset in queries.items()}
+
+    def drop_indexes(self):
+        """Drop the indexes of the subscription model, inside the transaction."""
+        # The schema editor cannot be entered in a transaction on SQLite, so
+        # only its DROP INDEX template is used
+        sql_delete_index = connection.schema_editor().sql_delete_index
+        meta = StripeSubscription._meta  # noqa: SLF001
+        table = connection.ops.quote_name(meta.db_table)
+        with connection.cursor() as cursor:
+            for index in meta.indexes:
+                cursor.execute(
+                    sql_delete_index
+                    % {"table": table, "name": connection.ops.quote_name(index.name)},
+                )
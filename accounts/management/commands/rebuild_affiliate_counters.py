@@ -0,0 +1,33 @@
+"""Module for Django management command to rebuild the affiliate counters."""
+
+from django.core.management.base import BaseCommand
+
+from accounts.models import Affiliate
+
+
+class Command(BaseCommand):
+    """Management command to recompute the invitation counters of affiliates."""
+
+    help = "Rebuild the invite, active and converted counters of affiliates"
+
+    def add_arguments(self, parser):
+        """Add command line arguments for the affiliates to rebuild."""
+        parser.add_argument(
+            "affiliate_ids",
+            nargs="*",
+            help="Discord IDs of the affiliates to rebuild, all affiliates by default",
+        )
+
+    def handle(self, *args, **options):
+        """Handle command execution."""
+        affiliates = Affiliate.objects.all()
+        if options["affiliate_ids"]:
+            affiliates = affiliates.filter(pk__in=options["affiliate_ids"])
+
+        updated = affiliates.rebuild_counters()
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Successfully rebuilt the counters of {updated} affiliates.",
+            ),
+        )
@@ -29,3 +29,11 @@ class ActivePlanManager(models.Manager):
     def get_queryset(self):
         """Return a queryset of active plans."""
         return super().get_queryset().filter(status=self.model.PlanStatus.ACTIVE)
+
+
+class PendingEventManager(models.Manager):
+    """Custom manager for retrieving webhook events waiting to be processed."""
+
+    def get_queryset(self):
+        """Return a queryset of pending events."""
+        return super().get_queryset().filter(status=self.model.EventStatus.PENDING)
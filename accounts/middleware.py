@@ -0,0 +1,146 @@
+"""Middleware attaching the profile of the logged in user to the request."""
+
+from django.http import Http404
+
+from .models import ServerOwner, Subscriber, User
+
+
+class Profile:
+    """Loader of the serverowner and subscriber profiles of a request's user.
+
+    Each profile is fetched at most once per request, with its related objects
+    joined in, and stored in the related object cache of ``request.user``. The
+    decorators, views and templates accessing ``user.serverowner`` or
+    ``user.subscriber`` therefore share the same instance without querying it
+    again.
+    """
+
+    def __init__(self, request):
+        """Initialize the loader without fetching any profile.
+
+        Args:
+            request (HttpRequest): The request of the user.
+        """
+        self.request = request
+
+    @property
+    def serverowner(self):
+        """Return the serverowner profile of the user.
+
+        Returns:
+            ServerOwner: The serverowner profile.
+
+        Raises:
+            ServerOwner.DoesNotExist: If the user is not a serverowner.
+        """
+        user = self.request.user
+        if not User.serverowner.related.is_cached(user):
+            self._cache(
+                user,
+                "serverowner",
+                ServerOwner.objects.filter(user_id=user.pk).first(),
+            )
+        return user.serverowner
+
+    @property
+    def subscriber(self):
+        """Return the subscriber profile of the user.
+
+        The serverowner subscribed to, and the affiliate and payment detail of
+        the subscriber are loaded in the same query.
+
+        Returns:
+            Subscriber: The subscriber profile.
+
+        Raises:
+            Subscriber.DoesNotExist: If the user is not a subscriber.
+        """
+        user = self.request.user
+        if not User.subscriber.related.is_cached(user):
+            self._cache(
+                user,
+                "subscriber",
+                Subscriber.objects.select_related(
+                    "subscribed_via",
+                    "affiliate__serverowner",
+                    "affiliate__paymentdetail",
+                )
+                .filter(user_id=user.pk)
+                .first(),
+            )
+        return user.subscriber
+
+    @property
+    def affiliate(self):
+        """Return the affiliate profile of the user.
+
+        Returns:
+            Affiliate: The affiliate of the subscriber profile.
+
+        Raises:
+            ObjectDoesNotExist: If the user is not a subscriber or not an affiliate.
+        """
+        return self.subscriber.affiliate
+
+    @staticmethod
+    def _cache(user, name, profile):
+        """Store a profile, or its absence, in the related object cache of a user."""
+        if profile is None:
+            getattr(User, name).related.set_cached_value(user, None)
+        else:
+            # Setting the user also caches the profile on the user
+            profile.user = user
+
+
+def get_serverowner_or_404(request):
+    """Return the serverowner profile of the request's user.
+
+    Args:
+        request (HttpRequest): The request of the user.
+
+    Returns:
+        ServerOwner: The serverowner profile.
+
+    Raises:
+        Http404: If the user is not a serverowner.
+    """
+    try:
+        return request.profile.serverowner
+    except ServerOwner.DoesNotExist:
+        msg = "No ServerOwner matches the given query."
+        raise Http404(msg) from None
+
+
+def get_subscriber_or_404(request):
+    """Return the subscriber profile of the request's user.
+
+    Args:
+        request (HttpRequest): The request of the user.
+
+    Returns:
+        Subscriber: The subscriber profile.
+
+    Raises:
+        Http404: If the user is not a subscriber.
+    """
+    try:
+        return request.profile.subscriber
+    except Subscriber.DoesNotExist:
+        msg = "No Subscriber matches the given query."
+        raise Http404(msg) from None
+
+
+class ProfileMiddleware:
+    """Attach a lazy ``Profile`` of the logged in user as ``request.profile``.
+
+    Must come after ``AuthenticationMiddleware``, which sets ``request.user``.
+    """
+
+    def __init__(self, get_response):
+        """Initialize the middleware."""
+        self.get_response = get_response
+
+    def __call__(self, request):
+        """Attach the profile loader and process the request."""
+        request.profile = Profile(request)
+        return self.get_response(request)
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0003_alter_server_icon_alter_subscriber_avatar'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='stripesubscription',
+            name='session_id',
+            field=models.CharField(blank=True, default='', help_text='Stripe checkout session ID associated with this subscription.', max_length=200, verbose_name='session id'),
+        ),
+        migrations.CreateModel(
+            name='StripeEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('event_id', models.CharField(help_text='The Stripe ID of the event.', max_length=255, unique=True, verbose_name='event id')),
+                ('type', models.CharField(help_text='The Stripe event type, e.g. invoice.paid.', max_length=100, verbose_name='type')),
+                ('payload', models.JSONField(help_text='The verified event as sent by Stripe.', verbose_name='payload')),
+                ('status', models.CharField(choices=[('P', 'Pending'), ('D', 'Processed'), ('F', 'Failed')], default='P', help_text='The processing status of the event.', max_length=1, verbose_name='status')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, help_text='The number of failed processing attempts.', verbose_name='attempts')),
+                ('error', models.TextField(blank=True, default='', help_text='The error of the last failed processing attempt.', verbose_name='error')),
+                ('processed_at', models.DateTimeField(blank=True, help_text='The date and time the event was processed.', null=True, verbose_name='processed at')),
+                ('created', models.DateTimeField(auto_now_add=True)),
+                ('updated', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name': 'stripe event',
+                'verbose_name_plural': 'stripe events',
+                'ordering': ['-created'],
+                'indexes': [models.Index(fields=['status', 'id'], name='stripeevent_status_id_idx')],
+            },
+        ),
+    ]
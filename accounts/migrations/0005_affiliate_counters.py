@@ -0,0 +1,72 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:23
+
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def count_invitees(invitees):
+    """Count the invitees of the affiliate of the outer query."""
+    return Coalesce(
+        Subquery(
+            invitees.order_by()
+            .values("affiliate")
+            .annotate(value=Count("pk"))
+            .values("value"),
+            output_field=models.IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def fill_affiliate_counters(apps, schema_editor):
+    """Compute the counters of the existing affiliates."""
+    Affiliate = apps.get_model("accounts", "Affiliate")
+    AffiliateInvitee = apps.get_model("accounts", "AffiliateInvitee")
+    invitees = AffiliateInvitee.objects.filter(affiliate=OuterRef("pk"))
+    for coinpayment_onboarding, model_name in (
+        (True, "CoinSubscription"),
+        (False, "StripeSubscription"),
+    ):
+        subscriptions = apps.get_model("accounts", model_name).objects.filter(
+            subscriber__discord_id=OuterRef("invitee_discord_id"),
+        )
+        Affiliate.objects.filter(
+            serverowner__coinpayment_onboarding=coinpayment_onboarding,
+        ).update(
+            invite_count=count_invitees(invitees),
+            active_count=count_invitees(
+                invitees.filter(Exists(subscriptions.filter(status="A"))),
+            ),
+            converted_count=count_invitees(
+                invitees.filter(
+                    Exists(subscriptions.filter(status__in=["A", "C", "E"])),
+                ),
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0004_stripeevent'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affiliate',
+            name='active_count',
+            field=models.PositiveIntegerField(default=0, help_text='The number of invitees with an active subscription.', verbose_name='active count'),
+        ),
+        migrations.AddField(
+            model_name='affiliate',
+            name='converted_count',
+            field=models.PositiveIntegerField(default=0, help_text='The number of invitees who paid for a subscription.', verbose_name='converted count'),
+        ),
+        migrations.AddField(
+            model_name='affiliate',
+            name='invite_count',
+            field=models.PositiveIntegerField(default=0, help_text='The number of users invited by the affiliate.', verbose_name='invite count'),
+        ),
+        migrations.RunPython(fill_affiliate_counters, migrations.RunPython.noop),
+    ]
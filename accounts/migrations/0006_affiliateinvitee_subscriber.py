@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:27
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def link_invitee_subscribers(apps, schema_editor):
+    """Link the existing invitees to the subscribers sharing their Discord ID."""
+    AffiliateInvitee = apps.get_model("accounts", "AffiliateInvitee")
+    Subscriber = apps.get_model("accounts", "Subscriber")
+    AffiliateInvitee.objects.filter(subscriber__isnull=True).update(
+        subscriber=Subquery(
+            Subscriber.objects.filter(
+                discord_id=OuterRef("invitee_discord_id"),
+            ).values("pk")[:1],
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_affiliate_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='affiliateinvitee',
+            name='subscriber',
+            field=models.OneToOneField(blank=True, help_text='The subscriber the invitee signed up as.', null=True, on_delete=django.db.models.deletion.SET_NULL, to='accounts.subscriber', verbose_name='subscriber'),
+        ),
+        migrations.RunPython(link_invitee_subscribers, migrations.RunPython.noop),
+    ]
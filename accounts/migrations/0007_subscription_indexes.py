@@ -0,0 +1,65 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0006_affiliateinvitee_subscriber'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['subscriber', 'status'], name='coinsubscription_sub_status'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['subscribed_via', 'status'], name='coinsubscription_via_status'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['status', 'expiration_date'], name='coinsubscription_status_exp'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['subscribed_via', 'created'], name='coinsubscription_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['subscription_id'], name='coinsubscription_sub_id'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['plan', 'subscribed_via'], name='coinsubscription_plan_via'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['subscriber', 'status'], name='stripesubscription_sub_status'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['subscribed_via', 'status'], name='stripesubscription_via_status'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['status', 'expiration_date'], name='stripesubscription_status_exp'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(condition=models.Q(('status', 'P')), fields=['subscribed_via', 'created'], name='stripesubscription_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['subscription_id'], name='stripesubscription_sub_id'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['plan', 'subscribed_via'], name='stripesubscription_plan_via'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['session_id'], name='stripesubscription_session'),
+        ),
+    ]
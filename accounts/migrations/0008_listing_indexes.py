@@ -0,0 +1,74 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:33
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def rename_duplicate_subdomains(apps, schema_editor):
+    """Rename the subdomains only differing in case from an older serverowner's.
+
+    The oldest serverowner keeps the subdomain, the others get a free numbered
+    variant, e.g. ``foo_2``, so the case-insensitive constraint can be added.
+    """
+    ServerOwner = apps.get_model("accounts", "ServerOwner")
+    taken = set()
+    duplicates = []
+    serverowners = (
+        ServerOwner.objects.exclude(subdomain="")
+        .order_by("created", "pk")
+        .values_list("pk", "subdomain")
+    )
+    for pk, subdomain in serverowners.iterator():
+        if subdomain.lower() in taken:
+            duplicates.append((pk, subdomain))
+        else:
+            taken.add(subdomain.lower())
+    for pk, subdomain in duplicates:
+        number = 2
+        while True:
+            suffix = f"_{number}"
+            renamed = f"{subdomain[: 20 - len(suffix)]}{suffix}".lower()
+            if renamed not in taken:
+                break
+            number += 1
+        taken.add(renamed)
+        ServerOwner.objects.filter(pk=pk).update(subdomain=renamed)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0007_subscription_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(condition=models.Q(('paid', False)), fields=['serverowner', '-created'], name='affiliatepayment_owner_pending'),
+        ),
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(condition=models.Q(('paid', True)), fields=['serverowner', '-created'], name='affiliatepayment_owner_paid'),
+        ),
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(fields=['affiliate', '-created'], name='affiliatepayment_aff_created'),
+        ),
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(condition=models.Q(('paid', True)), fields=['affiliate', 'subscriber'], name='affiliatepayment_aff_sub_paid'),
+        ),
+        migrations.AddIndex(
+            model_name='coinplan',
+            index=models.Index(fields=['serverowner', 'status', 'subscriber_count'], name='coinplan_popular'),
+        ),
+        migrations.AddIndex(
+            model_name='stripeplan',
+            index=models.Index(fields=['serverowner', 'status', 'subscriber_count'], name='stripeplan_popular'),
+        ),
+        migrations.RunPython(rename_duplicate_subdomains, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='serverowner',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('subdomain'), condition=models.Q(('subdomain', ''), _negated=True), name='serverowner_subdomain_lower', violation_error_message='This referral name has already been chosen.'),
+        ),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:36
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_active_subscriber_counts(apps, schema_editor):
+    """Count the active subscriptions of the existing plans."""
+    for plan_name, subscription_name in (
+        ("CoinPlan", "CoinSubscription"),
+        ("StripePlan", "StripeSubscription"),
+    ):
+        subscriptions = apps.get_model("accounts", subscription_name).objects.filter(
+            plan=OuterRef("pk"),
+            subscribed_via=OuterRef("serverowner"),
+            status="A",
+        )
+        apps.get_model("accounts", plan_name).objects.update(
+            active_subscriber_count=Coalesce(
+                Subquery(
+                    subscriptions.order_by()
+                    .values("plan")
+                    .annotate(value=Count("pk"))
+                    .values("value"),
+                    output_field=models.IntegerField(),
+                ),
+                Value(0),
+            ),
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0008_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='coinplan',
+            name='active_subscriber_count',
+            field=models.PositiveIntegerField(default=0, help_text='The number of active subscriptions to this plan.', verbose_name='active subscriber count'),
+        ),
+        migrations.AddField(
+            model_name='stripeplan',
+            name='active_subscriber_count',
+            field=models.PositiveIntegerField(default=0, help_text='The number of active subscriptions to this plan.', verbose_name='active subscriber count'),
+        ),
+        migrations.RunPython(fill_active_subscriber_counts, migrations.RunPython.noop),
+    ]
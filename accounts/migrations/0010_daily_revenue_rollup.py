@@ -0,0 +1,36 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:45
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_plan_active_subscriber_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plan_id', models.UUIDField(help_text='The ID of the StripePlan or CoinPlan, depending on the provider.', verbose_name='plan id')),
+                ('day', models.DateField(help_text='The day of the revenue.', verbose_name='day')),
+                ('provider', models.CharField(choices=[('S', 'Stripe'), ('C', 'CoinPayments')], help_text='The payment provider of the plan.', max_length=1, verbose_name='provider')),
+                ('new_subscriptions', models.PositiveIntegerField(default=0, help_text='The number of first payments of subscriptions.', verbose_name='new subscriptions')),
+                ('renewals', models.PositiveIntegerField(default=0, help_text='The number of payments renewing a subscription.', verbose_name='renewals')),
+                ('churned_subscriptions', models.PositiveIntegerField(default=0, help_text='The number of subscriptions canceled or expired.', verbose_name='churned subscriptions')),
+                ('gross_amount', models.DecimalField(decimal_places=2, default=0, help_text='The dollar amount of the payments.', max_digits=12, verbose_name='gross amount')),
+                ('coin_amount', models.DecimalField(decimal_places=8, default=0, help_text='The coin amount of the payments.', max_digits=20, verbose_name='coin amount')),
+                ('serverowner', models.ForeignKey(help_text='The serverowner who earned the revenue.', on_delete=django.db.models.deletion.CASCADE, to='accounts.serverowner', verbose_name='serverowner')),
+            ],
+            options={
+                'verbose_name': 'daily revenue rollup',
+                'verbose_name_plural': 'daily revenue rollups',
+                'ordering': ['-day'],
+                'indexes': [models.Index(fields=['serverowner', 'day'], name='dailyrevenuerollup_owner_day')],
+                'constraints': [models.UniqueConstraint(fields=('serverowner', 'plan_id', 'day', 'provider'), name='dailyrevenuerollup_unique_day')],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0010_daily_revenue_rollup'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='affiliatepayment',
+            name='affiliatepayment_owner_paid',
+        ),
+        migrations.RemoveIndex(
+            model_name='affiliatepayment',
+            name='affiliatepayment_aff_created',
+        ),
+        migrations.RemoveIndex(
+            model_name='coinsubscription',
+            name='coinsubscription_plan_via',
+        ),
+        migrations.RemoveIndex(
+            model_name='stripesubscription',
+            name='stripesubscription_plan_via',
+        ),
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(condition=models.Q(('paid', True)), fields=['serverowner', '-created', '-id'], name='affiliatepayment_owner_paid'),
+        ),
+        migrations.AddIndex(
+            model_name='affiliatepayment',
+            index=models.Index(fields=['affiliate', '-created', '-id'], name='affiliatepayment_aff_created'),
+        ),
+        migrations.AddIndex(
+            model_name='coinsubscription',
+            index=models.Index(fields=['plan', 'subscribed_via', '-created', '-id'], name='coinsubscription_plan_via'),
+        ),
+        migrations.AddIndex(
+            model_name='stripesubscription',
+            index=models.Index(fields=['plan', 'subscribed_via', '-created', '-id'], name='stripesubscription_plan_via'),
+        ),
+        migrations.AddIndex(
+            model_name='subscriber',
+            index=models.Index(fields=['subscribed_via', '-created', '-id'], name='subscriber_via_created'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.4 on 2026-10-17 21:56
+
+from django.db import migrations, models
+
+
+def delete_duplicate_servers(apps, schema_editor):
+    """Keep one server per owner and Discord ID, the choice server or else the oldest."""
+    Server = apps.get_model("accounts", "Server")
+    kept = set()
+    duplicates = []
+    servers = Server.objects.order_by(
+        "owner", "server_id", "-choice_server", "created", "pk"
+    ).values_list("pk", "owner", "server_id")
+    for pk, owner_id, server_id in servers.iterator():
+        if (owner_id, server_id) in kept:
+            duplicates.append(pk)
+        else:
+            kept.add((owner_id, server_id))
+    Server.objects.filter(pk__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_keyset_pagination_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_duplicate_servers, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='server',
+            constraint=models.UniqueConstraint(fields=('owner', 'server_id'), name='server_unique_owner_server_id'),
+        ),
+    ]
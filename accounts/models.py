@@ -1,22 +1,95 @@
 """Model classes."""
 
 import uuid
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import timedelta
 from decimal import Decimal
+from functools import reduce
+from operator import or_
 
 from django.contrib.auth.models import AbstractUser
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
-from django.db.models import Q, Sum
+from django.db.models import (
+    Case,
+    Count,
+    Exists,
+    F,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import (
+    Cast,
+    Coalesce,
+    Greatest,
+    Least,
+    Lower,
+    Round,
+    TruncDate,
+)
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.functional import cached_property
 from django.utils.translation import gettext_lazy as _
 
+from .counts import get_count_provider
 from .managers import (
     ActivePlanManager,
     ActiveSubscriptionManager,
+    PendingEventManager,
     PendingSubscriptionManager,
 )
 
 
+def aggregate_subquery(queryset, aggregate, output_field=None):
+    """Wrap an aggregate over a queryset as a scalar subquery.
+
+    Args:
+        queryset (QuerySet): The rows to aggregate.
+        aggregate (Aggregate): The aggregate expression, e.g. ``Count("pk")``.
+        output_field (Field, optional): The output field of the aggregate.
+
+    Returns:
+        Coalesce: A scalar expression which evaluates to 0 when no rows match.
+    """
+    output_field = output_field or models.IntegerField()
+    return Coalesce(
+        Subquery(
+            queryset.order_by()
+            .annotate(group=Value(1))
+            .values("group")
+            .annotate(value=aggregate)
+            .values("value"),
+            output_field=output_field,
+        ),
+        Value(0),
+        output_field=output_field,
+    )
+
+
+def case_by_pk(values, output_field):
+    """Select a value per row by primary key, to update many rows in one statement.
+
+    Args:
+        values (dict): The values keyed by primary key.
+        output_field (Field): The output field of the values.
+
+    Returns:
+        Case: An expression which evaluates to the value of each row, or 0 for
+            rows without one.
+    """
+    return Case(
+        *(When(pk=pk, then=Value(value)) for pk, value in values.items()),
+        default=Value(0),
+        output_field=output_field,
+    )
+
+
 class User(AbstractUser):
     """Custom user model with additional fields."""
 
@@ -25,6 +98,109 @@ class User(AbstractUser):
     is_affiliate = models.BooleanField(default=False)
 
 
+@dataclass
+class DashboardMetrics:
+    """Snapshot of the figures displayed on the serverowner dashboard pages.
+
+    The counters are computed together by ``ServerOwner.get_dashboard_metrics``;
+    the card lists are only fetched when a template first accesses them.
+    """
+
+    serverowner: "ServerOwner"
+    plan_count: int = 0
+    active_plans_count: int = 0
+    inactive_plans_count: int = 0
+    total_subscribers: int = 0
+    active_subscribers_count: int = 0
+    inactive_subscribers_count: int = 0
+    total_affiliates: int = 0
+    pending_affiliates_count: int = 0
+    total_payments_to_affiliates: Decimal = Decimal(0)
+    pending_payments_count: int = 0
+    confirmed_payments_count: int = 0
+    confirmed_payment_amount: Decimal = Decimal("0.00")
+    limit: int = 3
+
+    @cached_property
+    def popular_plans(self):
+        """list: The most subscribed active plans of the serverowner."""
+        return list(self.serverowner.get_popular_plans(self.limit))
+
+    @cached_property
+    def latest_subscriptions(self):
+        """list: The latest active subscriptions to the serverowner's plans."""
+        return list(self.serverowner.get_latest_subscriptions(self.limit))
+
+    @cached_property
+    def latest_payouts(self):
+        """list: The latest commissions the serverowner paid to affiliates."""
+        return list(self.serverowner.get_latest_payouts(self.limit))
+
+
+class ServerOwnerQuerySet(models.QuerySet):
+    """QuerySet of serverowners."""
+
+    def with_subdomain(self, subdomain):
+        """Filter the serverowner using a referral name, ignoring its case.
+
+        The lookup matches the unique ``Lower(subdomain)`` index, which only
+        covers the serverowners who chose a referral name.
+
+        Args:
+            subdomain (str): The referral name.
+
+        Returns:
+            QuerySet: The serverowner with the referral name, if any.
+        """
+        return (
+            self.exclude(subdomain="")
+            .alias(subdomain_lower=Lower("subdomain"))
+            .filter(subdomain_lower=Lower(Value(subdomain)))
+        )
+
+    def record_earnings(self, earnings, payments=()):
+        """Add subscription earnings and pending commissions to the serverowners.
+
+        The counters of all the serverowners are incremented in a single UPDATE.
+
+        Args:
+            earnings (dict): The dollar earnings keyed by serverowner ID.
+            payments (list): The new affiliate payments owed by the serverowners.
+
+        Returns:
+            int: The number of serverowners updated.
+        """
+        commissions = Counter()
+        coin_commissions = Counter()
+        for payment in payments:
+            commissions[payment.serverowner_id] += payment.amount
+            if payment.coin_amount is not None:
+                coin_commissions[payment.serverowner_id] += payment.coin_amount
+        counters = {}
+        if earnings:
+            counters["total_earnings"] = F("total_earnings") + case_by_pk(
+                earnings,
+                models.DecimalField(max_digits=9, decimal_places=2),
+            )
+        if commissions:
+            counters["total_pending_commissions"] = F(
+                "total_pending_commissions",
+            ) + case_by_pk(
+                commissions,
+                models.DecimalField(max_digits=9, decimal_places=2),
+            )
+        if coin_commissions:
+            counters["total_coin_pending_commissions"] = F(
+                "total_coin_pending_commissions",
+            ) + case_by_pk(
+                coin_commissions,
+                models.DecimalField(max_digits=20, decimal_places=8),
+            )
+        if not counters:
+            return 0
+        return self.filter(pk__in={*earnings, *commissions}).update(**counters)
+
+
 class ServerOwner(models.Model):
     """Model representing serverowner instance."""
 
@@ -131,10 +307,22 @@ class ServerOwner(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ServerOwnerQuerySet.as_manager()
+
     class Meta:
         """Metadata options for the ServerOwner model."""
 
         ordering = ["-created"]
+        constraints = [
+            models.UniqueConstraint(
+                Lower("subdomain"),
+                condition=~Q(subdomain=""),
+                name="serverowner_subdomain_lower",
+                violation_error_message=_(
+                    "This referral name has already been chosen.",
+                ),
+            ),
+        ]
         verbose_name = _("serverowner")
         verbose_name_plural = _("serverowners")
 
@@ -150,8 +338,126 @@ class ServerOwner(models.Model):
         """
         return self.servers.filter(choice_server=True).first()
 
+    def get_dashboard_metrics(self, limit=3):
+        """Compute the dashboard figures of the ServerOwner in a single query.
+
+        Every counter is evaluated as a scalar subquery of one SELECT instead
+        of issuing a separate COUNT or SUM per figure, and the figures are
+        kept by the count provider, e.g. cached until the records change.
+
+        Args:
+            limit (int): The number of items in each dashboard card list.
+
+        Returns:
+            DashboardMetrics: The snapshot of the serverowner's dashboard figures.
+        """
+        plan_model = CoinPlan if self.coinpayment_onboarding else StripePlan
+        subscription_model = (
+            CoinSubscription if self.coinpayment_onboarding else StripeSubscription
+        )
+        plans = plan_model.objects.filter(serverowner=self)
+        subscribers = Subscriber.objects.filter(subscribed_via=self)
+        affiliates = Affiliate.objects.filter(serverowner=self)
+        payments = AffiliatePayment.objects.filter(serverowner=self)
+        amount_field = models.DecimalField(max_digits=12, decimal_places=2)
+
+        active_plan = Q(status=plan_model.PlanStatus.ACTIVE)
+        inactive_plan = Q(status=plan_model.PlanStatus.INACTIVE)
+        active_subscriber = Exists(
+            subscription_model.active_subscriptions.filter(
+                subscriber=OuterRef("pk"),
+            ),
+        )
+
+        figures = (
+            ServerOwner.objects.filter(pk=self.pk)
+            .annotate(
+                plan_count=aggregate_subquery(plans, Count("pk")),
+                active_plans_count=aggregate_subquery(
+                    plans,
+                    Count("pk", filter=active_plan),
+                ),
+                inactive_plans_count=aggregate_subquery(
+                    plans,
+                    Count("pk", filter=inactive_plan),
+                ),
+                total_subscribers=aggregate_subquery(subscribers, Count("pk")),
+                active_subscribers_count=aggregate_subquery(
+                    subscribers.filter(active_subscriber),
+                    Count("pk"),
+                ),
+                total_affiliates=aggregate_subquery(affiliates, Count("pk")),
+                pending_affiliates_count=aggregate_subquery(
+                    affiliates,
+                    Count("pk", filter=~Q(pending_commissions=0)),
+                ),
+                total_payments_to_affiliates=aggregate_subquery(
+                    affiliates,
+                    Sum("total_commissions_paid"),
+                    amount_field,
+                ),
+                pending_payments_count=aggregate_subquery(
+                    payments,
+                    Count("pk", filter=Q(paid=False)),
+                ),
+                confirmed_payments_count=aggregate_subquery(
+                    payments,
+                    Count("pk", filter=Q(paid=True)),
+                ),
+                confirmed_payment_amount=aggregate_subquery(
+                    payments,
+                    Sum("amount", filter=Q(paid=True)),
+                    amount_field,
+                ),
+            )
+            .values(
+                "plan_count",
+                "active_plans_count",
+                "inactive_plans_count",
+                "total_subscribers",
+                "active_subscribers_count",
+                "total_affiliates",
+                "pending_affiliates_count",
+                "total_payments_to_affiliates",
+                "pending_payments_count",
+                "confirmed_payments_count",
+                "confirmed_payment_amount",
+            )
+        )
+        figures = get_count_provider().get_figures(
+            self.pk,
+            f"dashboard-metrics:{plan_model.__name__}",
+            figures.get,
+        )
+        figures["inactive_subscribers_count"] = (
+            figures["total_subscribers"] - figures["active_subscribers_count"]
+        )
+        figures["total_payments_to_affiliates"] = Decimal(
+            figures["total_payments_to_affiliates"],
+        )
+        figures["confirmed_payment_amount"] = Decimal(
+            figures["confirmed_payment_amount"],
+        ).quantize(Decimal("0.00"))
+        return DashboardMetrics(serverowner=self, limit=limit, **figures)
+
     # ===== SERVEROWNER PLAN METHODS ===== #
 
+    def get_daily_revenue(self, days=30):
+        """Get the revenue of the serverowner on each of the last days.
+
+        Args:
+            days (int): The number of days, including today.
+
+        Returns:
+            QuerySet: Dicts of the day and the revenue counters of the days with
+                any revenue or churn, oldest first.
+        """
+        start = timezone.localdate() - timedelta(days=days - 1)
+        return DailyRevenueRollup.objects.filter(
+            serverowner=self,
+            day__gte=start,
+        ).daily_totals()
+
     def get_plans(self):
         """Retrieve the serverowner's plans from the database.
 
@@ -284,7 +590,9 @@ class ServerOwner(models.Model):
         Returns:
             QuerySet: QuerySet of latest limit AffiliatePayment objects with confirmed payments.
         """
-        return self.get_confirmed_affiliate_payments()[:limit]
+        return self.get_confirmed_affiliate_payments().select_related(
+            "affiliate__subscriber",
+        )[:limit]
 
     def get_affiliates_confirmed_payment_count(self):
         """Get the total number of affiliates who have been paid by the serverowner.
@@ -330,20 +638,20 @@ class ServerOwner(models.Model):
             commission_amount = (subscription_amount * commission_percentage) / 100
         return commission_amount
 
-    def get_affiliate_users(self):
-        """Retrieve the affiliates associated with the ServerOwner.
+    def get_affiliate_leaderboard(self, sort="invites", after=None, before=None):
+        """Rank the affiliates of the ServerOwner by a statistic.
+
+        Args:
+            sort (str): The statistic to rank by, see ``AffiliateQuerySet.leaderboard``.
+            after (str, optional): The primary key of the last affiliate of the
+                previous page.
+            before (str, optional): The primary key of the first affiliate of
+                the next page.
 
         Returns:
-            QuerySet: QuerySet of Affiliate objects associated with the ServerOwner.
+            QuerySet: The ranked affiliates annotated with their statistics.
         """
-        affiliates = Affiliate.objects.filter(serverowner=self)
-        affiliate_counts = []
-
-        for affiliate in affiliates:
-            invite_count = AffiliateInvitee.objects.filter(affiliate=affiliate).count()
-            affiliate_counts.append((affiliate, invite_count))
-
-        return affiliate_counts
+        return self.get_affiliates().leaderboard(sort, after, before)
 
     def get_total_affiliates(self):
         """Get the total number of affiliates associated with the ServerOwner.
@@ -387,7 +695,7 @@ class ServerOwner(models.Model):
         )
         return subscription_model.active_subscriptions.filter(
             subscribed_via=self,
-        )[:limit]
+        ).select_related("subscriber", "plan")[:limit]
 
     def get_active_subscribers_count(self):
         """Get the total number of subscribers with active subscriptions.
@@ -434,6 +742,44 @@ class ServerOwner(models.Model):
         )
 
 
+class ServerQuerySet(models.QuerySet):
+    """QuerySet of Discord servers."""
+
+    def sync_guilds(self, serverowner, guilds):
+        """Create or refresh the servers of the guilds owned by a serverowner.
+
+        The servers are written with a single ``INSERT ... ON CONFLICT``
+        statement on ``(owner, server_id)``, updating the name and icon of the
+        servers which already exist. Signals are not sent, so the caller
+        invalidates the cached choice server of the serverowner.
+
+        Args:
+            serverowner (ServerOwner): The serverowner owning the guilds.
+            guilds (list): The ``id``, ``name`` and ``icon`` of each guild.
+
+        Returns:
+            list: The Server instances of the guilds.
+        """
+        # A row cannot be updated twice by one statement
+        guilds = {guild["id"]: guild for guild in guilds}
+        if not guilds:
+            return []
+        return self.bulk_create(
+            [
+                Server(
+                    owner=serverowner,
+                    server_id=guild["id"],
+                    name=guild["name"],
+                    icon=guild["icon"],
+                )
+                for guild in guilds.values()
+            ],
+            update_conflicts=True,
+            unique_fields=["owner", "server_id"],
+            update_fields=["name", "icon", "updated"],
+        )
+
+
 class Server(models.Model):
     """Model representing a discord server instance."""
 
@@ -469,10 +815,18 @@ class Server(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = ServerQuerySet.as_manager()
+
     class Meta:
         """Metadata options for the Server model."""
 
         ordering = ["-created"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["owner", "server_id"],
+                name="server_unique_owner_server_id",
+            ),
+        ]
         verbose_name = _("discord server")
         verbose_name_plural = _("discord servers")
 
@@ -540,6 +894,13 @@ class Subscriber(models.Model):
         """Metadata options for the Subscriber model."""
 
         ordering = ["-created"]
+        # Seeks the pages of the subscribers of a serverowner, newest first
+        indexes = [
+            models.Index(
+                fields=["subscribed_via", "-created", "-id"],
+                name="subscriber_via_created",
+            ),
+        ]
         verbose_name = _("subscriber")
         verbose_name_plural = _("subscribers")
 
@@ -597,6 +958,253 @@ class Subscriber(models.Model):
         return self.stripesubscription_subscriptions.all()
 
 
+def invitee_subscription_exists(model, statuses, exclude=()):
+    """Check whether the invitee of an outer query has a subscription in a status.
+
+    Args:
+        model (type): The StripeSubscription or CoinSubscription model.
+        statuses (list): The subscription statuses to look for.
+        exclude (list): The IDs of subscriptions to leave out.
+
+    Returns:
+        Exists: An expression correlated on the invitee's ``subscriber``.
+    """
+    return Exists(
+        model.objects.filter(
+            subscriber=OuterRef("subscriber"),
+            status__in=statuses,
+        ).exclude(pk__in=exclude),
+    )
+
+
+def subscriber_invitees(subscriber_ids):
+    """Select the invitations of subscribers.
+
+    Args:
+        subscriber_ids (list): The IDs of the subscribers.
+
+    Returns:
+        QuerySet: The AffiliateInvitee objects linked to the subscribers.
+    """
+    return AffiliateInvitee.objects.filter(subscriber__in=subscriber_ids)
+
+
+class AffiliateQuerySet(models.QuerySet):
+    """QuerySet of affiliates with set-based statistics."""
+
+    # Sort keys of the leaderboard and the statistic each one ranks by
+    LEADERBOARD_ORDERINGS = {
+        "invites": "invite_count",
+        "active": "active_count",
+        "conversion": "conversion_rate",
+        "pending": "pending_commissions",
+        "paid": "total_commissions_paid",
+        "newest": "created",
+    }
+
+    def with_stats(self):
+        """Annotate the conversion rate of each affiliate.
+
+        The rate is computed from the invitation counters of the affiliate, and
+        the subscriber and payment detail of each affiliate are joined in, so a
+        page of affiliates renders in one query however many there are.
+
+        Returns:
+            QuerySet: The affiliates annotated with ``conversion_rate``.
+        """
+        return self.select_related("subscriber", "paymentdetail").annotate(
+            conversion_rate=Cast(
+                Case(
+                    When(invite_count=0, then=Value(0.0)),
+                    default=Round(
+                        F("converted_count") * Value(100.0) / F("invite_count"),
+                        2,
+                    ),
+                ),
+                models.FloatField(),
+            ),
+        )
+
+    def record_activations(self, model, subscriptions, new_subscriptions=()):
+        """Count newly activated subscriptions on the counters of the affiliates.
+
+        Must be called once, after the subscriptions were saved as active. An
+        invitee becomes active unless they have another active subscription,
+        and converted with a first payment unless they have another paid
+        subscription, so renewals, reactivations and resubscriptions are not
+        counted twice, nor several subscriptions of an invitee in one batch.
+
+        Args:
+            model (type): The StripeSubscription or CoinSubscription model.
+            subscriptions (list): The subscriptions which were activated.
+            new_subscriptions (list): The subscriptions among them which were
+                paid for the first time.
+
+        Returns:
+            int: The number of affiliates updated.
+        """
+        status = model.SubscriptionStatus
+        activated_ids = [subscription.pk for subscription in subscriptions]
+        new_ids = [subscription.pk for subscription in new_subscriptions]
+        activated = subscriber_invitees(
+            {subscription.subscriber_id for subscription in subscriptions},
+        ).exclude(
+            invitee_subscription_exists(model, [status.ACTIVE], activated_ids),
+        )
+        converted = subscriber_invitees(
+            {subscription.subscriber_id for subscription in new_subscriptions},
+        ).exclude(invitee_subscription_exists(model, model.PAID_STATUSES, new_ids))
+        return self.filter(
+            Q(pk__in=activated.values("affiliate_id"))
+            | Q(pk__in=converted.values("affiliate_id")),
+        ).update(
+            active_count=F("active_count")
+            + aggregate_subquery(
+                activated.filter(affiliate=OuterRef("pk")),
+                Count("pk"),
+            ),
+            converted_count=F("converted_count")
+            + aggregate_subquery(
+                converted.filter(affiliate=OuterRef("pk")),
+                Count("pk"),
+            ),
+        )
+
+    def record_deactivations(self, model, subscriber_ids):
+        """Count subscriptions that stopped being active on the counters of the affiliates.
+
+        Must be called once, after the active subscriptions of the subscribers
+        were saved as canceled or expired. Invitees who still have another
+        active subscription stay active.
+
+        Args:
+            model (type): The StripeSubscription or CoinSubscription model.
+            subscriber_ids (list): The IDs of the subscribers whose subscription
+                was deactivated.
+
+        Returns:
+            int: The number of affiliates updated.
+        """
+        deactivated = subscriber_invitees(subscriber_ids).exclude(
+            invitee_subscription_exists(model, [model.SubscriptionStatus.ACTIVE]),
+        )
+        return self.filter(pk__in=deactivated.values("affiliate_id")).update(
+            active_count=F("active_count")
+            - aggregate_subquery(
+                deactivated.filter(affiliate=OuterRef("pk")),
+                Count("pk"),
+            ),
+        )
+
+    def record_commissions(self, payments):
+        """Add new affiliate payments to the pending commissions of the affiliates.
+
+        The counters of all the affiliates are incremented in a single UPDATE.
+
+        Args:
+            payments (list): The new affiliate payments.
+
+        Returns:
+            int: The number of affiliates updated.
+        """
+        commissions = Counter()
+        coin_commissions = Counter()
+        for payment in payments:
+            commissions[payment.affiliate_id] += payment.amount
+            if payment.coin_amount is not None:
+                coin_commissions[payment.affiliate_id] += payment.coin_amount
+        if not commissions:
+            return 0
+        counters = {
+            "pending_commissions": F("pending_commissions")
+            + case_by_pk(
+                commissions,
+                models.DecimalField(max_digits=9, decimal_places=2),
+            ),
+        }
+        if coin_commissions:
+            counters["pending_coin_commissions"] = F(
+                "pending_coin_commissions",
+            ) + case_by_pk(
+                coin_commissions,
+                models.DecimalField(max_digits=20, decimal_places=8),
+            )
+        return self.filter(pk__in=commissions).update(**counters)
+
+    def rebuild_counters(self):
+        """Recompute the invitation counters from the invitees and their subscriptions.
+
+        Runs one UPDATE for the affiliates of serverowners onboarded with
+        CoinPayments and one for the others.
+
+        Returns:
+            int: The number of affiliates updated.
+        """
+        invitees = AffiliateInvitee.objects.filter(affiliate=OuterRef("pk"))
+        updated = 0
+        for coinpayment_onboarding, model in (
+            (True, CoinSubscription),
+            (False, StripeSubscription),
+        ):
+            active = [model.SubscriptionStatus.ACTIVE]
+            updated += self.filter(
+                serverowner__coinpayment_onboarding=coinpayment_onboarding,
+            ).update(
+                invite_count=aggregate_subquery(invitees, Count("pk")),
+                active_count=aggregate_subquery(
+                    invitees.filter(invitee_subscription_exists(model, active)),
+                    Count("pk"),
+                ),
+                converted_count=aggregate_subquery(
+                    invitees.filter(
+                        invitee_subscription_exists(model, model.PAID_STATUSES),
+                    ),
+                    Count("pk"),
+                ),
+            )
+        return updated
+
+    def leaderboard(self, sort="invites", after=None, before=None):
+        """Rank the affiliates by a statistic, highest first.
+
+        Ties are broken by the affiliate's primary key, which makes the order
+        total so it can be paginated with a keyset: the next page holds the
+        affiliates ranked after the last affiliate of the previous page.
+
+        Args:
+            sort (str): A key of ``LEADERBOARD_ORDERINGS``.
+            after (str, optional): The primary key of the last affiliate of the
+                previous page, to keep the affiliates ranked after it.
+            before (str, optional): The primary key of the first affiliate of
+                the next page, to keep the affiliates ranked before it.
+
+        Returns:
+            QuerySet: The ranked affiliates annotated with their statistics.
+
+        Raises:
+            ValueError: If the sort key is unknown.
+        """
+        try:
+            field = self.LEADERBOARD_ORDERINGS[sort]
+        except KeyError:
+            msg = f"Unknown leaderboard sort key: {sort!r}"
+            raise ValueError(msg) from None
+
+        ranked = self.with_stats()
+        affiliates = ranked.order_by(f"-{field}", "-pk")
+        if after is not None:
+            anchor = Subquery(ranked.filter(pk=after).values(field)[:1])
+            affiliates = affiliates.filter(
+                Q(**{f"{field}__lt": anchor}) | Q(**{field: anchor, "pk__lt": after}),
+            )
+        if before is not None:
+            anchor = Subquery(ranked.filter(pk=before).values(field)[:1])
+            affiliates = affiliates.filter(
+                Q(**{f"{field}__gt": anchor}) | Q(**{field: anchor, "pk__gt": before}),
+            )
+        return affiliates
+
+
 class Affiliate(models.Model):
     """Model representing affiliates."""
 
@@ -666,9 +1274,26 @@ class Affiliate(models.Model):
         default=0,
         help_text=_("Pending coin commissions to be paid to the affiliate."),
     )
+    invite_count = models.PositiveIntegerField(
+        _("invite count"),
+        default=0,
+        help_text=_("The number of users invited by the affiliate."),
+    )
+    active_count = models.PositiveIntegerField(
+        _("active count"),
+        default=0,
+        help_text=_("The number of invitees with an active subscription."),
+    )
+    converted_count = models.PositiveIntegerField(
+        _("converted count"),
+        default=0,
+        help_text=_("The number of invitees who paid for a subscription."),
+    )
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = AffiliateQuerySet.as_manager()
+
     class Meta:
         """Metadata options for the Affiliate model."""
 
@@ -688,7 +1313,7 @@ class Affiliate(models.Model):
         Returns:
             int: The total count of affiliate invitees.
         """
-        return self.affiliateinvitee_set.all().count()
+        return self.invite_count
 
     def get_active_subscription_count(self):
         """Get the count of invitees with active subscriptions.
@@ -696,58 +1321,16 @@ class Affiliate(models.Model):
         Returns:
             int: The count of invitees with active subscriptions.
         """
-        if self.serverowner.coinpayment_onboarding:
-            invitees_with_active_coin_subscriptions = self.affiliateinvitee_set.filter(
-                invitee_discord_id__in=Subscriber.objects.filter(
-                    coinsubscription_subscriptions__status=CoinSubscription.SubscriptionStatus.ACTIVE,
-                ).values("discord_id"),
-            )
-            return invitees_with_active_coin_subscriptions.count()
-        invitees_with_active_stripe_subscriptions = self.affiliateinvitee_set.filter(
-            invitee_discord_id__in=Subscriber.objects.filter(
-                stripesubscription_subscriptions__status=StripeSubscription.SubscriptionStatus.ACTIVE,
-            ).values("discord_id"),
-        )
-        return invitees_with_active_stripe_subscriptions.count()
+        return self.active_count
 
     def calculate_conversion_rate(self):
         """Calculate the conversion rate of the affiliate.
 
         Returns:
-            float: The conversion rate of the affiliate.
+            float: The percentage of invitees who paid for a subscription.
         """
-        invitees_count = self.affiliateinvitee_set.count()
-        if self.serverowner.coinpayment_onboarding:
-            successful_invitees_count = self.affiliateinvitee_set.filter(
-                invitee_discord_id__in=Subscriber.objects.filter(
-                    Q(
-                        coinsubscription_subscriptions__status=CoinSubscription.SubscriptionStatus.ACTIVE,
-                    )
-                    | Q(
-                        coinsubscription_subscriptions__status=CoinSubscription.SubscriptionStatus.CANCELED,
-                    )
-                    | Q(
-                        coinsubscription_subscriptions__status=CoinSubscription.SubscriptionStatus.EXPIRED,
-                    ),
-                ).values("discord_id"),
-            ).count()
-        else:
-            successful_invitees_count = self.affiliateinvitee_set.filter(
-                invitee_discord_id__in=Subscriber.objects.filter(
-                    Q(
-                        stripesubscription_subscriptions__status=StripeSubscription.SubscriptionStatus.ACTIVE,
-                    )
-                    | Q(
-                        stripesubscription_subscriptions__status=StripeSubscription.SubscriptionStatus.CANCELED,
-                    )
-                    | Q(
-                        stripesubscription_subscriptions__status=StripeSubscription.SubscriptionStatus.EXPIRED,
-                    ),
-                ).values("discord_id"),
-            ).count()
-
-        if invitees_count > 0:
-            conversion_rate = (successful_invitees_count / invitees_count) * 100
+        if self.invite_count > 0:
+            conversion_rate = (self.converted_count / self.invite_count) * 100
         else:
             conversion_rate = 0
 
@@ -767,7 +1350,7 @@ class Affiliate(models.Model):
         Returns:
             QuerySet: The queryset of affiliate invitees associated with this affiliate.
         """
-        return self.affiliateinvitee_set.all()
+        return self.affiliateinvitee_set.with_details()
 
     def get_latest_invitees(self, limit=3):
         """Get the latest invitee of this affiliate.
@@ -786,6 +1369,112 @@ class Affiliate(models.Model):
         return self.get_affiliate_payments().filter(paid=True)[:limit]
 
 
+@dataclass
+class AffiliateCommission:
+    """Commission owed to an affiliate for a payment made by their invitee.
+
+    Returned by ``AffiliateInvitee.get_commission``, so that the payment record and
+    the pending commission counters are all updated from one computation.
+
+    Attributes:
+        affiliate_invitee (AffiliateInvitee): The invitee, with its affiliate and
+            serverowner loaded.
+        amount (Decimal): The dollar commission.
+        coin_amount (Decimal or None): The coin commission, None unless the
+            serverowner accepts payments with CoinPayments.
+    """
+
+    affiliate_invitee: "AffiliateInvitee"
+    amount: Decimal
+    coin_amount: Decimal | None = None
+
+    @property
+    def affiliate(self):
+        """Affiliate: The affiliate earning the commission."""
+        return self.affiliate_invitee.affiliate
+
+    def get_payment(self, serverowner_id):
+        """Build the affiliate payment of the commission, without saving it.
+
+        The payments of many commissions are created with one ``bulk_create``
+        and added to the pending commissions with
+        ``AffiliateQuerySet.record_commissions`` and
+        ``ServerOwnerQuerySet.record_earnings``.
+
+        Args:
+            serverowner_id (UUID): The ID of the serverowner who owes the commission.
+
+        Returns:
+            AffiliatePayment: The unsaved affiliate payment.
+        """
+        return AffiliatePayment(
+            serverowner_id=serverowner_id,
+            affiliate_id=self.affiliate_invitee.affiliate_id,
+            subscriber_id=self.affiliate_invitee.subscriber_id,
+            amount=self.amount,
+            coin_amount=self.coin_amount,
+        )
+
+
+def latest_subscription_subquery(model, field):
+    """Select a field of the latest subscription of the invitee of an outer query.
+
+    Args:
+        model (type): The StripeSubscription or CoinSubscription model.
+        field (str): The field to select, e.g. ``plan__amount``.
+
+    Returns:
+        Subquery: A scalar subquery correlated on the invitee's ``subscriber``.
+    """
+    return Subquery(
+        model.objects.filter(subscriber=OuterRef("subscriber"))
+        .order_by("-created")
+        .values(field)[:1],
+    )
+
+
+class AffiliateInviteeQuerySet(models.QuerySet):
+    """QuerySet of affiliate invitees."""
+
+    def with_details(self):
+        """Join in the subscriber of each invitee and annotate the commission paid.
+
+        A page of invitee cards renders in one query however many invitees it
+        holds.
+
+        Returns:
+            QuerySet: The invitees annotated with ``paid_commission``, the total
+                commission paid to the affiliate for the invitee.
+        """
+        return self.select_related("subscriber").annotate(
+            paid_commission=aggregate_subquery(
+                AffiliatePayment.objects.filter(
+                    affiliate=OuterRef("affiliate"),
+                    subscriber=OuterRef("subscriber"),
+                    paid=True,
+                ),
+                Sum("amount"),
+                models.DecimalField(max_digits=9, decimal_places=2),
+            ),
+        )
+
+    def link_subscriber(self, subscriber):
+        """Link the invitation matching the Discord ID of a subscriber to it.
+
+        Args:
+            subscriber (Subscriber): The subscriber who signed up.
+
+        Returns:
+            int: The number of invitations linked.
+        """
+        if not subscriber.discord_id:
+            return 0
+        return self.filter(
+            invitee_discord_id=subscriber.discord_id,
+            subscriber__isnull=True,
+        ).update(subscriber=subscriber)
+
+
 class AffiliateInvitee(models.Model):
     """Model representing Affiliate invitee."""
 
@@ -801,9 +1490,19 @@ class AffiliateInvitee(models.Model):
         unique=True,
         help_text=_("Discord ID of the Invitee."),
     )
+    subscriber = models.OneToOneField(
+        "Subscriber",
+        on_delete=models.SET_NULL,
+        blank=True,
+        null=True,
+        verbose_name=_("subscriber"),
+        help_text=_("The subscriber the invitee signed up as."),
+    )
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
+    objects = AffiliateInviteeQuerySet.as_manager()
+
     class Meta:
         """Metadata options for the AffiliateInvitee model."""
 
@@ -821,34 +1520,99 @@ class AffiliateInvitee(models.Model):
         Returns:
             str: The username of the invitee, or the discord id if username not found.
         """
-        subscriber = Subscriber.objects.filter(
-            discord_id=self.invitee_discord_id,
-        ).first()
-        if subscriber:
-            return subscriber.username
+        if self.subscriber and self.subscriber.username:
+            return self.subscriber.username
         return self.invitee_discord_id
 
+    @classmethod
+    def get_commission(cls, subscriber_id):
+        """Get the commission owed for the latest subscription of an invitee.
+
+        Args:
+            subscriber_id (UUID): The ID of the subscriber.
+
+        Returns:
+            AffiliateCommission or None: The commission, or None if the subscriber
+                was not invited by an affiliate.
+        """
+        return cls.get_commissions([subscriber_id]).get(subscriber_id)
+
+    @classmethod
+    def get_commissions(cls, subscriber_ids):
+        """Get the commissions owed for the latest subscriptions of many invitees.
+
+        The invitees, their affiliates and serverowners, and the plan and coin
+        amounts of each invitee's latest subscription are fetched in a single
+        query.
+
+        Args:
+            subscriber_ids (list): The IDs of the subscribers.
+
+        Returns:
+            dict: The AffiliateCommission of each subscriber invited by an
+                affiliate, keyed by subscriber ID.
+        """
+        invitees = (
+            cls.objects.select_related("affiliate__serverowner")
+            .annotate(
+                latest_stripe_plan_amount=latest_subscription_subquery(
+                    StripeSubscription,
+                    "plan__amount",
+                ),
+                latest_coin_plan_amount=latest_subscription_subquery(
+                    CoinSubscription,
+                    "plan__amount",
+                ),
+                latest_coin_amount=latest_subscription_subquery(
+                    CoinSubscription,
+                    "coin_amount",
+                ),
+            )
+            .filter(subscriber_id__in=subscriber_ids)
+        )
+        return {
+            invitee.subscriber_id: invitee._commission()  # noqa: SLF001
+            for invitee in invitees
+        }
+
+    def _commission(self):
+        """Compute the commission from the annotations of ``get_commissions``."""
+        serverowner = self.affiliate.serverowner
+        if serverowner.coinpayment_onboarding:
+            plan_amount = self.latest_coin_plan_amount
+            coin_amount = self.latest_coin_amount
+            return AffiliateCommission(
+                affiliate_invitee=self,
+                amount=(
+                    serverowner.calculate_affiliate_commission(plan_amount)
+                    if plan_amount is not None
+                    else Decimal(0)
+                ),
+                coin_amount=(
+                    serverowner.calculate_affiliate_commission(coin_amount)
+                    if coin_amount is not None
+                    else Decimal(0)
+                ),
+            )
+        plan_amount = self.latest_stripe_plan_amount
+        return AffiliateCommission(
+            affiliate_invitee=self,
+            amount=(
+                serverowner.calculate_affiliate_commission(plan_amount)
+                if plan_amount is not None
+                else Decimal(0)
+            ),
+        )
+
     def get_affiliate_commission_payment(self):
         """Get the affiliate commission payment received for this Invitee.
 
         Returns:
             Decimal: The affiliate commission payment received.
         """
-        subscriber = Subscriber.objects.filter(
-            discord_id=self.invitee_discord_id,
-        ).first()
-        if subscriber:
-            subscription_model = (
-                subscriber.coinsubscription_subscriptions
-                if self.affiliate.serverowner.coinpayment_onboarding
-                else subscriber.stripesubscription_subscriptions
-            )
-            latest_subscription = subscription_model.order_by("-created").first()
-            if latest_subscription:
-                subscription_amount = latest_subscription.plan.amount
-                serverowner = self.affiliate.serverowner
-                return serverowner.calculate_affiliate_commission(subscription_amount)
-        return Decimal(0)
+        if self.subscriber_id is None:
+            return Decimal(0)
+        return self.get_commission(self.subscriber_id).amount
 
     def get_affiliate_coin_commission_payment(self):
         """Calculate the affiliate's coin commission payment.
@@ -856,18 +1620,9 @@ class AffiliateInvitee(models.Model):
         Returns:
             int: The commission amount in coins, or 0 if conditions are not met.
         """
-        subscriber = Subscriber.objects.filter(
-            discord_id=self.invitee_discord_id,
-        ).first()
-        if subscriber and self.affiliate.serverowner.coinpayment_onboarding:
-            subscription = subscriber.coinsubscription_subscriptions.order_by(
-                "-created",
-            ).first()
-            if subscription:
-                subscription_amount = subscription.coin_amount
-                serverowner = self.affiliate.serverowner
-                return serverowner.calculate_affiliate_commission(subscription_amount)
-        return 0
+        if self.subscriber_id is None:
+            return 0
+        return self.get_commission(self.subscriber_id).coin_amount or 0
 
     def calculate_affiliate_payment_commission(self):
         """Calculate the total affiliate payment commission received for this AffiliateInvitee.
@@ -875,9 +1630,11 @@ class AffiliateInvitee(models.Model):
         Returns:
             Decimal: The total affiliate payment commission received.
         """
+        if self.subscriber_id is None:
+            return Decimal(0)
         affiliate_payments = AffiliatePayment.objects.filter(
-            affiliate=self.affiliate,
-            subscriber__discord_id=self.invitee_discord_id,
+            affiliate_id=self.affiliate_id,
+            subscriber_id=self.subscriber_id,
             paid=True,
         )
         total_commission = affiliate_payments.aggregate(
@@ -942,6 +1699,29 @@ class AffiliatePayment(models.Model):
         """Metadata options for the AffiliatePayment model."""
 
         ordering = ["-created"]
+        # Partial indexes split on the paid flag, which is filtered as a bare
+        # boolean column that a composite index cannot seek on
+        indexes = [
+            models.Index(
+                fields=["serverowner", "-created"],
+                condition=Q(paid=False),
+                name="affiliatepayment_owner_pending",
+            ),
+            models.Index(
+                fields=["serverowner", "-created", "-id"],
+                condition=Q(paid=True),
+                name="affiliatepayment_owner_paid",
+            ),
+            models.Index(
+                fields=["affiliate", "-created", "-id"],
+                name="affiliatepayment_aff_created",
+            ),
+            models.Index(
+                fields=["affiliate", "subscriber"],
+                condition=Q(paid=True),
+                name="affiliatepayment_aff_sub_paid",
+            ),
+        ]
         verbose_name = _("affiliate payment")
         verbose_name_plural = _("affiliate payments")
 
@@ -950,6 +1730,109 @@ class AffiliatePayment(models.Model):
         return f"#{self.id}"
 
 
+class PlanQuerySet(models.QuerySet):
+    """QuerySet of plans with a maintained count of active subscriptions."""
+
+    def record_activations(self, plan_ids):
+        """Count newly activated subscriptions on the plans they subscribe to.
+
+        Args:
+            plan_ids (list): The plan ID of each activated subscription, repeated
+                for plans with several activations.
+
+        Returns:
+            int: The number of plans updated.
+        """
+        return self._shift_active_subscriber_count(plan_ids, 1)
+
+    def record_deactivations(self, plan_ids):
+        """Uncount subscriptions that stopped being active from their plans.
+
+        Args:
+            plan_ids (list): The plan ID of each canceled or expired subscription,
+                repeated for plans with several deactivations.
+
+        Returns:
+            int: The number of plans updated.
+        """
+        return self._shift_active_subscriber_count(plan_ids, -1)
+
+    def record_payments(self, earnings, new_subscriptions=(), activations=()):
+        """Credit payments and count new and activated subscriptions on the plans.
+
+        All the counters of the plans are updated in a single UPDATE.
+
+        Args:
+            earnings (dict): The dollar earnings keyed by plan ID.
+            new_subscriptions (list): The plan ID of each first payment of a
+                subscription, repeated for plans with several.
+            activations (list): The plan ID of each newly activated
+                subscription, repeated for plans with several.
+
+        Returns:
+            int: The number of plans updated.
+        """
+        new_subscriptions = Counter(new_subscriptions)
+        activations = Counter(activations)
+        counters = {}
+        if earnings:
+            counters["subscription_earnings"] = F("subscription_earnings") + case_by_pk(
+                earnings,
+                models.DecimalField(max_digits=9, decimal_places=2),
+            )
+        if new_subscriptions:
+            counters["subscriber_count"] = F("subscriber_count") + case_by_pk(
+                new_subscriptions,
+                models.IntegerField(),
+            )
+        if activations:
+            counters["active_subscriber_count"] = F(
+                "active_subscriber_count",
+            ) + case_by_pk(activations, models.IntegerField())
+        if not counters:
+            return 0
+        return self.filter(
+            pk__in={*earnings, *new_subscriptions, *activations},
+        ).update(**counters)
+
+    def _shift_active_subscriber_count(self, plan_ids, sign):
+        """Add a signed number of subscriptions to each plan in a single UPDATE.
+
+        The count does not drop below zero should it have drifted; the drift is
+        corrected by ``rebuild_active_subscriber_counts``.
+        """
+        counts = Counter(plan_ids)
+        if not counts:
+            return 0
+        return self.filter(pk__in=counts).update(
+            active_subscriber_count=Greatest(
+                F("active_subscriber_count")
+                + case_by_pk(
+                    {plan_id: sign * count for plan_id, count in counts.items()},
+                    models.IntegerField(),
+                ),
+                Value(0),
+            ),
+        )
+
+    def rebuild_active_subscriber_counts(self):
+        """Recompute the active subscriptions of the plans from the subscriptions.
+
+        Returns:
+            int: The number of plans updated.
+        """
+        subscription_model = self.model.get_subscription_model()
+        return self.update(
+            active_subscriber_count=aggregate_subquery(
+                subscription_model.active_subscriptions.filter(
+                    plan=OuterRef("pk"),
+                    subscribed_via=OuterRef("serverowner"),
+                ),
+                Count("pk"),
+            ),
+        )
+
+
 class BasePlan(models.Model):
     """Base Model for Subscription plans."""
 
@@ -1006,6 +1889,11 @@ class BasePlan(models.Model):
         default=0,
         help_text=_("The number of subscribers to this plan."),
     )
+    active_subscriber_count = models.PositiveIntegerField(
+        _("active subscriber count"),
+        default=0,
+        help_text=_("The number of active subscriptions to this plan."),
+    )
     status = models.CharField(
         _("status"),
         max_length=1,
@@ -1028,13 +1916,19 @@ class BasePlan(models.Model):
     created = models.DateTimeField(auto_now_add=True)
     updated = models.DateTimeField(auto_now=True)
 
-    objects = models.Manager()
+    objects = PlanQuerySet.as_manager()
     active_plans = ActivePlanManager()
 
     class Meta:
         """Metadata options for the BasePlan model."""
 
         abstract = True
+        indexes = [
+            models.Index(
+                fields=["serverowner", "status", "subscriber_count"],
+                name="%(class)s_popular",
+            ),
+        ]
 
     def __str__(self) -> str:
         """Return a string representation of the plan."""
@@ -1059,13 +1953,22 @@ class StripePlan(BasePlan):
         help_text=_("The price ID associated with the plan."),
     )
 
-    class Meta:
+    class Meta(BasePlan.Meta):
         """Metadata options for the StripePlan model."""
 
         ordering = ["-created"]
         verbose_name = _("stripe plan")
         verbose_name_plural = _("stripe plans")
 
+    @classmethod
+    def get_subscription_model(cls):
+        """Get the model of the subscriptions to Stripe plans.
+
+        Returns:
+            type: The StripeSubscription model.
+        """
+        return StripeSubscription
+
     def get_plan_subscribers(self):
         """Get all subscribers for this plan, filtered by the server owner.
 
@@ -1083,11 +1986,7 @@ class StripePlan(BasePlan):
         Returns:
             int: The count of active subscriptions.
         """
-        subscribers = self.get_plan_subscribers()
-        active_subscriptions = subscribers.filter(
-            status=StripeSubscription.SubscriptionStatus.ACTIVE,
-        )
-        return active_subscriptions.count()
+        return self.active_subscriber_count
 
     def total_subscriptions_count(self):
         """Count the total number of subscriptions for this plan.
@@ -1102,13 +2001,22 @@ class StripePlan(BasePlan):
 class CoinPlan(BasePlan):
     """Model representing Coinpayment plans."""
 
-    class Meta:
+    class Meta(BasePlan.Meta):
         """Metadata options for the CoinPlan model."""
 
         ordering = ["-created"]
         verbose_name = _("coin plan")
         verbose_name_plural = _("coin plans")
 
+    @classmethod
+    def get_subscription_model(cls):
+        """Get the model of the subscriptions to coin plans.
+
+        Returns:
+            type: The CoinSubscription model.
+        """
+        return CoinSubscription
+
     def get_plan_subscribers(self):
         """Get all subscribers for this plan, filtered by the server owner.
 
@@ -1126,11 +2034,7 @@ class CoinPlan(BasePlan):
         Returns:
             int: The count of active subscriptions.
         """
-        subscribers = self.get_plan_subscribers()
-        active_subscriptions = subscribers.filter(
-            status=CoinSubscription.SubscriptionStatus.ACTIVE,
-        )
-        return active_subscriptions.count()
+        return self.active_subscriber_count
 
     def total_subscriptions_count(self):
         """Count the total number of subscriptions for this plan.
@@ -1153,6 +2057,13 @@ class BaseSubscription(models.Model):
         EXPIRED = "E", _("Expired")
         CANCELED = "C", _("Canceled")
 
+    # Statuses of subscriptions that were paid for at least once
+    PAID_STATUSES = (
+        SubscriptionStatus.ACTIVE,
+        SubscriptionStatus.CANCELED,
+        SubscriptionStatus.EXPIRED,
+    )
+
     subscriber = models.ForeignKey(
         "Subscriber",
         on_delete=models.CASCADE,
@@ -1210,6 +2121,31 @@ class BaseSubscription(models.Model):
         abstract = True
         ordering = ["-created"]
         get_latest_by = ["-created"]
+        # Composite indexes of the hot filters; (status, expiration_date) also
+        # serves filters on the status alone, and those ending in (created, id)
+        # seek the pages of the paginated lists. The partial index of pending
+        # subscriptions uses the raw status as SubscriptionStatus is not in
+        # scope here.
+        indexes = [
+            models.Index(
+                fields=["subscriber", "status"],
+                name="%(class)s_sub_status",
+            ),
+            models.Index(
+                fields=["subscribed_via", "status"],
+                name="%(class)s_via_status",
+            ),
+            models.Index(
+                fields=["status", "expiration_date"],
+                name="%(class)s_status_exp",
+            ),
+            models.Index(
+                fields=["subscribed_via", "created"],
+                condition=Q(status="P"),
+                name="%(class)s_pending",
+            ),
+            models.Index(fields=["subscription_id"], name="%(class)s_sub_id"),
+        ]
 
     def __str__(self) -> str:
         """Return a string representation of the subscription."""
@@ -1238,6 +2174,14 @@ class StripeSubscription(BaseSubscription):
     class Meta(BaseSubscription.Meta):
         """Metadata options for the Subscription model."""
 
+        indexes = [
+            *BaseSubscription.Meta.indexes,
+            models.Index(
+                fields=["plan", "subscribed_via", "-created", "-id"],
+                name="%(class)s_plan_via",
+            ),
+            models.Index(fields=["session_id"], name="%(class)s_session"),
+        ]
         verbose_name = _("stripe subscription")
         verbose_name_plural = _("stripe subscriptions")
 
@@ -1284,6 +2228,13 @@ class CoinSubscription(BaseSubscription):
     class Meta(BaseSubscription.Meta):
         """Metadata options for the CoinSubscription model."""
 
+        indexes = [
+            *BaseSubscription.Meta.indexes,
+            models.Index(
+                fields=["plan", "subscribed_via", "-created", "-id"],
+                name="%(class)s_plan_via",
+            ),
+        ]
         verbose_name = _("coin subscription")
         verbose_name_plural = _("coin subscriptions")
 
@@ -1367,3 +2318,337 @@ class AccessCode(models.Model):
     def __str__(self) -> str:
         """Return a string representation of the access code."""
         return self.code
+
+
+class StripeEvent(models.Model):
+    """Model representing a verified Stripe webhook event in the inbox.
+
+    The webhook endpoint only stores events; the ``process_stripe_events`` task
+    applies them in batches.
+    """
+
+    class EventStatus(models.TextChoices):
+        """Choices for the processing status of the event."""
+
+        PENDING = "P", _("Pending")
+        PROCESSED = "D", _("Processed")
+        FAILED = "F", _("Failed")
+
+    event_id = models.CharField(
+        _("event id"),
+        max_length=255,
+        unique=True,
+        help_text=_("The Stripe ID of the event."),
+    )
+    type = models.CharField(
+        _("type"),
+        max_length=100,
+        help_text=_("The Stripe event type, e.g. invoice.paid."),
+    )
+    payload = models.JSONField(
+        _("payload"),
+        help_text=_("The verified event as sent by Stripe."),
+    )
+    status = models.CharField(
+        _("status"),
+        max_length=1,
+        choices=EventStatus.choices,
+        default=EventStatus.PENDING,
+        help_text=_("The processing status of the event."),
+    )
+    attempts = models.PositiveSmallIntegerField(
+        _("attempts"),
+        default=0,
+        help_text=_("The number of failed processing attempts."),
+    )
+    error = models.TextField(
+        _("error"),
+        blank=True,
+        default="",
+        help_text=_("The error of the last failed processing attempt."),
+    )
+    processed_at = models.DateTimeField(
+        _("processed at"),
+        blank=True,
+        null=True,
+        help_text=_("The date and time the event was processed."),
+    )
+    created = models.DateTimeField(auto_now_add=True)
+    updated = models.DateTimeField(auto_now=True)
+
+    objects = models.Manager()
+    pending_events = PendingEventManager()
+
+    class Meta:
+        """Metadata options for the StripeEvent model."""
+
+        ordering = ["-created"]
+        verbose_name = _("stripe event")
+        verbose_name_plural = _("stripe events")
+        indexes = [
+            models.Index(fields=["status", "id"], name="stripeevent_status_id_idx"),
+        ]
+
+    def __str__(self) -> str:
+        """Return a string representation of the event."""
+        return self.event_id
+
+
+class DailyRevenueRollupQuerySet(models.QuerySet):
+    """QuerySet of daily revenue rollups, updated in place as subscriptions change."""
+
+    # Counters of a rollup, incremented by ``record``
+    COUNTERS = (
+        "new_subscriptions",
+        "renewals",
+        "churned_subscriptions",
+        "gross_amount",
+        "coin_amount",
+    )
+
+    def record(self, increments):
+        """Add to the counters of daily rollups, creating the missing rollups.
+
+        The missing rollups are inserted with one ``INSERT`` ignoring those that
+        exist, and the counters of all the rollups incremented with one UPDATE,
+        so concurrent transactions add up instead of overwriting each other.
+
+        Args:
+            increments (dict): The increments of each counter, keyed by the
+                ``(serverowner_id, plan_id, day, provider)`` of the rollup.
+
+        Returns:
+            int: The number of rollups updated.
+        """
+        if not increments:
+            return 0
+        keys = {
+            key: Q(serverowner_id=key[0], plan_id=key[1], day=key[2], provider=key[3])
+            for key in increments
+        }
+        self.bulk_create(
+            [
+                self.model(
+                    serverowner_id=serverowner_id,
+                    plan_id=plan_id,
+                    day=day,
+                    provider=provider,
+                )
+                for serverowner_id, plan_id, day, provider in increments
+            ],
+            ignore_conflicts=True,
+        )
+        counters = {}
+        for name in self.COUNTERS:
+            whens = [
+                When(keys[key], then=Value(counts[name]))
+                for key, counts in increments.items()
+                if counts.get(name)
+            ]
+            if whens:
+                counters[name] = F(name) + Case(
+                    *whens,
+                    default=Value(0),
+                    output_field=self.model._meta.get_field(name),  # noqa: SLF001
+                )
+        if not counters:
+            return 0
+        return self.filter(reduce(or_, keys.values())).update(**counters)
+
+    def rebuild(self, before):
+        """Recompute the rollups of the days before a date from the subscriptions.
+
+        The subscriptions only keep their first payment, so the new
+        subscriptions, their amounts and the churned subscriptions are
+        recomputed, but renewals cannot be: the rollups of the days before
+        ``before`` are replaced, and the rollups recorded as subscriptions
+        changed from that day on are left untouched. Churn is dated by the
+        expiration date, or by the last change of a subscription canceled
+        before it, which a later save of the canceled subscription moves.
+
+        Args:
+            before (date): The first day which is not recomputed.
+
+        Returns:
+            int: The number of rollups created.
+        """
+        increments = defaultdict(Counter)
+        for model in (StripeSubscription, CoinSubscription):
+            provider = self.model.get_provider(model)
+            paid = model.objects.filter(status__in=model.PAID_STATUSES)
+            new_rows = (
+                paid.filter(subscription_date__date__lt=before)
+                .annotate(day=TruncDate("subscription_date"))
+                .values("subscribed_via", "plan", "day")
+                .annotate(
+                    count=Count("pk"),
+                    gross_amount=Sum("plan__amount"),
+                    coin_amount=(
+                        Sum("coin_amount")
+                        if model is CoinSubscription
+                        else Value(None, models.DecimalField())
+                    ),
+                )
+                .order_by()
+            )
+            for row in new_rows:
+                counts = increments[
+                    row["subscribed_via"],
+                    row["plan"],
+                    row["day"],
+                    provider,
+                ]
+                counts["new_subscriptions"] += row["count"]
+                counts["gross_amount"] += row["gross_amount"] or 0
+                counts["coin_amount"] += row["coin_amount"] or 0
+            # Churned on its expiration date, or when canceled before it, like
+            # ``deactivate_subscriptions`` records it
+            churned_rows = (
+                paid.exclude(status=model.SubscriptionStatus.ACTIVE)
+                .annotate(
+                    day=TruncDate(
+                        Least(Coalesce("expiration_date", "updated"), "updated"),
+                    ),
+                )
+                .filter(day__lt=before)
+                .values("subscribed_via", "plan", "day")
+                .annotate(count=Count("pk"))
+                .order_by()
+            )
+            for row in churned_rows:
+                increments[row["subscribed_via"], row["plan"], row["day"], provider][
+                    "churned_subscriptions"
+                ] += row["count"]
+
+        self.filter(day__lt=before).delete()
+        return len(
+            self.bulk_create(
+                (
+                    self.model(
+                        serverowner_id=serverowner_id,
+                        plan_id=plan_id,
+                        day=day,
+                        provider=provider,
+                        **counts,
+                    )
+                    for (serverowner_id, plan_id, day, provider), counts in (
+                        increments.items()
+                    )
+                ),
+                batch_size=1000,
+            ),
+        )
+
+    def daily_totals(self):
+        """Sum the rollups of all plans and providers per day.
+
+        Returns:
+            QuerySet: Dicts of the counters of each day, oldest first.
+        """
+        return (
+            self.values("day")
+            .annotate(**{name: Sum(name) for name in self.COUNTERS})
+            .order_by("day")
+        )
+
+
+class DailyRevenueRollup(models.Model):
+    """Model representing the revenue of a plan on a day.
+
+    The rollups are updated as subscriptions are activated, renewed and
+    deactivated, so revenue charts read a row per plan and day instead of
+    aggregating the subscriptions.
+    """
+
+    class Provider(models.TextChoices):
+        """Choices for the payment provider."""
+
+        STRIPE = "S", _("Stripe")
+        COIN = "C", _("CoinPayments")
+
+    serverowner = models.ForeignKey(
+        "ServerOwner",
+        on_delete=models.CASCADE,
+        verbose_name=_("serverowner"),
+        help_text=_("The serverowner who earned the revenue."),
+    )
+    plan_id = models.UUIDField(
+        _("plan id"),
+        help_text=_("The ID of the StripePlan or CoinPlan, depending on the provider."),
+    )
+    day = models.DateField(
+        _("day"),
+        help_text=_("The day of the revenue."),
+    )
+    provider = models.CharField(
+        _("provider"),
+        max_length=1,
+        choices=Provider.choices,
+        help_text=_("The payment provider of the plan."),
+    )
+    new_subscriptions = models.PositiveIntegerField(
+        _("new subscriptions"),
+        default=0,
+        help_text=_("The number of first payments of subscriptions."),
+    )
+    renewals = models.PositiveIntegerField(
+        _("renewals"),
+        default=0,
+        help_text=_("The number of payments renewing a subscription."),
+    )
+    churned_subscriptions = models.PositiveIntegerField(
+        _("churned subscriptions"),
+        default=0,
+        help_text=_("The number of subscriptions canceled or expired."),
+    )
+    gross_amount = models.DecimalField(
+        _("gross amount"),
+        max_digits=12,
+        decimal_places=2,
+        default=0,
+        help_text=_("The dollar amount of the payments."),
+    )
+    coin_amount = models.DecimalField(
+        _("coin amount"),
+        max_digits=20,
+        decimal_places=8,
+        default=0,
+        help_text=_("The coin amount of the payments."),
+    )
+
+    objects = DailyRevenueRollupQuerySet.as_manager()
+
+    class Meta:
+        """Metadata options for the DailyRevenueRollup model."""
+
+        ordering = ["-day"]
+        verbose_name = _("daily revenue rollup")
+        verbose_name_plural = _("daily revenue rollups")
+        constraints = [
+            models.UniqueConstraint(
+                fields=["serverowner", "plan_id", "day", "provider"],
+                name="dailyrevenuerollup_unique_day",
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["serverowner", "day"],
+                name="dailyrevenuerollup_owner_day",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        """Return a string representation of the rollup."""
+        return f"{self.serverowner_id} {self.plan_id} {self.day}"
+
+    @classmethod
+    def get_provider(cls, model):
+        """Get the payment provider of a subscription model.
+
+        Args:
+            model (type): The StripeSubscription or CoinSubscription model.
+
+        Returns:
+            str: The provider of the subscriptions.
+        """
+        return cls.Provider.COIN if model is CoinSubscription else cls.Provider.STRIPE
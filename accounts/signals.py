@@ -1,9 +1,23 @@
-"""Signal receiver function for handling user profile creation upon User model save."""
+"""Signal receiver functions for user profiles, caches and denormalized counters."""
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save, pre_save
 from django.dispatch import receiver
 
-from .models import ServerOwner, Subscriber, User
+from .context_processors import invalidate_choice_server
+from .counts import invalidate_counts
+from .models import (
+    Affiliate,
+    AffiliateInvitee,
+    AffiliatePayment,
+    CoinPlan,
+    CoinSubscription,
+    Server,
+    ServerOwner,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
 
 
 @receiver(post_save, sender=User)
@@ -29,3 +43,116 @@ def create_user_profile(sender, instance, created, **kwargs):
         elif instance.is_subscriber and not hasattr(instance, "subscriber"):
             # Create a Subscriber profile for subscribers
             Subscriber.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Server)
+@receiver(post_delete, sender=Server)
+def clear_choice_server_cache(sender, instance, **kwargs):
+    """Clear the cached choice server of the owner of a saved or deleted server.
+
+    Args:
+        sender (class): The sender class of the signal (Server).
+        instance (Server): The Server instance that was saved or deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    if Server.owner.is_cached(instance):
+        user_id = instance.owner.user_id
+    else:
+        user_id = (
+            ServerOwner.objects.filter(pk=instance.owner_id)
+            .values_list("user_id", flat=True)
+            .first()
+        )
+    if user_id is not None:
+        invalidate_choice_server(user_id)
+
+
+@receiver(post_save, sender=Subscriber)
+@receiver(post_delete, sender=Subscriber)
+@receiver(post_save, sender=StripeSubscription)
+@receiver(post_delete, sender=StripeSubscription)
+@receiver(post_save, sender=CoinSubscription)
+@receiver(post_delete, sender=CoinSubscription)
+def clear_subscriber_counts(sender, instance, **kwargs):
+    """Clear the cached counts of the serverowner of a saved or deleted subscriber.
+
+    Args:
+        sender (class): The sender class of the signal (Subscriber or a
+            subscription model).
+        instance (Model): The subscriber or subscription saved or deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    if instance.subscribed_via_id is not None:
+        invalidate_counts(instance.subscribed_via_id)
+
+
+@receiver(post_save, sender=StripePlan)
+@receiver(post_delete, sender=StripePlan)
+@receiver(post_save, sender=CoinPlan)
+@receiver(post_delete, sender=CoinPlan)
+@receiver(post_save, sender=Affiliate)
+@receiver(post_delete, sender=Affiliate)
+@receiver(post_save, sender=AffiliatePayment)
+@receiver(post_delete, sender=AffiliatePayment)
+def clear_serverowner_counts(sender, instance, **kwargs):
+    """Clear the cached counts of the serverowner of a saved or deleted record.
+
+    Args:
+        sender (class): The sender class of the signal (a plan model,
+            Affiliate or AffiliatePayment).
+        instance (Model): The plan, affiliate or payment saved or deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    invalidate_counts(instance.serverowner_id)
+
+
+@receiver(post_save, sender=AffiliateInvitee)
+@receiver(post_delete, sender=AffiliateInvitee)
+def update_affiliate_counters(sender, instance, **kwargs):
+    """Recompute the counters of the affiliate of a new or deleted invitee.
+
+    The invitee may already have subscriptions, so the counters of the affiliate
+    are rebuilt instead of only counting the invitation.
+
+    Args:
+        sender (class): The sender class of the signal (AffiliateInvitee).
+        instance (AffiliateInvitee): The invitee that was saved or deleted.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    # Deletions carry no created flag; updates of an invitee change no counter
+    if kwargs.get("created", True):
+        Affiliate.objects.filter(pk=instance.affiliate_id).rebuild_counters()
+
+
+@receiver(pre_save, sender=AffiliateInvitee)
+def link_invitee_subscriber(sender, instance, **kwargs):
+    """Link a new invitee to the subscriber who already signed up with its Discord ID.
+
+    Args:
+        sender (class): The sender class of the signal (AffiliateInvitee).
+        instance (AffiliateInvitee): The invitee about to be saved.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    if instance.subscriber_id is None:
+        instance.subscriber = Subscriber.objects.filter(
+            discord_id=instance.invitee_discord_id,
+        ).first()
+
+
+@receiver(post_save, sender=Subscriber)
+def link_subscriber_invitation(sender, instance, created, update_fields, **kwargs):
+    """Link the invitation of a subscriber once their Discord ID is known.
+
+    Saves of other fields, given by ``update_fields``, are skipped without a
+    query.
+
+    Args:
+        sender (class): The sender class of the signal (Subscriber).
+        instance (Subscriber): The Subscriber instance that was saved.
+        created (bool): Whether the Subscriber instance was newly created.
+        update_fields (frozenset): The fields saved, or None for all of them.
+        **kwargs: Additional keyword arguments passed to the function.
+    """
+    if not created and update_fields is not None and "discord_id" not in update_fields:
+        return
+    AffiliateInvitee.objects.link_subscriber(instance)
@@ -0,0 +1,215 @@
+"""State transitions of subscriptions and the counters they keep up to date.
+
+A subscription is activated or renewed by a payment, and deactivated when it is
+canceled or expires. ``activate_subscriptions`` and ``deactivate_subscriptions``
+apply a batch of transitions in one transaction, updating the subscriptions, the
+counters of their plans, serverowners and affiliates, and the daily revenue
+rollups with a fixed number of statements however many subscriptions the batch
+holds. The cached counts of the serverowners are invalidated once it commits.
+"""
+
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+from django.db import transaction
+from django.utils import timezone
+
+from .counts import invalidate_counts
+from .models import (
+    Affiliate,
+    AffiliateInvitee,
+    AffiliatePayment,
+    BaseSubscription,
+    DailyRevenueRollup,
+    ServerOwner,
+)
+from .utils import update_returning
+
+
+@dataclass
+class SubscriptionPayment:
+    """A payment for a period of a subscription.
+
+    Attributes:
+        subscription (BaseSubscription): The subscription paid for, with its plan
+            loaded.
+        expiration_date (datetime): The end of the period paid for.
+        paid_at (datetime): When the payment was made, which becomes the
+            subscription date of a first payment.
+    """
+
+    subscription: BaseSubscription
+    expiration_date: datetime
+    paid_at: datetime
+
+
+def activate_subscriptions(model, payments):
+    """Apply payments to their subscriptions and credit the payees.
+
+    Every payment activates its subscription until the end of the period paid
+    for, credits the plan amount to the plan and serverowner, and the commission
+    to the affiliate who invited the subscriber. The subscriber count of a plan
+    only counts first payments, and the active counters only subscriptions which
+    were not active. A payment which does not extend an active subscription was
+    already applied, e.g. by both the checkout success page and the
+    ``invoice.paid`` event, and is skipped. The subscriptions are locked and
+    read again before they are checked, so the instances of the payments may
+    be stale and a payment applied concurrently is still credited once.
+
+    Args:
+        model (type): The StripeSubscription or CoinSubscription model.
+        payments (list): The SubscriptionPayment of each payment, in the order
+            they were made.
+
+    Returns:
+        list: The payments which were applied.
+    """
+    status = model.SubscriptionStatus
+    provider = DailyRevenueRollup.get_provider(model)
+    now = timezone.now()
+    subscriptions = {}
+    new_subscriptions = []
+    activations = []
+    plan_earnings = Counter()
+    serverowner_earnings = Counter()
+    revenue = defaultdict(Counter)
+    applied = []
+    with transaction.atomic(savepoint=False):
+        # Lock the subscriptions and read their current state, so a payment
+        # applied concurrently, e.g. by both the checkout success page and the
+        # invoice.paid event, is seen and skipped here
+        current = {
+            subscription.pk: subscription
+            for subscription in model.objects.select_for_update()
+            .filter(pk__in={payment.subscription.pk for payment in payments})
+            .order_by("pk")
+            .only("status", "subscription_date", "expiration_date")
+        }
+        for payment in payments:
+            subscription = payment.subscription
+            locked = current.get(subscription.pk)
+            if locked is None:
+                # The subscription was deleted, e.g. after its first payment failed
+                continue
+            subscription.status = locked.status
+            subscription.subscription_date = locked.subscription_date
+            subscription.expiration_date = locked.expiration_date
+            if (
+                subscription.status == status.ACTIVE
+                and subscription.expiration_date is not None
+                and subscription.expiration_date >= payment.expiration_date
+            ):
+                continue
+            plan = subscription.plan
+            counts = revenue[
+                subscription.subscribed_via_id,
+                plan.pk,
+                timezone.localdate(payment.paid_at),
+                provider,
+            ]
+            if subscription.status == status.PENDING:
+                new_subscriptions.append(subscription)
+                counts["new_subscriptions"] += 1
+            else:
+                counts["renewals"] += 1
+            if subscription.status != status.ACTIVE:
+                activations.append(subscription)
+            counts["gross_amount"] += plan.amount
+            counts["coin_amount"] += getattr(subscription, "coin_amount", None) or 0
+            plan_earnings[plan.pk] += plan.amount
+            serverowner_earnings[subscription.subscribed_via_id] += plan.amount
+
+            subscription.status = status.ACTIVE
+            subscription.subscription_date = subscription.subscription_date or (
+                payment.paid_at
+            )
+            subscription.expiration_date = payment.expiration_date
+            subscription.updated = now
+            subscriptions[subscription.pk] = current[subscription.pk] = subscription
+            applied.append(payment)
+        if not applied:
+            return applied
+
+        model.objects.bulk_update(
+            subscriptions.values(),
+            ["status", "subscription_date", "expiration_date", "updated"],
+        )
+        if activations:
+            Affiliate.objects.record_activations(model, activations, new_subscriptions)
+
+        # Credit the affiliates who invited the subscribers, if any
+        commissions = AffiliateInvitee.get_commissions(
+            {payment.subscription.subscriber_id for payment in applied},
+        )
+        affiliate_payments = AffiliatePayment.objects.bulk_create(
+            commissions[payment.subscription.subscriber_id].get_payment(
+                payment.subscription.subscribed_via_id,
+            )
+            for payment in applied
+            if payment.subscription.subscriber_id in commissions
+        )
+        Affiliate.objects.record_commissions(affiliate_payments)
+
+        model.plan.field.related_model.objects.record_payments(
+            plan_earnings,
+            [subscription.plan_id for subscription in new_subscriptions],
+            [subscription.plan_id for subscription in activations],
+        )
+        ServerOwner.objects.record_earnings(serverowner_earnings, affiliate_payments)
+        DailyRevenueRollup.objects.record(revenue)
+        for serverowner_id in serverowner_earnings:
+            invalidate_counts(serverowner_id)
+    return applied
+
+
+def deactivate_subscriptions(queryset, status, **values):
+    """Cancel or expire the active subscriptions of a queryset.
+
+    The subscriptions are updated with a single ``UPDATE ... RETURNING``, then
+    the active counters of the affiliates and plans and the churn of the daily
+    revenue rollups with a statement or two each. A subscription churns on its
+    expiration date, or on the day it is canceled before it.
+
+    Args:
+        queryset (QuerySet): The subscriptions to deactivate, those which are
+            not active are left untouched.
+        status (str): The ``CANCELED`` or ``EXPIRED`` status.
+        **values: Other fields to update, e.g. ``expiration_date``.
+
+    Returns:
+        list: The subscriber ID and plan ID of each deactivated subscription.
+    """
+    model = queryset.model
+    values = {"status": status, "updated": timezone.now(), **values}
+    with transaction.atomic(savepoint=False):
+        rows = update_returning(
+            queryset.filter(status=model.SubscriptionStatus.ACTIVE),
+            values,
+            ["subscriber", "plan", "subscribed_via", "expiration_date"],
+        )
+        if rows:
+            Affiliate.objects.record_deactivations(
+                model,
+                [subscriber_id for subscriber_id, _, _, _ in rows],
+            )
+            model.plan.field.related_model.objects.record_deactivations(
+                [plan_id for _, plan_id, _, _ in rows],
+            )
+            updated = values["updated"]
+            provider = DailyRevenueRollup.get_provider(model)
+            churn = Counter(
+                (
+                    serverowner_id,
+                    plan_id,
+                    timezone.localdate(min(expiration_date or updated, updated)),
+                    provider,
+                )
+                for _, plan_id, serverowner_id, expiration_date in rows
+            )
+            DailyRevenueRollup.objects.record(
+                {key: {"churned_subscriptions": count} for key, count in churn.items()},
+            )
+            for serverowner_id in {serverowner_id for _, _, serverowner_id, _ in rows}:
+                invalidate_counts(serverowner_id)
+    return [(subscriber_id, plan_id) for subscriber_id, plan_id, _, _ in rows]
@@ -1,171 +1,463 @@
 """Background tasks."""
 
 import logging
+import time
+from collections import defaultdict, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from datetime import date, timedelta
 
 import requests
 from celery import shared_task
 from dateutil.relativedelta import relativedelta
 from django.conf import settings
 from django.core.exceptions import ObjectDoesNotExist
-from django.core.mail import EmailMultiAlternatives
-from django.db import transaction
-from django.db.models import F
+from django.core.mail import EmailMultiAlternatives, get_connection
+from django.db import connections, transaction
 from django.template.loader import render_to_string
 from django.utils import timezone
 
-from .models import AffiliateInvitee, AffiliatePayment, CoinSubscription
-from .utils import create_hmac_signature
+from .clients import coinpayments_request
+from .models import (
+    CoinPlan,
+    CoinSubscription,
+    DailyRevenueRollup,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+)
+from .subscriptions import (
+    SubscriptionPayment,
+    activate_subscriptions,
+    deactivate_subscriptions,
+)
+from .utils import RateLimiter
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of transaction IDs accepted by the get_tx_info_multi command
+COINPAYMENTS_TX_INFO_BATCH_SIZE = 25
+
+# Number of subscription expired emails sent per task over one connection
+EXPIRY_EMAIL_BATCH_SIZE = 100
+# Time given to Stripe to renew a subscription before it is marked as expired
+STRIPE_RENEWAL_GRACE_PERIOD = timedelta(days=1)
+
 
 @shared_task(name="check_coin_transaction_status")
 def check_coin_transaction_status():
     """Periodic task to check the status of coin transactions for pending coin subscriptions.
 
+    Pending subscriptions are grouped by the serverowner they were subscribed via,
+    since each serverowner signs requests with their own API keys, and the status
+    of up to ``COINPAYMENTS_TX_INFO_BATCH_SIZE`` transactions is fetched per request.
+    The requests of all serverowners run concurrently, see
+    ``check_coin_transactions_concurrently``.
+
+    Returns:
+        dict: The polling metrics of each serverowner, keyed by serverowner ID.
+
     Raises:
         Exception: If an unexpected error occurs during the processing of coin transactions.
     """
     try:
-        pending_subscriptions = CoinSubscription.pending_subscriptions.all()
+        pending_subscriptions = (
+            CoinSubscription.pending_subscriptions.select_related(
+                "subscribed_via",
+                "subscriber",
+                "plan",
+            )
+            .exclude(subscription_id="")
+            .order_by("subscribed_via", "created")
+        )
 
+        subscriptions_by_serverowner = defaultdict(list)
         for coin_subscription in pending_subscriptions:
-            try:
-                endpoint = "https://www.coinpayments.net/api.php"
-                data = (
-                    f"version=1&cmd=get_tx_info&txid={coin_subscription.subscription_id}"
-                    f"&key={coin_subscription.subscribed_via.coinpayment_api_public_key}&format=json"
+            subscriptions_by_serverowner[coin_subscription.subscribed_via_id].append(
+                coin_subscription,
+            )
+
+        return check_coin_transactions_concurrently(subscriptions_by_serverowner)
+
+    except Exception:
+        logger.exception("An unexpected error occurred")
+        return {}
+
+
+def check_coin_transactions_concurrently(subscriptions_by_serverowner):
+    """Check the transaction status of pending subscriptions of many serverowners.
+
+    The CoinPayments requests run on a pool of ``COINPAYMENTS_POLL_WORKERS``
+    threads. Each serverowner has at most ``COINPAYMENTS_OWNER_CONCURRENCY``
+    requests in flight, spaced out to ``COINPAYMENTS_OWNER_RATE_LIMIT`` requests
+    per second, so one serverowner with many transactions or a slow response
+    cannot hold up the others. The responses are processed on the calling thread
+    as soon as they arrive, keeping all database access on a single connection.
+
+    Args:
+        subscriptions_by_serverowner (dict): Lists of pending CoinSubscription
+            objects keyed by the ID of the serverowner they were subscribed via.
+
+    Returns:
+        dict: The polling metrics of each serverowner, keyed by serverowner ID.
+    """
+    started = time.monotonic()
+    queued_batches = {}
+    rate_limiters = {}
+    metrics = {}
+    for serverowner_id, coin_subscriptions in subscriptions_by_serverowner.items():
+        queued_batches[serverowner_id] = deque(
+            coin_subscriptions[start : start + COINPAYMENTS_TX_INFO_BATCH_SIZE]
+            for start in range(
+                0,
+                len(coin_subscriptions),
+                COINPAYMENTS_TX_INFO_BATCH_SIZE,
+            )
+        )
+        rate_limiters[serverowner_id] = RateLimiter(
+            settings.COINPAYMENTS_OWNER_RATE_LIMIT,
+        )
+        metrics[serverowner_id] = {
+            "subscriptions": len(coin_subscriptions),
+            "requests": 0,
+            "failed_requests": 0,
+            "activated": 0,
+            "deleted": 0,
+            "request_time": 0.0,
+            "elapsed": 0.0,
+        }
+
+    with ThreadPoolExecutor(
+        max_workers=settings.COINPAYMENTS_POLL_WORKERS,
+        thread_name_prefix="coinpayments",
+    ) as executor:
+        in_flight = {}
+
+        def submit_next_batch(serverowner_id):
+            batch = queued_batches[serverowner_id].popleft()
+            future = executor.submit(
+                fetch_coin_transactions_batch,
+                batch[0].subscribed_via,
+                [coin_subscription.subscription_id for coin_subscription in batch],
+                rate_limiters[serverowner_id],
+            )
+            in_flight[future] = (serverowner_id, batch)
+
+        for serverowner_id, batches in queued_batches.items():
+            for _ in range(min(settings.COINPAYMENTS_OWNER_CONCURRENCY, len(batches))):
+                submit_next_batch(serverowner_id)
+
+        while in_flight:
+            done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+            for future in done:
+                serverowner_id, batch = in_flight.pop(future)
+                if queued_batches[serverowner_id]:
+                    submit_next_batch(serverowner_id)
+                process_coin_transactions_batch(
+                    batch,
+                    future,
+                    metrics[serverowner_id],
                 )
-                headers = {
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "HMAC": create_hmac_signature(
-                        data,
-                        coin_subscription.subscribed_via.coinpayment_api_secret_key,
-                    ),
-                }
-                response = requests.post(endpoint, data=data, headers=headers)
-                result = response.json().get("result")
-
-                if isinstance(result, dict):
-                    status = result.get("status")
-                    if (
-                        status == 100
-                        and coin_subscription.status
-                        == CoinSubscription.SubscriptionStatus.PENDING
-                    ):
-                        with transaction.atomic():
-                            coin_subscription.status = (
-                                CoinSubscription.SubscriptionStatus.ACTIVE
-                            )
-                            coin_subscription.subscription_date = timezone.now()
-                            interval_count = coin_subscription.plan.interval_count
-                            coin_subscription.expiration_date = (
-                                timezone.now() + relativedelta(months=interval_count)
-                            )
-                            coin_subscription.save()
-
-                            subscriber = coin_subscription.subscriber
-
-                            try:
-                                affiliate_invitee = AffiliateInvitee.objects.get(
-                                    invitee_discord_id=subscriber.discord_id,
-                                )
-                                AffiliatePayment.objects.create(
-                                    serverowner=subscriber.subscribed_via,
-                                    affiliate=affiliate_invitee.affiliate,
-                                    subscriber=subscriber,
-                                    amount=affiliate_invitee.get_affiliate_commission_payment(),
-                                    coin_amount=affiliate_invitee.get_affiliate_coin_commission_payment(),
-                                )
-
-                                affiliate_invitee.affiliate.pending_coin_commissions = (
-                                    F("pending_coin_commissions")
-                                    + affiliate_invitee.get_affiliate_coin_commission_payment()
-                                )
-                                affiliate_invitee.affiliate.pending_commissions = (
-                                    F("pending_commissions")
-                                    + affiliate_invitee.get_affiliate_commission_payment()
-                                )
-                                affiliate_invitee.affiliate.save()
-
-                                subscriber.subscribed_via.total_coin_pending_commissions = (
-                                    F("total_coin_pending_commissions")
-                                    + affiliate_invitee.get_affiliate_coin_commission_payment()
-                                )
-                                subscriber.subscribed_via.total_pending_commissions = (
-                                    F("total_pending_commissions")
-                                    + affiliate_invitee.get_affiliate_commission_payment()
-                                )
-                                subscriber.subscribed_via.save()
-
-                            except AffiliateInvitee.DoesNotExist:
-                                affiliate_invitee = None
-
-                            plan = coin_subscription.plan
-                            plan.subscriber_count = F("subscriber_count") + 1
-                            plan.subscription_earnings = (
-                                F("subscription_earnings") + plan.amount
-                            )
-                            plan.save()
-
-                            subscriber.subscribed_via.total_earnings = (
-                                F("total_earnings") + plan.amount
-                            )
-                            subscriber.subscribed_via.save()
-
-                    elif status == -1:
-                        # Transaction failed, Delete the subscription object
-                        coin_subscription.delete()
-                    else:
-                        msg = f"Transaction ID: {coin_subscription.subscription_id}, status: {status}"
-                        logger.warning(msg)
-                else:
-                    logger.warning("Unexpected format for 'result': %s", result)
-            except ObjectDoesNotExist:
-                coin_subscription = None
-            except requests.exceptions.RequestException:
-                logger.exception("CoinPayments API request failed")
-            except (ValueError, KeyError):
-                logger.exception("Failed to parse CoinPayments API response")
-            except Exception:
-                logger.exception("An unexpected error occurred")
+                metrics[serverowner_id]["elapsed"] = time.monotonic() - started
+
+    for serverowner_id, owner_metrics in metrics.items():
+        logger.info(
+            "Checked %(subscriptions)d coin transactions of serverowner %(id)s in "
+            "%(elapsed).3fs (%(requests)d requests, %(failed_requests)d failed, "
+            "%(request_time).3fs waiting for CoinPayments, %(activated)d activated, "
+            "%(deleted)d deleted)",
+            {"id": serverowner_id, **owner_metrics},
+        )
+    return metrics
+
+
+def fetch_coin_transactions_batch(serverowner, txids, rate_limiter):
+    """Fetch a batch of transactions once the serverowner's rate limit allows it.
 
+    Args:
+        serverowner (ServerOwner): The serverowner whose API keys sign the request.
+        txids (list): The transaction IDs, at most ``COINPAYMENTS_TX_INFO_BATCH_SIZE``.
+        rate_limiter (RateLimiter): The request rate limiter of the serverowner.
+
+    Returns:
+        tuple: The transaction information keyed by transaction ID and the
+            number of seconds the request took.
+    """
+    rate_limiter.wait()
+    started = time.monotonic()
+    try:
+        return get_coin_transactions_info(
+            serverowner,
+            txids,
+        ), time.monotonic() - started
+    finally:
+        # Requests do not touch the database, but release any connection Django
+        # may have opened on this worker thread.
+        connections.close_all()
+
+
+def process_coin_transactions_batch(coin_subscriptions, future, metrics):
+    """Apply the outcome of a batch request to its pending coin subscriptions.
+
+    Args:
+        coin_subscriptions (list): The pending CoinSubscription objects of the batch.
+        future (Future): The finished ``fetch_coin_transactions_batch`` call.
+        metrics (dict): The polling metrics of the serverowner, updated in place.
+    """
+    metrics["requests"] += 1
+    try:
+        results, request_time = future.result()
+    except requests.exceptions.RequestException:
+        metrics["failed_requests"] += 1
+        logger.exception("CoinPayments API request failed")
+        return
+    except (ValueError, KeyError):
+        metrics["failed_requests"] += 1
+        logger.exception("Failed to parse CoinPayments API response")
+        return
+    metrics["request_time"] += request_time
+
+    paid_subscriptions = []
+    for coin_subscription in coin_subscriptions:
+        result = results.get(coin_subscription.subscription_id)
+        try:
+            outcome = process_coin_transaction_result(coin_subscription, result)
+        except ObjectDoesNotExist:
+            # The subscription or its plan was deleted meanwhile
+            continue
+        except Exception:
+            logger.exception("An unexpected error occurred")
+        else:
+            if outcome == "activated":
+                paid_subscriptions.append(coin_subscription)
+            elif outcome:
+                metrics[outcome] += 1
+
+    # The paid subscriptions of the batch are activated together
+    try:
+        activate_coin_subscriptions(paid_subscriptions)
     except Exception:
         logger.exception("An unexpected error occurred")
+    else:
+        metrics["activated"] += len(paid_subscriptions)
+
+
+def get_coin_transactions_info(serverowner, txids):
+    """Fetch the information of several CoinPayments transactions in one request.
+
+    Args:
+        serverowner (ServerOwner): The serverowner whose API keys sign the request.
+        txids (list): The transaction IDs, at most ``COINPAYMENTS_TX_INFO_BATCH_SIZE``.
+
+    Returns:
+        dict: The transaction information keyed by transaction ID.
+
+    Raises:
+        RequestException: If the request to CoinPayments fails.
+        ValueError: If the response is not in the expected format.
+    """
+    payload = coinpayments_request(
+        "get_tx_info_multi",
+        serverowner.coinpayment_api_public_key,
+        serverowner.coinpayment_api_secret_key,
+        txid="|".join(txids),
+    )
+    result = payload.get("result")
+    if not isinstance(result, dict):
+        msg = f"Unexpected CoinPayments response: {payload.get('error')}"
+        raise ValueError(msg)  # noqa: TRY004
+    return result
+
+
+def process_coin_transaction_result(coin_subscription, result):
+    """Update a pending coin subscription from its CoinPayments transaction info.
+
+    Args:
+        coin_subscription (CoinSubscription): The pending coin subscription.
+        result (dict): The transaction information returned by CoinPayments.
+
+    Returns:
+        str or None: ``"activated"`` when the subscription was paid and is to be
+            activated by the caller, ``"deleted"`` when it failed and was deleted.
+    """
+    if not isinstance(result, dict) or result.get("error", "ok") != "ok":
+        logger.warning("Unexpected format for 'result': %s", result)
+        return None
+
+    status = result.get("status")
+    if (
+        status == 100
+        and coin_subscription.status == CoinSubscription.SubscriptionStatus.PENDING
+    ):
+        return "activated"
+    if status == -1:
+        # Transaction failed, Delete the subscription object
+        coin_subscription.delete()
+        return "deleted"
+    msg = f"Transaction ID: {coin_subscription.subscription_id}, status: {status}"
+    logger.warning(msg)
+    return None
+
+
+def activate_coin_subscriptions(coin_subscriptions):
+    """Activate paid coin subscriptions and credit the plans, serverowners and affiliates.
+
+    The subscriptions are activated in one transaction, see
+    ``activate_subscriptions``.
+
+    Args:
+        coin_subscriptions (list): The coin subscriptions that were paid, with
+            their plans loaded.
+    """
+    now = timezone.now()
+    activate_subscriptions(
+        CoinSubscription,
+        [
+            SubscriptionPayment(
+                subscription=coin_subscription,
+                expiration_date=now
+                + relativedelta(months=coin_subscription.plan.interval_count),
+                paid_at=now,
+            )
+            for coin_subscription in coin_subscriptions
+        ],
+    )
 
 
 @shared_task(name="check_and_mark_expired_subscriptions")
 def check_and_mark_expired_subscriptions():
-    """Periodic task to check and mark expired coin subscriptions."""
-    now = timezone.now()
-    expired_subscriptions = CoinSubscription.active_subscriptions.filter(
-        expiration_date__lte=now,
+    """Periodic task to mark expired subscriptions and notify their subscribers.
+
+    The subscriptions are expired with one statement per subscription model, see
+    ``expire_subscriptions``, and the emails are sent in batches of
+    ``EXPIRY_EMAIL_BATCH_SIZE`` by ``send_subscription_expired_emails``.
+
+    Returns:
+        int: The number of subscribers notified.
+    """
+    subscriber_ids = sorted(
+        str(subscriber_id) for subscriber_id in expire_subscriptions()
     )
+    for start in range(0, len(subscriber_ids), EXPIRY_EMAIL_BATCH_SIZE):
+        send_subscription_expired_emails.delay(
+            subscriber_ids[start : start + EXPIRY_EMAIL_BATCH_SIZE],
+        )
+    return len(subscriber_ids)
 
-    for subscription in expired_subscriptions:
-        subscription.status = CoinSubscription.SubscriptionStatus.EXPIRED
-        subscription.save()
 
+def expire_subscriptions(now=None):
+    """Mark the active subscriptions past their expiration date as expired.
+
+    Stripe subscriptions get ``STRIPE_RENEWAL_GRACE_PERIOD`` to be renewed, since
+    the ``invoice.paid`` event of a renewal arrives after the period has ended.
+    The active counters of the affiliates who invited the subscribers and of the
+    plans subscribed to are updated in the same transaction.
+
+    Args:
+        now (datetime, optional): The current date and time.
+
+    Returns:
+        set: The IDs of the subscribers whose subscriptions expired.
+    """
+    now = now or timezone.now()
+    subscriber_ids = set()
+    with transaction.atomic():
+        for model, expires_before in (
+            (CoinSubscription, now),
+            (StripeSubscription, now - STRIPE_RENEWAL_GRACE_PERIOD),
+        ):
+            rows = deactivate_subscriptions(
+                model.objects.filter(expiration_date__lte=expires_before),
+                model.SubscriptionStatus.EXPIRED,
+                updated=now,
+            )
+            subscriber_ids.update(subscriber_id for subscriber_id, _ in rows)
+    return subscriber_ids
+
+
+@shared_task(name="reconcile_plan_active_subscriber_counts")
+def reconcile_plan_active_subscriber_counts():
+    """Periodic task to recompute the active subscriber count of every plan.
+
+    The counts are kept up to date as subscriptions are activated, canceled and
+    expired; this corrects any drift, e.g. from subscriptions deleted in the
+    admin.
+
+    Returns:
+        int: The number of plans updated.
+    """
+    with transaction.atomic():
+        return (
+            CoinPlan.objects.rebuild_active_subscriber_counts()
+            + StripePlan.objects.rebuild_active_subscriber_counts()
+        )
+
+
+@shared_task(name="backfill_daily_revenue_rollups")
+def backfill_daily_revenue_rollups(before=None):
+    """Task to compute the daily revenue rollups of the days before they were recorded.
+
+    The rollups are recorded as subscriptions change state from the day this
+    feature is deployed; this fills in the history before it, see
+    ``DailyRevenueRollupQuerySet.rebuild``. Running it again is a no-op unless
+    ``before`` is given.
+
+    Args:
+        before (str, optional): The ISO date of the first day which is not
+            recomputed, by default the earliest day with a rollup, or today.
+
+    Returns:
+        int: The number of rollups created.
+    """
+    if before is None:
+        before = (
+            DailyRevenueRollup.objects.order_by("day")
+            .values_list("day", flat=True)
+            .first()
+        ) or timezone.localdate()
+    else:
+        before = date.fromisoformat(before)
+    with transaction.atomic():
+        return DailyRevenueRollup.objects.rebuild(before)
+
+
+@shared_task(name="send_subscription_expired_emails")
+def send_subscription_expired_emails(subscriber_ids):
+    """Task to email subscribers that their subscription has expired.
+
+    All the emails are sent over a single connection to the mail server.
+
+    Args:
+        subscriber_ids (list): The IDs of the subscribers to notify.
+
+    Returns:
+        int: The number of emails sent.
+    """
+    subject = render_to_string("emails/subscription_expired_subject.txt").strip()
+    from_email = settings.DEFAULT_FROM_EMAIL
+
+    emails = []
+    for subscriber in Subscriber.objects.filter(pk__in=subscriber_ids).exclude(
+        email="",
+    ):
         # Render the email content
-        context = {"subscriber": subscription.subscriber}
-        subject = render_to_string("emails/subscription_expired_subject.txt").strip()
+        context = {"subscriber": subscriber}
         text_content = render_to_string("emails/subscription_expired_body.txt", context)
         html_content = render_to_string(
             "emails/subscription_expired_body.html",
             context,
         )
-
-        # Send the email
-        from_email = settings.DEFAULT_FROM_EMAIL
-        recipient_list = [subscription.subscriber.email]
         email = EmailMultiAlternatives(
             subject,
             text_content,
             from_email,
-            recipient_list,
+            [subscriber.email],
         )
         email.attach_alternative(html_content, "text/html")
-        email.send()
+        emails.append(email)
+
+    if not emails:
+        return 0
+    return get_connection().send_messages(emails)
 
 
 @shared_task
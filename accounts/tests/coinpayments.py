@@ -0,0 +1,216 @@
+"""Local HTTP stand-in for the CoinPayments API.
+
+The stand-in answers the ``get_tx_info`` and ``get_tx_info_multi`` commands so the
+coin transaction polling can be tested and benchmarked without reaching
+coinpayments.net. It can also be run on its own, e.g.::
+
+    python -m accounts.tests.coinpayments --port 8765 --latency 0.2
+
+and ``COINPAYMENTS_API_URL`` pointed at ``http://127.0.0.1:8765/api.php``.
+"""
+
+import argparse
+import hashlib
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+MAX_TXIDS_PER_REQUEST = 25
+
+
+class CoinPaymentsStandIn:
+    """A threaded local server imitating the CoinPayments API.
+
+    Attributes:
+        statuses (dict): Transaction status keyed by transaction ID.
+        default_status (int or None): Status of unknown transactions; unknown
+            transactions are reported as invalid when None.
+        api_keys (dict): Secret keys keyed by public key, used to verify the
+            HMAC signature of each request. Signatures are not checked when empty.
+        latency (float): Seconds to wait before answering each request.
+        commands (list): The ``cmd`` of every request received.
+        max_in_flight (dict): The highest number of concurrent requests seen for
+            each public key.
+        connections (set): The client address of every connection accepted.
+        failures (int): The number of upcoming requests to answer with a
+            ``503 Service Unavailable`` error.
+    """
+
+    def __init__(self, statuses=None, default_status=None, api_keys=None, latency=0):
+        """Initialize the stand-in with the transaction statuses to report."""
+        self.statuses = statuses or {}
+        self.default_status = default_status
+        self.api_keys = api_keys or {}
+        self.latency = latency
+        self.commands = []
+        self.max_in_flight = {}
+        self.connections = set()
+        self.failures = 0
+        self._in_flight = {}
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """str: The API endpoint of the running stand-in."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api.php"
+
+    def start(self, port=0):
+        """Start serving requests in a background thread."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for the background thread."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        """Start the stand-in when used as a context manager."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the stand-in when leaving the context manager."""
+        self.stop()
+
+    def transaction_info(self, txid):
+        """Build the ``get_tx_info`` result of a transaction.
+
+        Args:
+            txid (str): The transaction ID.
+
+        Returns:
+            dict: The transaction information or an error.
+        """
+        status = self.statuses.get(txid, self.default_status)
+        if status is None:
+            return {"error": "Invalid transaction ID"}
+        return {
+            "error": "ok",
+            "time_created": int(time.time()),
+            "status": status,
+            "status_text": "Complete" if status == 100 else "Waiting for buyer funds",
+            "type": "coins",
+            "coin": "LTC",
+            "amount": 100000000,
+            "amountf": "1.00000000",
+        }
+
+    def respond(self, body, signature):
+        """Build the API response to a request body.
+
+        Args:
+            body (str): The url-encoded request body.
+            signature (str): The HMAC header of the request.
+
+        Returns:
+            dict: The JSON response of the API.
+        """
+        params = {key: values[0] for key, values in parse_qs(body).items()}
+        command = params.get("cmd")
+        with self._lock:
+            self.commands.append(command)
+
+        if self.api_keys:
+            secret = self.api_keys.get(params.get("key"), "")
+            expected = hmac.new(
+                bytes(secret, "latin-1"),
+                bytes(body, "latin-1"),
+                hashlib.sha512,
+            ).hexdigest()
+            if not hmac.compare_digest(expected, signature or ""):
+                return {"error": "HMAC signature does not match", "result": []}
+
+        txids = params.get("txid", "")
+        if command == "get_tx_info":
+            info = self.transaction_info(txids)
+            if info["error"] != "ok":
+                return {"error": info["error"], "result": []}
+            return {"error": "ok", "result": info}
+        if command == "get_tx_info_multi":
+            txids = txids.split("|")
+            if len(txids) > MAX_TXIDS_PER_REQUEST:
+                return {"error": "Too many transaction IDs", "result": []}
+            return {
+                "error": "ok",
+                "result": {txid: self.transaction_info(txid) for txid in txids},
+            }
+        return {"error": "Unknown command", "result": []}
+
+    def _handler(self):
+        """Create the request handler class bound to this stand-in."""
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler answering CoinPayments API commands."""
+
+            # Keep connections open between requests like the real API
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                """Answer a CoinPayments API command."""
+                length = int(self.headers.get("Content-Length", 0))
+                body = self.rfile.read(length).decode("latin-1")
+                with standin._lock:
+                    standin.connections.add(self.client_address)
+                    fail = standin.failures > 0
+                    standin.failures -= int(fail)
+                if fail:
+                    self.send_response(503)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                key = parse_qs(body).get("key", [""])[0]
+                with standin._lock:
+                    in_flight = standin._in_flight.get(key, 0) + 1
+                    standin._in_flight[key] = in_flight
+                    standin.max_in_flight[key] = max(
+                        in_flight,
+                        standin.max_in_flight.get(key, 0),
+                    )
+                try:
+                    if standin.latency:
+                        time.sleep(standin.latency)
+                    content = json.dumps(
+                        standin.respond(body, self.headers.get("HMAC")),
+                    ).encode()
+                finally:
+                    with standin._lock:
+                        standin._in_flight[key] -= 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            def log_message(self, format, *args):  # noqa: A002
+                """Silence the default request logging."""
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--status", type=int, default=0)
+    args = parser.parse_args()
+
+    standin = CoinPaymentsStandIn(
+        default_status=args.status,
+        latency=args.latency,
+    ).start(args.port)
+    print(f"CoinPayments stand-in listening on {standin.url}")  # noqa: T201
+    try:
+        standin._thread.join()  # noqa: SLF001
+    except KeyboardInterrupt:
+        standin.stop()
@@ -0,0 +1,243 @@
+"""Local HTTP stand-in for the Discord API.
+
+The stand-in answers the OAuth2 token exchange and the ``/users/@me`` and
+``/users/@me/guilds`` requests of the Discord sign-in, so the OAuth callback can
+be tested and benchmarked without reaching discord.com. Like Discord, it can
+limit each path to a bucket of requests, sending the ``X-RateLimit-*`` headers
+and answering ``429`` with a ``Retry-After`` once the bucket is empty. It can
+also be run on its own, e.g.::
+
+    python -m accounts.tests.discord --port 8766 --latency 0.2 --bucket-size 5
+
+and ``DISCORD_API_URL`` pointed at ``http://127.0.0.1:8766/api``.
+"""
+
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class DiscordStandIn:
+    """A threaded local server imitating the Discord API.
+
+    Attributes:
+        user (dict): The user returned by ``/users/@me``.
+        guilds (list): The guilds returned by ``/users/@me/guilds``.
+        latency (float): Seconds to wait before answering each request.
+        requests (list): The method and path of every request received.
+        max_in_flight (int): The highest number of concurrent requests seen.
+        connections (set): The client address of every connection accepted.
+        bucket_size (int): The requests allowed on each path per
+            ``reset_after`` seconds, or None for no rate limit.
+        reset_after (float): Seconds a rate-limit bucket takes to reset.
+        limited (int): The number of next requests to answer with a ``429``
+            whatever their bucket.
+        retry_after (float): The ``Retry-After`` seconds of a forced ``429``.
+    """
+
+    access_token = "discord-access-token"  # noqa: S105
+
+    def __init__(
+        self,
+        user=None,
+        guilds=None,
+        latency=0,
+        bucket_size=None,
+        reset_after=1.0,
+    ):
+        """Initialize the stand-in with the profile to return."""
+        self.user = user or {
+            "id": "123456789",
+            "username": "Pythonian",
+            "avatar": None,
+            "email": "pythonian@gmail.com",
+        }
+        self.guilds = guilds if guilds is not None else []
+        self.latency = latency
+        self.requests = []
+        self.max_in_flight = 0
+        self.connections = set()
+        self.bucket_size = bucket_size
+        self.reset_after = reset_after
+        self.limited = 0
+        self.retry_after = 1.0
+        self._buckets = {}
+        self._in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+        self._thread = None
+
+    @property
+    def url(self):
+        """str: The API base URL of the running stand-in."""
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/api"
+
+    def start(self, port=0):
+        """Start serving requests in a background thread."""
+        self._server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop the server and wait for the background thread."""
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def __enter__(self):
+        """Start the stand-in when used as a context manager."""
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        """Stop the stand-in when leaving the context manager."""
+        self.stop()
+
+    def respond(self, method, path, authorization):
+        """Build the API response to a request.
+
+        Args:
+            method (str): The HTTP method.
+            path (str): The requested path.
+            authorization (str): The Authorization header of the request.
+
+        Returns:
+            tuple: The status code and the JSON payload of the response.
+        """
+        if method == "POST" and path == "/api/oauth2/token":
+            return 200, {
+                "access_token": self.access_token,
+                "token_type": "Bearer",
+                "expires_in": 604800,
+                "scope": "identify email connections guilds",
+            }
+        if authorization != f"Bearer {self.access_token}":
+            return 401, {"message": "401: Unauthorized", "code": 0}
+        if method == "GET" and path == "/api/users/@me":
+            return 200, self.user
+        if method == "GET" and path == "/api/users/@me/guilds":
+            return 200, self.guilds
+        return 404, {"message": "404: Not Found", "code": 0}
+
+    def rate_limit(self, path):
+        """Take a request from the rate-limit bucket of a path.
+
+        Args:
+            path (str): The requested path.
+
+        Returns:
+            tuple: The ``Retry-After`` seconds if the request is rate limited,
+            else None, and the rate-limit headers of the response.
+        """
+        if self.limited:
+            self.limited -= 1
+            return self.retry_after, {"Retry-After": str(self.retry_after)}
+        if self.bucket_size is None:
+            return None, {}
+
+        now = time.monotonic()
+        remaining, reset_at = self._buckets.get(path, (self.bucket_size, 0))
+        if reset_at <= now:
+            remaining, reset_at = self.bucket_size, now + self.reset_after
+        headers = {
+            "X-RateLimit-Bucket": path.rsplit("/", 1)[-1],
+            "X-RateLimit-Limit": str(self.bucket_size),
+            "X-RateLimit-Reset-After": f"{reset_at - now:.3f}",
+        }
+        if remaining == 0:
+            headers["X-RateLimit-Remaining"] = "0"
+            headers["Retry-After"] = headers["X-RateLimit-Reset-After"]
+            return reset_at - now, headers
+        self._buckets[path] = (remaining - 1, reset_at)
+        headers["X-RateLimit-Remaining"] = str(remaining - 1)
+        return None, headers
+
+    def _handler(self):
+        """Create the request handler class bound to this stand-in."""
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Request handler answering Discord API requests."""
+
+            # Keep connections open between requests like the real API
+            protocol_version = "HTTP/1.1"
+
+            def answer(self):
+                """Answer a Discord API request."""
+                length = int(self.headers.get("Content-Length", 0))
+                self.rfile.read(length)
+                with standin._lock:
+                    standin.connections.add(self.client_address)
+                    standin.requests.append((self.command, self.path))
+                    retry_after, headers = standin.rate_limit(self.path)
+                    standin._in_flight += 1
+                    standin.max_in_flight = max(
+                        standin.max_in_flight,
+                        standin._in_flight,
+                    )
+                try:
+                    if standin.latency:
+                        time.sleep(standin.latency)
+                    if retry_after is None:
+                        status, payload = standin.respond(
+                            self.command,
+                            self.path,
+                            self.headers.get("Authorization"),
+                        )
+                    else:
+                        status, payload = (
+                            429,
+                            {
+                                "message": "You are being rate limited.",
+                                "retry_after": retry_after,
+                                "global": False,
+                            },
+                        )
+                finally:
+                    with standin._lock:
+                        standin._in_flight -= 1
+                content = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                for header, value in headers.items():
+                    self.send_header(header, value)
+                self.send_header("Content-Length", str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_GET = answer  # noqa: N815
+            do_POST = answer  # noqa: N815
+
+            def log_message(self, format, *args):  # noqa: A002
+                """Silence the default request logging."""
+
+        return Handler
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8766)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--guilds", type=int, default=5)
+    parser.add_argument("--bucket-size", type=int, default=None)
+    parser.add_argument("--reset-after", type=float, default=1.0)
+    args = parser.parse_args()
+
+    standin = DiscordStandIn(
+        guilds=[
+            {"id": str(index), "name": f"Guild {index}", "icon": None, "owner": True}
+            for index in range(args.guilds)
+        ],
+        latency=args.latency,
+        bucket_size=args.bucket_size,
+        reset_after=args.reset_after,
+    ).start(args.port)
+    print(f"Discord stand-in listening on {standin.url}")  # noqa: T201
+    try:
+        standin._thread.join()  # noqa: SLF001
+    except KeyboardInterrupt:
+        standin.stop()
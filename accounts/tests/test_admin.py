@@ -1,7 +1,8 @@
 """Test cases for the admin classes."""
 
 from django.contrib.admin.sites import AdminSite
-from django.test import TestCase
+from django.contrib.messages.storage.cookie import CookieStorage
+from django.test import RequestFactory, TestCase
 
 from accounts.admin import (
     AffiliateInviteeInline,
@@ -10,6 +11,7 @@ from accounts.admin import (
     CoinSubscriptionInline,
     PaymentDetailInline,
     ServerInline,
+    StripeEventAdmin,
     StripePlanInline,
     StripeSubscriptionInline,
 )
@@ -20,8 +22,10 @@ from accounts.models import (
     CoinSubscription,
     PaymentDetail,
     Server,
+    StripeEvent,
     StripePlan,
     StripeSubscription,
+    User,
 )
 
 
@@ -247,3 +251,52 @@ class AffiliateInviteeInlineTestCase(TestCase):
 
         # Test has_add_permission method
         self.assertFalse(affiliateinvitee_inline.has_add_permission(None))
+
+
+class StripeEventAdminTestCase(TestCase):
+    """Test case for the StripeEventAdmin class."""
+
+    def test_replay_events(self) -> None:
+        """Test the replay action queues failed events again."""
+        StripeEvent.objects.create(
+            event_id="evt_1",
+            type="invoice.paid",
+            payload={},
+            status=StripeEvent.EventStatus.FAILED,
+            attempts=5,
+            error="DoesNotExist()",
+        )
+        request = RequestFactory().post("/")
+        request.user = User(is_superuser=True)
+        request._messages = CookieStorage(request)  # noqa: SLF001
+
+        StripeEventAdmin(StripeEvent, AdminSite()).replay_events(
+            request,
+            StripeEvent.objects.all(),
+        )
+
+        inbox_event = StripeEvent.objects.get()
+        self.assertEqual(inbox_event.status, StripeEvent.EventStatus.PENDING)
+        self.assertEqual(inbox_event.attempts, 0)
+        self.assertEqual(inbox_event.error, "")
+
+    def test_replay_skips_processed_events(self) -> None:
+        """Test the replay action does not queue processed events again."""
+        StripeEvent.objects.create(
+            event_id="evt_1",
+            type="invoice.paid",
+            payload={},
+            status=StripeEvent.EventStatus.PROCESSED,
+        )
+        request = RequestFactory().post("/")
+        request._messages = CookieStorage(request)  # noqa: SLF001
+
+        StripeEventAdmin(StripeEvent, AdminSite()).replay_events(
+            request,
+            StripeEvent.objects.all(),
+        )
+
+        self.assertEqual(
+            StripeEvent.objects.get().status,
+            StripeEvent.EventStatus.PROCESSED,
+        )
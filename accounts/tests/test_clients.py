@@ -0,0 +1,90 @@
+"""Test cases for the outbound HTTP client."""
+
+from django.test import TestCase, override_settings
+
+from accounts.clients import (
+    OutboundClient,
+    coinpayments_request,
+    outbound,
+)
+
+from .coinpayments import CoinPaymentsStandIn
+
+
+@override_settings(OUTBOUND_HTTP_BACKOFF=0, OUTBOUND_HTTP_RETRIES=2)
+class OutboundClientTestCase(TestCase):
+    """Test case for the pooled outbound HTTP client."""
+
+    def setUp(self) -> None:
+        """Start a CoinPayments stand-in and a fresh client."""
+        self.standin = CoinPaymentsStandIn(default_status=0).start()
+        self.client = OutboundClient()
+        self.data = "version=1&cmd=get_tx_info&txid=tx&key=public&format=json"
+
+    def tearDown(self) -> None:
+        """Close the client and stop the stand-in."""
+        self.client.close()
+        self.standin.stop()
+
+    def test_connections_are_reused(self) -> None:
+        """Test consecutive calls to a host share one keep-alive connection."""
+        for _ in range(5):
+            response = self.client.post(self.standin.url, data=self.data)
+            assert response.json()["error"] == "ok"
+
+        assert len(self.standin.commands) == 5
+        assert len(self.standin.connections) == 1
+
+    def test_latency_metrics(self) -> None:
+        """Test each call is recorded in the metrics of its host and name."""
+        self.client.post(self.standin.url, data=self.data, name="get_tx_info")
+        self.client.post(self.standin.url, data=self.data, name="get_tx_info")
+
+        host = self.standin.url.split("/")[2]
+        metrics = self.client.metrics.snapshot()[(host, "get_tx_info")]
+        assert metrics["calls"] == 2
+        assert metrics["failed"] == 0
+        assert 0 < metrics["max"] <= metrics["total"]
+
+    def test_idempotent_requests_are_retried(self) -> None:
+        """Test idempotent requests are retried after an unavailable upstream."""
+        self.standin.failures = 2
+
+        response = self.client.post(self.standin.url, data=self.data, idempotent=True)
+
+        assert response.status_code == 200
+        host = self.standin.url.split("/")[2]
+        assert self.client.metrics.snapshot()[(host, "/api.php")]["retries"] == 2
+
+    def test_non_idempotent_requests_are_not_retried(self) -> None:
+        """Test POST requests are sent once unless marked idempotent."""
+        self.standin.failures = 1
+
+        response = self.client.post(self.standin.url, data=self.data)
+
+        assert response.status_code == 503
+        assert self.standin.failures == 0
+        assert self.standin.commands == []
+
+    def test_retries_are_bounded(self) -> None:
+        """Test the last response is returned once the retries are used up."""
+        self.standin.failures = 5
+
+        response = self.client.post(self.standin.url, data=self.data, idempotent=True)
+
+        assert response.status_code == 503
+        assert self.standin.failures == 2
+
+    def test_coinpayments_request(self) -> None:
+        """Test CoinPayments commands are signed and sent through the shared client."""
+        self.standin.api_keys = {"public": "secret"}
+        self.standin.statuses = {"tx": 100}
+        self.standin.failures = 1
+
+        with override_settings(COINPAYMENTS_API_URL=self.standin.url):
+            payload = coinpayments_request("get_tx_info", "public", "secret", txid="tx")
+
+        assert payload["result"]["status"] == 100
+        # Reading a transaction is retried, creating one would not be
+        assert self.standin.commands == ["get_tx_info"]
+        assert outbound.metrics.snapshot()
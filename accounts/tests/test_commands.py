@@ -1,11 +1,19 @@
-"""Test case for the custom management command."""
+"""Test cases for the custom management commands."""
 
 from io import StringIO
 
 from django.core.management import call_command
 from django.test import TestCase
 
-from accounts.models import AccessCode
+from accounts.models import (
+    AccessCode,
+    Affiliate,
+    AffiliateInvitee,
+    ServerOwner,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
 
 
 class GenerateAccessCodesTest(TestCase):
@@ -29,3 +37,58 @@ class GenerateAccessCodesTest(TestCase):
             f"Successfully generated {num_codes_to_generate} access codes."
         )
         assert expected_output in out.getvalue()
+
+
+class RebuildAffiliateCountersTest(TestCase):
+    """Test case for the management command to rebuild the affiliate counters."""
+
+    def test_rebuild_affiliate_counters(self) -> None:
+        """Test the invite count of an affiliate is recomputed."""
+        user = User.objects.create(username="Pythonian")
+        serverowner = ServerOwner.objects.create(
+            user=user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        subscriber = Subscriber.objects.create(
+            user=User.objects.create(username="affiliate"),
+            discord_id="200",
+            username="affiliate",
+            email="affiliate@gmail.com",
+            subscribed_via=serverowner,
+        )
+        affiliate = Affiliate.objects.create(
+            subscriber=subscriber,
+            discord_id="200",
+            server_id="555",
+            serverowner=serverowner,
+        )
+        AffiliateInvitee.objects.create(affiliate=affiliate, invitee_discord_id="100")
+        Affiliate.objects.update(invite_count=0)
+
+        out = StringIO()
+        call_command("rebuild_affiliate_counters", stdout=out)
+
+        affiliate.refresh_from_db()
+        assert affiliate.invite_count == 1
+        assert "Successfully rebuilt the counters of 1 affiliates." in out.getvalue()
+
+
+class ExplainSubscriptionIndexesTest(TestCase):
+    """Test case for the management command to benchmark the subscription indexes."""
+
+    def test_explain_subscription_indexes(self) -> None:
+        """Test the queries use the indexes and the seeded rows are rolled back."""
+        out = StringIO()
+        call_command("explain_subscription_indexes", rows=500, stdout=out)
+
+        output = out.getvalue()
+        assert "Active subscriptions of a subscriber" in output
+        assert "stripesubscription_sub_status" in output
+        assert "stripesubscription_status_exp" in output
+        assert "stripesubscription_session" in output
+        assert "Successfully explained 7 queries over 500 subscriptions." in output
+        assert not StripeSubscription.objects.exists()
+        assert not User.objects.exists()
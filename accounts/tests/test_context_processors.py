@@ -0,0 +1,73 @@
+"""Test cases for the context processors."""
+
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase
+
+from accounts.context_processors import choice_server
+from accounts.models import Server, ServerOwner, User
+
+
+class ChoiceServerTestCase(TestCase):
+    """Test case for the cached choice_server context processor."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner with a choice server."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="Pythonian",
+            is_serverowner=True,
+        )
+        self.serverowner = ServerOwner.objects.get(user=self.user)
+        self.server = Server.objects.create(
+            owner=self.serverowner,
+            server_id="1",
+            name="Pythonian Server",
+            choice_server=True,
+        )
+        self.request = RequestFactory().get("/")
+        self.request.user = self.user
+
+    def test_choice_server_is_cached(self) -> None:
+        """Test the choice server is fetched once per serverowner."""
+        with self.assertNumQueries(1):
+            assert choice_server(self.request)["choice_server"] == self.server
+
+        with self.assertNumQueries(0):
+            assert choice_server(self.request)["choice_server"] == self.server
+
+    def test_missing_choice_server_is_cached(self) -> None:
+        """Test a serverowner without a choice server is not queried again."""
+        Server.objects.filter(pk=self.server.pk).update(choice_server=False)
+
+        with self.assertNumQueries(1):
+            assert choice_server(self.request)["choice_server"] is None
+
+        with self.assertNumQueries(0):
+            assert choice_server(self.request)["choice_server"] is None
+
+    def test_subscriber_short_circuits(self) -> None:
+        """Test users who are not serverowners never query for a server."""
+        self.request.user = User.objects.create_user(
+            username="subscriber",
+            is_subscriber=True,
+        )
+
+        with self.assertNumQueries(0):
+            assert choice_server(self.request)["choice_server"] is None
+
+    def test_cache_is_invalidated_on_server_save(self) -> None:
+        """Test a renamed server is seen on the next render."""
+        choice_server(self.request)
+
+        self.server.name = "Renamed Server"
+        self.server.save()
+
+        assert choice_server(self.request)["choice_server"].name == "Renamed Server"
+
+    def test_cache_is_invalidated_on_server_delete(self) -> None:
+        """Test a deleted server is no longer the choice server."""
+        choice_server(self.request)
+
+        self.server.delete()
+
+        assert choice_server(self.request)["choice_server"] is None
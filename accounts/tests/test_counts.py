@@ -0,0 +1,105 @@
+"""Test cases for the count providers."""
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.counts import (
+    CachedCountProvider,
+    EstimatedCountProvider,
+    invalidate_counts,
+)
+from accounts.models import ServerOwner, Subscriber, User
+from accounts.utils import CursorPaginator
+
+
+@override_settings(COUNT_PROVIDER="accounts.counts.CachedCountProvider")
+class CachedCountProviderTestCase(TestCase):
+    """Test case for the counts cached until the records of a serverowner change."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner with two subscribers."""
+        cache.clear()
+        self.serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="Pythonian"),
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        for index in range(2):
+            self.add_subscriber(index)
+
+    def add_subscriber(self, index):
+        """Create a subscriber of the serverowner."""
+        return Subscriber.objects.create(
+            user=User.objects.create(username=f"subscriber{index}"),
+            discord_id=f"10{index}",
+            username=f"subscriber{index}",
+            email=f"subscriber{index}@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+
+    def count(self):
+        """Count the subscribers of the serverowner with the cached provider."""
+        return CachedCountProvider().count(
+            self.serverowner.get_subscribed_users(),
+            self.serverowner.pk,
+            "subscribers",
+        )
+
+    def test_count_is_cached(self) -> None:
+        """Test a count is only queried once."""
+        self.assertEqual(self.count(), 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.count(), 2)
+
+    def test_count_is_invalidated_on_commit(self) -> None:
+        """Test a new subscriber drops the cached counts once committed."""
+        self.count()
+
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            self.add_subscriber(2)
+            # Still cached until the transaction commits
+            self.assertEqual(self.count(), 2)
+
+        self.assertTrue(callbacks)
+        self.assertEqual(self.count(), 3)
+
+    def test_dashboard_metrics_are_cached(self) -> None:
+        """Test the header figures are cached with the counts."""
+        self.assertEqual(self.serverowner.get_dashboard_metrics().total_subscribers, 2)
+
+        with self.assertNumQueries(0):
+            metrics = self.serverowner.get_dashboard_metrics()
+        self.assertEqual(metrics.total_subscribers, 2)
+        self.assertEqual(metrics.inactive_subscribers_count, 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            invalidate_counts(self.serverowner.pk)
+        with self.assertNumQueries(1):
+            self.serverowner.get_dashboard_metrics()
+
+    def test_paginator_count_uses_provider(self) -> None:
+        """Test the pager count of a keyed paginator is cached."""
+        self.count()
+
+        paginator = CursorPaginator(
+            self.serverowner.get_subscribed_users(),
+            1,
+            (self.serverowner.pk, "subscribers"),
+        )
+
+        with self.assertNumQueries(0):
+            self.assertEqual(paginator.num_pages, 2)
+
+
+class EstimatedCountProviderTestCase(TestCase):
+    """Test case for the counts estimated by the query planner."""
+
+    def test_count_is_exact_without_planner_estimates(self) -> None:
+        """Test databases other than PostgreSQL are counted exactly."""
+        User.objects.create(username="Pythonian")
+
+        count = EstimatedCountProvider().count(User.objects.all(), None, "users")
+
+        self.assertEqual(count, 1)
@@ -0,0 +1,129 @@
+"""Test cases for the rate-limit aware Discord client."""
+
+import time
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+
+from accounts.discord import (
+    CacheBuckets,
+    DiscordClient,
+    DiscordRateLimitedError,
+    LocalBuckets,
+    discord_profile_requests,
+)
+
+from .discord import DiscordStandIn
+
+
+class DiscordClientTestCase(TestCase):
+    """Test case for the tracking of the Discord rate-limit buckets."""
+
+    def setUp(self) -> None:
+        """Start a Discord stand-in allowing one request per path at a time."""
+        cache.clear()
+        self.standin = DiscordStandIn(bucket_size=1, reset_after=0.3).start()
+        self.discord_api = override_settings(DISCORD_API_URL=self.standin.url)
+        self.discord_api.enable()
+        self.client = DiscordClient()
+
+    def tearDown(self) -> None:
+        """Stop the stand-in."""
+        self.discord_api.disable()
+        self.standin.stop()
+
+    def get_user(self, client=None):
+        """Request the user of the stand-in."""
+        return (client or self.client).get(
+            "/users/@me",
+            access_token=DiscordStandIn.access_token,
+        )
+
+    def test_empty_bucket_delays_request(self) -> None:
+        """Test a request waits for its empty bucket to reset instead of a 429."""
+        self.get_user()
+        started = time.monotonic()
+        response = self.get_user()
+
+        assert response.status_code == 200
+        assert time.monotonic() - started >= 0.2
+        metrics = self.client.metrics.snapshot()["GET /users/@me"]
+        assert metrics["throttled"] == 1
+        assert metrics["limited"] == 0
+
+    def test_rate_limited_request_is_retried(self) -> None:
+        """Test a 429 is retried after its Retry-After delay."""
+        self.standin.limited = 1
+        self.standin.retry_after = 0.2
+
+        response = self.get_user()
+
+        assert response.status_code == 200
+        assert len(self.standin.requests) == 2
+        metrics = self.client.metrics.snapshot()["GET /users/@me"]
+        assert metrics["limited"] == 1
+        assert metrics["throttled"] == 1
+
+    def test_long_rate_limit_raises(self) -> None:
+        """Test a request is not held longer than the maximum wait."""
+        self.standin.limited = 1
+        self.standin.retry_after = 30
+
+        with self.assertRaises(DiscordRateLimitedError) as context:
+            self.get_user()
+
+        assert context.exception.retry_after > 29
+        assert len(self.standin.requests) == 1
+        metrics = self.client.metrics.snapshot()["GET /users/@me"]
+        assert metrics["rejected"] == 1
+        self.client.metrics.reset()
+        assert self.client.metrics.snapshot() == {}
+
+    def test_cache_buckets_are_shared_between_workers(self) -> None:
+        """Test a client learns the buckets emptied by another through the cache."""
+        self.get_user()
+        worker = DiscordClient()
+        started = time.monotonic()
+        response = self.get_user(worker)
+
+        assert response.status_code == 200
+        assert time.monotonic() - started >= 0.2
+        assert worker.metrics.snapshot()["GET /users/@me"]["throttled"] == 1
+
+    @override_settings(DISCORD_RATE_LIMIT_BUCKETS="accounts.discord.LocalBuckets")
+    def test_local_buckets_are_not_shared(self) -> None:
+        """Test the buckets of a process are only known to its clients."""
+        assert isinstance(self.client.buckets, LocalBuckets)
+        assert not isinstance(self.client.buckets, CacheBuckets)
+        self.get_user()
+        self.client.buckets.update("@me:other", 0, time.time() + 10)
+
+        assert self.client.buckets.reserve("@me:other", time.time()) > 9
+        assert DiscordClient().buckets.reserve("@me:other", time.time()) == 0
+
+
+class DiscordProfileRequestsTestCase(TestCase):
+    """Test case for the concurrent requests of a Discord profile."""
+
+    def setUp(self) -> None:
+        """Start a Discord stand-in answering after a round trip delay."""
+        self.standin = DiscordStandIn(latency=0.2).start()
+
+    def tearDown(self) -> None:
+        """Stop the stand-in."""
+        self.standin.stop()
+
+    def test_profile_requests_run_concurrently(self) -> None:
+        """Test the user and guilds requests take about one round trip."""
+        started = time.monotonic()
+        with override_settings(DISCORD_API_URL=self.standin.url):
+            responses = discord_profile_requests(
+                DiscordStandIn.access_token,
+                ["user", "guilds"],
+            )
+        elapsed = time.monotonic() - started
+
+        assert responses["user"].json()["username"] == "Pythonian"
+        assert responses["guilds"].json() == []
+        assert self.standin.max_in_flight == 2
+        assert elapsed < 0.4
@@ -0,0 +1,90 @@
+"""Test cases for the middleware."""
+
+from django.http import Http404
+from django.test import RequestFactory, TestCase
+
+from accounts.middleware import (
+    ProfileMiddleware,
+    get_serverowner_or_404,
+    get_subscriber_or_404,
+)
+from accounts.models import (
+    Affiliate,
+    PaymentDetail,
+    ServerOwner,
+    Subscriber,
+    User,
+)
+
+
+class ProfileMiddlewareTestCase(TestCase):
+    """Test case for the request-scoped profile loader."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner and an affiliate subscribed to them."""
+        self.owner_user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=self.owner_user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        self.subscriber_user = User.objects.create(username="subscriber")
+        self.subscriber = Subscriber.objects.create(
+            user=self.subscriber_user,
+            discord_id="100",
+            username="subscriber",
+            email="subscriber@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        affiliate = Affiliate.objects.create(
+            subscriber=self.subscriber,
+            discord_id="100",
+            server_id="555",
+            serverowner=self.serverowner,
+        )
+        PaymentDetail.objects.create(affiliate=affiliate, body="IBAN")
+
+    def get_request(self, user):
+        """Return a request of a user processed by the middleware."""
+        request = RequestFactory().get("/")
+        request.user = User.objects.get(pk=user.pk)
+        ProfileMiddleware(lambda request: None)(request)
+        return request
+
+    def test_serverowner_is_loaded_once(self) -> None:
+        """Test the serverowner is fetched once and shared with the user."""
+        request = self.get_request(self.owner_user)
+
+        with self.assertNumQueries(1):
+            serverowner = get_serverowner_or_404(request)
+            self.assertEqual(serverowner, self.serverowner)
+            self.assertIs(request.profile.serverowner, serverowner)
+            self.assertIs(request.user.serverowner, serverowner)
+            self.assertIs(serverowner.user, request.user)
+
+    def test_subscriber_is_loaded_with_relations(self) -> None:
+        """Test the subscriber is fetched with its serverowner and affiliate."""
+        request = self.get_request(self.subscriber_user)
+
+        with self.assertNumQueries(1):
+            subscriber = get_subscriber_or_404(request)
+            self.assertEqual(subscriber.subscribed_via, self.serverowner)
+            self.assertEqual(request.profile.affiliate.paymentdetail.body, "IBAN")
+            self.assertEqual(request.profile.affiliate.serverowner, self.serverowner)
+            self.assertIs(request.user.subscriber, subscriber)
+
+    def test_missing_profile_is_loaded_once(self) -> None:
+        """Test a missing profile is remembered and raises a 404."""
+        request = self.get_request(self.subscriber_user)
+
+        with self.assertNumQueries(1):
+            self.assertRaises(
+                ServerOwner.DoesNotExist,
+                getattr,
+                request.profile,
+                "serverowner",
+            )
+            self.assertRaises(Http404, get_serverowner_or_404, request)
+            self.assertFalse(hasattr(request.user, "serverowner"))
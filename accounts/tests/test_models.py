@@ -0,0 +1,733 @@
+"""Test cases for the model classes."""
+
+from decimal import Decimal
+from unittest import skipUnless
+
+from django.db import IntegrityError, connection
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import (
+    Affiliate,
+    AffiliateCommission,
+    AffiliateInvitee,
+    AffiliatePayment,
+    CoinPlan,
+    CoinSubscription,
+    DashboardMetrics,
+    Server,
+    ServerOwner,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
+
+
+class ServerOwnerDashboardMetricsTestCase(TestCase):
+    """Test case for the ServerOwner dashboard metrics snapshot."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner with plans, subscribers and affiliate payments."""
+        owner_user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=owner_user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_onboarding=True,
+        )
+
+        self.active_plan = StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Active Plan",
+            amount=Decimal("10.00"),
+            description="Active plan",
+            interval_count=1,
+            subscriber_count=2,
+            discord_role_id="1",
+        )
+        StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Inactive Plan",
+            amount=Decimal("20.00"),
+            description="Inactive plan",
+            interval_count=1,
+            status=StripePlan.PlanStatus.INACTIVE,
+            discord_role_id="2",
+        )
+
+        self.subscribers = []
+        for index in range(3):
+            user = User.objects.create(username=f"subscriber{index}")
+            self.subscribers.append(
+                Subscriber.objects.create(
+                    user=user,
+                    discord_id=f"10{index}",
+                    username=f"subscriber{index}",
+                    email=f"subscriber{index}@gmail.com",
+                    subscribed_via=self.serverowner,
+                ),
+            )
+
+        # Two subscriptions for the same subscriber must count them once
+        for subscriber in (
+            self.subscribers[0],
+            self.subscribers[0],
+            self.subscribers[1],
+        ):
+            StripeSubscription.objects.create(
+                subscriber=subscriber,
+                subscribed_via=self.serverowner,
+                plan=self.active_plan,
+                subscription_date=timezone.now(),
+                status=StripeSubscription.SubscriptionStatus.ACTIVE,
+            )
+
+        affiliate = Affiliate.objects.create(
+            subscriber=self.subscribers[2],
+            discord_id=self.subscribers[2].discord_id,
+            server_id="555",
+            serverowner=self.serverowner,
+            total_commissions_paid=Decimal("4.50"),
+            pending_commissions=Decimal("1.00"),
+        )
+        AffiliatePayment.objects.create(
+            serverowner=self.serverowner,
+            affiliate=affiliate,
+            subscriber=self.subscribers[0],
+            amount=Decimal("1.50"),
+            paid=True,
+        )
+        AffiliatePayment.objects.create(
+            serverowner=self.serverowner,
+            affiliate=affiliate,
+            subscriber=self.subscribers[1],
+            amount=Decimal("3.00"),
+            paid=True,
+        )
+        AffiliatePayment.objects.create(
+            serverowner=self.serverowner,
+            affiliate=affiliate,
+            subscriber=self.subscribers[1],
+            amount=Decimal("1.00"),
+        )
+
+    def test_dashboard_metrics_values(self) -> None:
+        """Test the snapshot matches the individual serverowner methods."""
+        metrics = self.serverowner.get_dashboard_metrics()
+
+        assert isinstance(metrics, DashboardMetrics)
+        assert metrics.plan_count == self.serverowner.get_plan_count() == 2
+        assert metrics.active_plans_count == 1
+        assert metrics.inactive_plans_count == 1
+        assert metrics.total_subscribers == self.serverowner.get_total_subscribers()
+        assert metrics.active_subscribers_count == 2
+        assert metrics.inactive_subscribers_count == 1
+        assert metrics.total_affiliates == 1
+        assert metrics.pending_affiliates_count == 1
+        assert metrics.total_payments_to_affiliates == Decimal("4.50")
+        assert metrics.pending_payments_count == 1
+        assert metrics.confirmed_payments_count == 2
+        assert metrics.confirmed_payment_amount == Decimal("4.50")
+
+    def test_dashboard_metrics_single_query(self) -> None:
+        """Test all the dashboard counters are computed in one query."""
+        with self.assertNumQueries(1):
+            self.serverowner.get_dashboard_metrics()
+
+    def test_dashboard_metrics_lists_are_cached(self) -> None:
+        """Test each dashboard card list is fetched once."""
+        metrics = self.serverowner.get_dashboard_metrics()
+
+        with self.assertNumQueries(3):
+            assert metrics.popular_plans == [self.active_plan]
+            assert len(metrics.latest_subscriptions) == 3
+            assert len(metrics.latest_payouts) == 2
+            # Accessing again should not hit the database
+            assert metrics.popular_plans
+            assert metrics.latest_payouts[0].affiliate.subscriber.username
+
+    def test_dashboard_metrics_empty(self) -> None:
+        """Test the snapshot of a serverowner without any data."""
+        user = User.objects.create(username="Newcomer")
+        serverowner = ServerOwner.objects.create(
+            user=user,
+            discord_id="999",
+            username="Newcomer",
+            subdomain="newcomer",
+            email="newcomer@gmail.com",
+        )
+
+        metrics = serverowner.get_dashboard_metrics()
+
+        assert metrics.plan_count == 0
+        assert metrics.total_subscribers == 0
+        assert metrics.inactive_subscribers_count == 0
+        assert metrics.total_payments_to_affiliates == Decimal(0)
+        assert metrics.confirmed_payment_amount == Decimal("0.00")
+
+
+class AffiliateCommissionTestCase(TestCase):
+    """Test case for the affiliate commission computation."""
+
+    def setUp(self) -> None:
+        """Set up an affiliate who invited a subscriber."""
+        owner_user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=owner_user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            affiliate_commission=10,
+        )
+        affiliate_user = User.objects.create(username="affiliate")
+        affiliate_subscriber = Subscriber.objects.create(
+            user=affiliate_user,
+            discord_id="200",
+            username="affiliate",
+            email="affiliate@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        self.affiliate = Affiliate.objects.create(
+            subscriber=affiliate_subscriber,
+            discord_id="200",
+            server_id="555",
+            serverowner=self.serverowner,
+        )
+        AffiliateInvitee.objects.create(
+            affiliate=self.affiliate,
+            invitee_discord_id="100",
+        )
+        invitee_user = User.objects.create(username="invitee")
+        self.invitee = Subscriber.objects.create(
+            user=invitee_user,
+            discord_id="100",
+            username="invitee",
+            email="invitee@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+
+    def test_stripe_commission(self) -> None:
+        """Test the dollar commission of a Stripe subscription in one query."""
+        plan = StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Plan",
+            amount=Decimal("20.00"),
+            description="Test plan",
+            interval_count=1,
+            discord_role_id="1",
+        )
+        StripeSubscription.objects.create(
+            subscriber=self.invitee,
+            subscribed_via=self.serverowner,
+            plan=plan,
+        )
+
+        with self.assertNumQueries(1):
+            commission = AffiliateInvitee.get_commission(self.invitee.pk)
+            assert commission.affiliate == self.affiliate
+
+        assert isinstance(commission, AffiliateCommission)
+        assert commission.amount == Decimal("2.00")
+        assert commission.coin_amount is None
+
+    def test_coin_commission(self) -> None:
+        """Test the dollar and coin commissions of the latest coin subscription."""
+        ServerOwner.objects.filter(pk=self.serverowner.pk).update(
+            coinpayment_onboarding=True,
+        )
+        plan = CoinPlan.objects.create(
+            serverowner=self.serverowner,
+            name="Plan",
+            amount=Decimal("20.00"),
+            description="Test plan",
+            interval_count=1,
+            discord_role_id="1",
+        )
+        CoinSubscription.objects.create(
+            subscriber=self.invitee,
+            subscribed_via=self.serverowner,
+            plan=plan,
+            coin_amount=Decimal("0.5"),
+        )
+
+        commission = AffiliateInvitee.get_commission(self.invitee.pk)
+
+        assert commission.amount == 2
+        assert commission.coin_amount == 0.05
+
+    def test_commission_without_subscription(self) -> None:
+        """Test the commission is zero before the invitee subscribes."""
+        commission = AffiliateInvitee.get_commission(self.invitee.pk)
+
+        assert commission.amount == Decimal(0)
+        assert AffiliateInvitee.objects.get().get_affiliate_commission_payment() == 0
+
+    def test_coin_commission_without_subscription(self) -> None:
+        """Test both coin commission fallbacks are decimal zeros."""
+        ServerOwner.objects.filter(pk=self.serverowner.pk).update(
+            coinpayment_onboarding=True,
+        )
+
+        commission = AffiliateInvitee.get_commission(self.invitee.pk)
+
+        assert commission.amount == Decimal(0)
+        assert isinstance(commission.amount, Decimal)
+        assert commission.coin_amount == Decimal(0)
+        assert isinstance(commission.coin_amount, Decimal)
+
+    def test_commission_without_invitation(self) -> None:
+        """Test subscribers who were not invited owe no commission."""
+        assert AffiliateInvitee.get_commission(self.affiliate.subscriber_id) is None
+
+    def test_record_commissions(self) -> None:
+        """Test recording commissions updates the counters with one query per model."""
+        commission = AffiliateCommission(
+            affiliate_invitee=AffiliateInvitee.objects.get(),
+            amount=Decimal("2.00"),
+            coin_amount=Decimal("0.05"),
+        )
+        payments = AffiliatePayment.objects.bulk_create(
+            [commission.get_payment(self.serverowner.pk) for _ in range(2)],
+        )
+
+        with self.assertNumQueries(2):
+            Affiliate.objects.record_commissions(payments)
+            ServerOwner.objects.record_earnings({}, payments)
+
+        self.affiliate.refresh_from_db()
+        self.serverowner.refresh_from_db()
+        assert payments[0].subscriber == self.invitee
+        assert self.affiliate.pending_commissions == Decimal("4.00")
+        assert self.affiliate.pending_coin_commissions == Decimal("0.10")
+        assert self.serverowner.total_pending_commissions == Decimal("4.00")
+        assert self.serverowner.total_coin_pending_commissions == Decimal("0.10")
+        assert self.serverowner.total_earnings == 0
+
+    def test_invitee_is_linked_to_subscriber(self) -> None:
+        """Test invitees are linked whichever of them or the subscriber comes first."""
+        invitation = AffiliateInvitee.objects.get()
+        assert invitation.subscriber == self.invitee
+
+        subscriber = Subscriber.objects.create(
+            user=User.objects.create(username="member"),
+            discord_id="300",
+            username="member",
+            email="member@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        late_invitation = AffiliateInvitee.objects.create(
+            affiliate=self.affiliate,
+            invitee_discord_id="300",
+        )
+        assert late_invitation.subscriber == subscriber
+
+    def test_invitees_with_details(self) -> None:
+        """Test a page of invitees is rendered from a single query."""
+        AffiliatePayment.objects.create(
+            serverowner=self.serverowner,
+            affiliate=self.affiliate,
+            subscriber=self.invitee,
+            amount=Decimal("2.00"),
+            paid=True,
+        )
+        AffiliatePayment.objects.create(
+            serverowner=self.serverowner,
+            affiliate=self.affiliate,
+            subscriber=self.invitee,
+            amount=Decimal("5.00"),
+        )
+        AffiliateInvitee.objects.create(
+            affiliate=self.affiliate,
+            invitee_discord_id="300",
+        )
+
+        with self.assertNumQueries(1):
+            invitees = list(self.affiliate.get_affiliate_invitees())
+            names = [invitee.get_affiliateinvitee_name() for invitee in invitees]
+
+        assert names == ["300", "invitee"]
+        assert [invitee.paid_commission for invitee in invitees] == [0, Decimal(2)]
+
+
+class AffiliateLeaderboardTestCase(TestCase):
+    """Test case for the set-based affiliate statistics and leaderboard."""
+
+    def setUp(self) -> None:
+        """Set up three affiliates with a varying number of converted invitees."""
+        owner_user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=owner_user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        self.plan = StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Plan",
+            amount=Decimal("10.00"),
+            description="Test plan",
+            interval_count=1,
+            discord_role_id="1",
+        )
+        status = StripeSubscription.SubscriptionStatus
+        self.top = self.create_affiliate("top", [status.ACTIVE, status.EXPIRED, None])
+        self.converter = self.create_affiliate("converter", [status.ACTIVE])
+        self.newcomer = self.create_affiliate("newcomer", [])
+
+    def create_subscriber(self, name):
+        """Create a subscriber of the serverowner."""
+        user = User.objects.create(username=name)
+        return Subscriber.objects.create(
+            user=user,
+            discord_id=name,
+            username=name,
+            email=f"{name}@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+
+    def create_affiliate(self, name, statuses):
+        """Create an affiliate with an invitee per subscription status."""
+        affiliate = Affiliate.objects.create(
+            subscriber=self.create_subscriber(name),
+            discord_id=name,
+            server_id="555",
+            serverowner=self.serverowner,
+        )
+        for index, status in enumerate(statuses):
+            invitee = self.create_subscriber(f"{name}-invitee{index}")
+            if status is not None:
+                StripeSubscription.objects.create(
+                    subscriber=invitee,
+                    subscribed_via=self.serverowner,
+                    plan=self.plan,
+                    status=status,
+                )
+            AffiliateInvitee.objects.create(
+                affiliate=affiliate,
+                invitee_discord_id=invitee.discord_id,
+            )
+        return affiliate
+
+    def test_stats(self) -> None:
+        """Test the counters and the annotated conversion rate of the affiliates."""
+        affiliates = {
+            affiliate.pk: affiliate for affiliate in Affiliate.objects.with_stats()
+        }
+
+        top = affiliates[self.top.pk]
+        assert (top.invite_count, top.active_count, top.converted_count) == (3, 1, 2)
+        assert top.conversion_rate == 66.67
+        assert affiliates[self.converter.pk].conversion_rate == 100
+        assert affiliates[self.newcomer.pk].conversion_rate == 0
+        for affiliate in affiliates.values():
+            assert affiliate.conversion_rate == affiliate.calculate_conversion_rate()
+
+    def test_record_activations_and_deactivations(self) -> None:
+        """Test an invitee is counted once however many subscriptions they have."""
+        status = StripeSubscription.SubscriptionStatus
+        subscriber = self.create_subscriber("newcomer-invitee")
+        AffiliateInvitee.objects.create(
+            affiliate=self.newcomer,
+            invitee_discord_id=subscriber.discord_id,
+        )
+        first = StripeSubscription.objects.create(
+            subscriber=subscriber,
+            subscribed_via=self.serverowner,
+            plan=self.plan,
+            status=status.ACTIVE,
+        )
+        Affiliate.objects.record_activations(StripeSubscription, [first], [first])
+        second = StripeSubscription.objects.create(
+            subscriber=subscriber,
+            subscribed_via=self.serverowner,
+            plan=self.plan,
+            status=status.ACTIVE,
+        )
+        Affiliate.objects.record_activations(StripeSubscription, [second], [second])
+        # Subscribers who were not invited change nothing
+        uninvited = StripeSubscription.objects.create(
+            subscriber=self.newcomer.subscriber,
+            subscribed_via=self.serverowner,
+            plan=self.plan,
+            status=status.ACTIVE,
+        )
+        Affiliate.objects.record_activations(
+            StripeSubscription,
+            [uninvited],
+            [uninvited],
+        )
+
+        self.newcomer.refresh_from_db()
+        assert (self.newcomer.active_count, self.newcomer.converted_count) == (1, 1)
+
+        StripeSubscription.objects.filter(pk=first.pk).update(status=status.EXPIRED)
+        Affiliate.objects.record_deactivations(StripeSubscription, [subscriber.pk])
+        self.newcomer.refresh_from_db()
+        assert self.newcomer.active_count == 1
+
+        StripeSubscription.objects.filter(status=status.ACTIVE).update(
+            status=status.CANCELED,
+        )
+        with self.assertNumQueries(1):
+            Affiliate.objects.record_deactivations(
+                StripeSubscription,
+                [subscriber.pk],
+            )
+        self.newcomer.refresh_from_db()
+        assert (self.newcomer.active_count, self.newcomer.converted_count) == (0, 1)
+        assert self.newcomer.calculate_conversion_rate() == 100
+
+    def test_rebuild_counters(self) -> None:
+        """Test the counters are rebuilt from the invitees and their subscriptions."""
+        Affiliate.objects.update(invite_count=0, active_count=0, converted_count=0)
+
+        assert Affiliate.objects.rebuild_counters() == 3
+
+        self.top.refresh_from_db()
+        assert (
+            self.top.invite_count,
+            self.top.active_count,
+            self.top.converted_count,
+        ) == (3, 1, 2)
+
+    def test_leaderboard_single_query(self) -> None:
+        """Test the leaderboard is computed in one query for any number of affiliates."""
+        for index in range(5):
+            self.create_affiliate(f"extra{index}", [None])
+
+        with self.assertNumQueries(1):
+            affiliates = list(self.serverowner.get_affiliate_leaderboard())
+
+        assert len(affiliates) == 8
+
+    def test_leaderboard_sorting(self) -> None:
+        """Test the leaderboard ranks the affiliates by the requested statistic."""
+        by_invites = self.serverowner.get_affiliate_leaderboard("invites")
+        by_conversion = self.serverowner.get_affiliate_leaderboard("conversion")
+
+        assert list(by_invites) == [self.top, self.converter, self.newcomer]
+        assert list(by_conversion) == [self.converter, self.top, self.newcomer]
+
+    def test_leaderboard_keyset_pagination(self) -> None:
+        """Test each page starts after the last affiliate of the previous page."""
+        self.create_affiliate("tied", [None])
+        pages = []
+        after = None
+        while page := list(
+            self.serverowner.get_affiliate_leaderboard("active", after)[:2],
+        ):
+            pages.append([affiliate.pk for affiliate in page])
+            after = page[-1].pk
+
+        assert pages == [
+            ["top", "converter"],
+            ["tied", "newcomer"],
+        ]
+
+        before = self.serverowner.get_affiliate_leaderboard("active", before="tied")
+        assert [affiliate.pk for affiliate in before] == ["top", "converter"]
+
+    def test_leaderboard_unknown_sort(self) -> None:
+        """Test an unknown sort key is rejected."""
+        with self.assertRaises(ValueError):
+            self.serverowner.get_affiliate_leaderboard("name")
+
+
+class PlanActiveSubscriberCountTestCase(TestCase):
+    """Test case for the maintained count of active subscriptions of plans."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner with two plans."""
+        self.serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="Pythonian"),
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        self.plans = [
+            StripePlan.objects.create(
+                serverowner=self.serverowner,
+                name=f"Plan {index}",
+                amount=Decimal("10.00"),
+                description="Test plan",
+                interval_count=1,
+                discord_role_id="1",
+            )
+            for index in range(2)
+        ]
+
+    def test_record_activations_and_deactivations(self) -> None:
+        """Test the counts of several plans are shifted in a single query."""
+        first, second = self.plans
+
+        with self.assertNumQueries(1):
+            StripePlan.objects.record_activations([first.pk, second.pk, first.pk])
+        StripePlan.objects.record_deactivations([first.pk, second.pk, second.pk])
+
+        first.refresh_from_db()
+        second.refresh_from_db()
+        assert first.active_subscriber_count == 1
+        assert second.active_subscriber_count == 0
+
+    def test_rebuild_active_subscriber_counts(self) -> None:
+        """Test the counts are recomputed from the active subscriptions."""
+        for status in StripeSubscription.SubscriptionStatus:
+            StripeSubscription.objects.create(
+                subscriber=Subscriber.objects.create(
+                    user=User.objects.create(username=status.label),
+                    discord_id=status.value,
+                    username=status.label,
+                    email=f"{status.value}@gmail.com",
+                    subscribed_via=self.serverowner,
+                ),
+                subscribed_via=self.serverowner,
+                plan=self.plans[0],
+                status=status,
+            )
+
+        assert StripePlan.objects.rebuild_active_subscriber_counts() == 2
+
+        assert [
+            plan.active_subscriptions_count() for plan in StripePlan.objects.all()
+        ] == [
+            0,
+            1,
+        ]
+
+
+class ServerSyncGuildsTestCase(TestCase):
+    """Test case for the bulk upsert of the servers of a serverowner."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner and the guilds it owns on Discord."""
+        self.serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="Pythonian"),
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        self.guilds = [
+            {"id": str(index), "name": f"Guild {index}", "icon": None}
+            for index in range(5)
+        ]
+
+    def test_sync_guilds_creates_servers_in_one_query(self) -> None:
+        """Test the servers of every guild are created with a single statement."""
+        with self.assertNumQueries(1):
+            Server.objects.sync_guilds(self.serverowner, self.guilds)
+
+        assert self.serverowner.servers.count() == 5
+
+    def test_sync_guilds_refreshes_existing_servers(self) -> None:
+        """Test a later sync updates the name and icon of the existing servers."""
+        Server.objects.sync_guilds(self.serverowner, self.guilds)
+        Server.objects.filter(server_id="0").update(choice_server=True)
+        self.guilds[0].update(name="Renamed", icon="abc")
+
+        with self.assertNumQueries(1):
+            Server.objects.sync_guilds(
+                self.serverowner,
+                [*self.guilds, {"id": "5", "name": "Guild 5", "icon": None}],
+            )
+
+        server = Server.objects.get(server_id="0")
+        assert (server.name, server.icon, server.choice_server) == (
+            "Renamed",
+            "abc",
+            True,
+        )
+        assert self.serverowner.servers.count() == 6
+
+    def test_server_id_is_unique_per_owner(self) -> None:
+        """Test a serverowner cannot have two servers with the same Discord ID."""
+        Server.objects.create(owner=self.serverowner, server_id="1", name="Guild")
+
+        with self.assertRaises(IntegrityError):
+            Server.objects.create(owner=self.serverowner, server_id="1", name="Copy")
+
+
+class QueryPlanTestCase(TestCase):
+    """Test case for the indexes of the signup, referral and listing queries.
+
+    The plans are read from SQLite, whose planner picks an index over a table
+    scan even for the few rows seeded here.
+    """
+
+    def setUp(self) -> None:
+        """Set up serverowners with referral names."""
+        for index in range(5):
+            ServerOwner.objects.create(
+                user=User.objects.create(username=f"owner{index}"),
+                discord_id=f"10{index}",
+                username=f"owner{index}",
+                subdomain=f"referral{index}",
+                email=f"owner{index}@gmail.com",
+            )
+        self.serverowner = ServerOwner.objects.get(subdomain="referral0")
+
+    def assert_uses_index(self, queryset, index_name) -> None:
+        """Assert a query seeks an index and needs neither a table scan nor a sort."""
+        plan = queryset.explain()
+        self.assertIn(f"USING INDEX {index_name}", plan)
+        self.assertNotIn("SCAN", plan)
+        self.assertNotIn("TEMP B-TREE", plan)
+
+    @skipUnless(connection.vendor == "sqlite", "Query plans are asserted on SQLite.")
+    def test_referral_lookup_uses_index(self) -> None:
+        """Test the referral name is looked up by the unique lowercase index."""
+        queryset = ServerOwner.objects.with_subdomain("REFERRAL0").order_by()
+
+        self.assert_uses_index(queryset, "serverowner_subdomain_lower")
+        self.assertEqual(queryset.get(), self.serverowner)
+
+    @skipUnless(connection.vendor == "sqlite", "Query plans are asserted on SQLite.")
+    def test_listing_queries_use_indexes(self) -> None:
+        """Test the affiliate payment and popular plan listings use their indexes."""
+        self.assert_uses_index(
+            self.serverowner.get_pending_affiliate_payments(),
+            "affiliatepayment_owner_pending",
+        )
+        self.assert_uses_index(
+            self.serverowner.get_confirmed_affiliate_payments(),
+            "affiliatepayment_owner_paid",
+        )
+        self.assert_uses_index(
+            AffiliatePayment.objects.filter(affiliate_id="200"),
+            "affiliatepayment_aff_created",
+        )
+        self.assert_uses_index(
+            self.serverowner.get_popular_plans(),
+            "stripeplan_popular",
+        )
+
+    def test_referral_name_is_unique_ignoring_case(self) -> None:
+        """Test two serverowners cannot share a referral name in different cases."""
+        ServerOwner.objects.create(
+            user=User.objects.create(username="blank"),
+            discord_id="200",
+            username="blank",
+            email="blank@gmail.com",
+        )
+        ServerOwner.objects.create(
+            user=User.objects.create(username="blank2"),
+            discord_id="201",
+            username="blank2",
+            email="blank2@gmail.com",
+        )
+
+        self.assertRaises(
+            IntegrityError,
+            ServerOwner.objects.create,
+            user=User.objects.create(username="copycat"),
+            discord_id="202",
+            username="copycat",
+            subdomain="Referral0",
+            email="copycat@gmail.com",
+        )
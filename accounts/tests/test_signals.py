@@ -2,7 +2,13 @@
 
 from django.test import TestCase
 
-from accounts.models import ServerOwner, Subscriber, User
+from accounts.models import (
+    Affiliate,
+    AffiliateInvitee,
+    ServerOwner,
+    Subscriber,
+    User,
+)
 from accounts.signals import create_user_profile
 
 
@@ -42,3 +48,44 @@ class SignalReceiverTest(TestCase):
         # Check that no new profile was created
         assert not ServerOwner.objects.filter(user=user).exists()
         assert not Subscriber.objects.filter(user=user).exists()
+
+    def test_link_subscriber_invitation(self) -> None:
+        """Test an invitation is linked when the Discord ID of its subscriber is saved."""
+        serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="owner"),
+            discord_id="1",
+            username="owner",
+            subdomain="prontomaster",
+            email="owner@gmail.com",
+        )
+        affiliate = Affiliate.objects.create(
+            subscriber=Subscriber.objects.create(
+                user=User.objects.create(username="affiliate"),
+                discord_id="2",
+                username="affiliate",
+                email="affiliate@gmail.com",
+                subscribed_via=serverowner,
+            ),
+            discord_id="2",
+            server_id="1",
+            serverowner=serverowner,
+        )
+        invitee = AffiliateInvitee.objects.create(
+            affiliate=affiliate,
+            invitee_discord_id="3",
+        )
+        subscriber = Subscriber.objects.create(
+            user=User.objects.create(username="invitee"),
+            username="invitee",
+            email="invitee@gmail.com",
+        )
+
+        # Saving other fields does not look for the invitation
+        subscriber.username = "renamed"
+        with self.assertNumQueries(1):
+            subscriber.save(update_fields=["username", "updated"])
+        subscriber.discord_id = "3"
+        subscriber.save(update_fields=["discord_id", "updated"])
+
+        invitee.refresh_from_db()
+        assert invitee.subscriber == subscriber
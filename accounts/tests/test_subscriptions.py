@@ -0,0 +1,216 @@
+"""Test cases for the subscription state transitions."""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.test import TestCase
+from django.utils import timezone
+
+from accounts.models import (
+    Affiliate,
+    AffiliateInvitee,
+    AffiliatePayment,
+    CoinPlan,
+    CoinSubscription,
+    DailyRevenueRollup,
+    ServerOwner,
+    Subscriber,
+    User,
+)
+from accounts.subscriptions import (
+    SubscriptionPayment,
+    activate_subscriptions,
+    deactivate_subscriptions,
+)
+
+
+class SubscriptionTransitionsTestCase(TestCase):
+    """Test case for activating and deactivating subscriptions in batches."""
+
+    def setUp(self) -> None:
+        """Set up two plans and an affiliate who invited the first subscriber."""
+        self.serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="Pythonian"),
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            affiliate_commission=10,
+            coinpayment_onboarding=True,
+        )
+        self.plans = [
+            CoinPlan.objects.create(
+                serverowner=self.serverowner,
+                name=f"Plan {index}",
+                amount=Decimal("10.00") * (index + 1),
+                description="Test plan",
+                interval_count=1,
+                discord_role_id="1",
+            )
+            for index in range(2)
+        ]
+        self.affiliate = Affiliate.objects.create(
+            subscriber=self.create_subscriber("200"),
+            discord_id="200",
+            server_id="555",
+            serverowner=self.serverowner,
+        )
+        AffiliateInvitee.objects.create(
+            affiliate=self.affiliate,
+            invitee_discord_id="100",
+        )
+
+    def create_subscriber(self, discord_id):
+        """Create a subscriber of the serverowner."""
+        return Subscriber.objects.create(
+            user=User.objects.create(username=f"user-{discord_id}"),
+            discord_id=discord_id,
+            username=f"user-{discord_id}",
+            email=f"user-{discord_id}@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+
+    def create_subscriptions(self, count):
+        """Create pending subscriptions, the first one by the invitee."""
+        return [
+            CoinSubscription.objects.create(
+                subscriber=self.create_subscriber(str(100 + index)),
+                subscribed_via=self.serverowner,
+                plan=self.plans[index % 2],
+            )
+            for index in range(count)
+        ]
+
+    def pay(self, subscriptions, days=30):
+        """Build a payment of each subscription for a number of days."""
+        now = timezone.now()
+        return [
+            SubscriptionPayment(
+                subscription=subscription,
+                expiration_date=now + timedelta(days=days),
+                paid_at=now,
+            )
+            for subscription in subscriptions
+        ]
+
+    def test_activation_queries_do_not_grow_with_the_batch(self) -> None:
+        """Test a batch is activated with the same statements as one subscription."""
+        subscriptions = self.create_subscriptions(6)
+
+        with self.assertNumQueries(10):
+            activate_subscriptions(CoinSubscription, self.pay(subscriptions[:1]))
+
+        # No commission is owed for the other subscribers
+        with self.assertNumQueries(8):
+            activate_subscriptions(CoinSubscription, self.pay(subscriptions[1:]))
+
+    def test_activation_credits_plans_serverowner_and_affiliate(self) -> None:
+        """Test the counters of every payee are credited for the batch."""
+        subscriptions = self.create_subscriptions(3)
+
+        applied = activate_subscriptions(CoinSubscription, self.pay(subscriptions))
+
+        self.assertEqual(len(applied), 3)
+        self.assertFalse(CoinSubscription.pending_subscriptions.exists())
+        for plan in self.plans:
+            plan.refresh_from_db()
+        self.serverowner.refresh_from_db()
+        self.affiliate.refresh_from_db()
+        self.assertEqual(self.plans[0].subscriber_count, 2)
+        self.assertEqual(self.plans[0].active_subscriber_count, 2)
+        self.assertEqual(self.plans[0].subscription_earnings, Decimal("20.00"))
+        self.assertEqual(self.plans[1].subscription_earnings, Decimal("20.00"))
+        self.assertEqual(self.serverowner.total_earnings, Decimal("40.00"))
+        self.assertEqual(self.serverowner.total_pending_commissions, Decimal("1.00"))
+        self.assertEqual(self.affiliate.pending_commissions, Decimal("1.00"))
+        self.assertEqual(self.affiliate.active_count, 1)
+        self.assertEqual(AffiliatePayment.objects.get().amount, Decimal("1.00"))
+
+    def test_renewal_credits_earnings_only(self) -> None:
+        """Test a renewal is credited without counting a new subscriber."""
+        subscriptions = self.create_subscriptions(1)
+        activate_subscriptions(CoinSubscription, self.pay(subscriptions))
+
+        activate_subscriptions(CoinSubscription, self.pay(subscriptions, days=60))
+
+        plan = CoinPlan.objects.get(pk=self.plans[0].pk)
+        self.assertEqual(plan.subscriber_count, 1)
+        self.assertEqual(plan.active_subscriber_count, 1)
+        self.assertEqual(plan.subscription_earnings, Decimal("20.00"))
+        self.assertEqual(AffiliatePayment.objects.count(), 2)
+
+    def test_payments_are_rolled_up_per_day(self) -> None:
+        """Test first payments and renewals are added to the daily revenue rollups."""
+        subscriptions = self.create_subscriptions(3)
+        activate_subscriptions(CoinSubscription, self.pay(subscriptions))
+        activate_subscriptions(CoinSubscription, self.pay(subscriptions[:1], days=60))
+
+        rollups = {
+            rollup.plan_id: rollup
+            for rollup in DailyRevenueRollup.objects.filter(
+                day=timezone.localdate(),
+                provider=DailyRevenueRollup.Provider.COIN,
+            )
+        }
+
+        self.assertEqual(len(rollups), 2)
+        first = rollups[self.plans[0].pk]
+        self.assertEqual(first.new_subscriptions, 2)
+        self.assertEqual(first.renewals, 1)
+        self.assertEqual(first.gross_amount, Decimal("30.00"))
+        self.assertEqual(rollups[self.plans[1].pk].gross_amount, Decimal("20.00"))
+
+    def test_payment_applied_twice_is_skipped(self) -> None:
+        """Test a payment which does not extend the subscription is not credited again."""
+        subscriptions = self.create_subscriptions(1)
+        payments = self.pay(subscriptions)
+        activate_subscriptions(CoinSubscription, payments)
+
+        with self.assertNumQueries(1):
+            self.assertEqual(activate_subscriptions(CoinSubscription, payments), [])
+
+    def test_payment_applied_through_stale_instances_is_credited_once(self) -> None:
+        """Test a payment applied through two separately loaded instances is credited once."""
+        (subscription,) = self.create_subscriptions(1)
+        first = CoinSubscription.objects.select_related("plan").get(pk=subscription.pk)
+        second = CoinSubscription.objects.select_related("plan").get(pk=subscription.pk)
+        expiration_date = timezone.now() + timedelta(days=30)
+
+        for instance in (first, second):
+            activate_subscriptions(
+                CoinSubscription,
+                [
+                    SubscriptionPayment(
+                        subscription=instance,
+                        expiration_date=expiration_date,
+                        paid_at=timezone.now(),
+                    ),
+                ],
+            )
+
+        plan = CoinPlan.objects.get(pk=subscription.plan_id)
+        self.serverowner.refresh_from_db()
+        self.affiliate.refresh_from_db()
+        self.assertEqual(plan.subscriber_count, 1)
+        self.assertEqual(plan.subscription_earnings, Decimal("10.00"))
+        self.assertEqual(self.serverowner.total_earnings, Decimal("10.00"))
+        self.assertEqual(self.affiliate.converted_count, 1)
+        self.assertEqual(AffiliatePayment.objects.count(), 1)
+
+    def test_deactivation_skips_inactive_subscriptions(self) -> None:
+        """Test only active subscriptions are deactivated and uncounted."""
+        active, pending = self.create_subscriptions(2)
+        activate_subscriptions(CoinSubscription, self.pay([active]))
+
+        rows = deactivate_subscriptions(
+            CoinSubscription.objects.all(),
+            CoinSubscription.SubscriptionStatus.CANCELED,
+        )
+
+        self.assertEqual(rows, [(active.subscriber_id, active.plan_id)])
+        pending.refresh_from_db()
+        self.assertEqual(pending.status, CoinSubscription.SubscriptionStatus.PENDING)
+        self.affiliate.refresh_from_db()
+        self.assertEqual(self.affiliate.active_count, 0)
+        plan = CoinPlan.objects.get(pk=self.plans[0].pk)
+        self.assertEqual(plan.active_subscriber_count, 0)
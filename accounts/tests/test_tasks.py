@@ -0,0 +1,517 @@
+"""Test cases for the background tasks."""
+
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.test import TestCase, override_settings
+from django.utils import timezone
+
+from accounts.models import (
+    Affiliate,
+    AffiliateInvitee,
+    CoinPlan,
+    CoinSubscription,
+    DailyRevenueRollup,
+    ServerOwner,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
+from accounts.tasks import (
+    COINPAYMENTS_TX_INFO_BATCH_SIZE,
+    STRIPE_RENEWAL_GRACE_PERIOD,
+    backfill_daily_revenue_rollups,
+    check_and_mark_expired_subscriptions,
+    check_coin_transaction_status,
+    expire_subscriptions,
+    reconcile_plan_active_subscriber_counts,
+)
+
+from .coinpayments import CoinPaymentsStandIn
+
+
+def create_coin_serverowner(name):
+    """Create a serverowner onboarded with CoinPayments and a coin plan."""
+    user = User.objects.create(username=name)
+    serverowner = ServerOwner.objects.create(
+        user=user,
+        discord_id=f"{name}-discord",
+        username=name,
+        subdomain=name,
+        email=f"{name}@gmail.com",
+        coinpayment_onboarding=True,
+        coinpayment_api_public_key=f"{name}-public",
+        coinpayment_api_secret_key=f"{name}-secret",
+    )
+    plan = CoinPlan.objects.create(
+        serverowner=serverowner,
+        name=f"{name} plan",
+        amount=Decimal("10.00"),
+        description="Coin plan",
+        interval_count=1,
+        discord_role_id="1",
+    )
+    return serverowner, plan
+
+
+def create_affiliate(serverowner, invitee_discord_ids):
+    """Create an affiliate of a serverowner who invited the given Discord users."""
+    name = f"{serverowner.username}-affiliate"
+    subscriber = Subscriber.objects.create(
+        user=User.objects.create(username=name),
+        discord_id=name,
+        username=name,
+        email=f"{name}@gmail.com",
+        subscribed_via=serverowner,
+    )
+    affiliate = Affiliate.objects.create(
+        subscriber=subscriber,
+        discord_id=name,
+        server_id="555",
+        serverowner=serverowner,
+    )
+    for discord_id in invitee_discord_ids:
+        AffiliateInvitee.objects.create(
+            affiliate=affiliate,
+            invitee_discord_id=discord_id,
+        )
+    return affiliate
+
+
+def create_pending_coin_subscriptions(serverowner, plan, count):
+    """Create pending coin subscriptions for new subscribers of a serverowner."""
+    subscriptions = []
+    for index in range(count):
+        name = f"{serverowner.username}-subscriber{index}"
+        user = User.objects.create(username=name)
+        subscriber = Subscriber.objects.create(
+            user=user,
+            discord_id=name,
+            username=name,
+            email=f"{name}@gmail.com",
+            subscribed_via=serverowner,
+        )
+        subscriptions.append(
+            CoinSubscription.objects.create(
+                subscriber=subscriber,
+                subscribed_via=serverowner,
+                plan=plan,
+                subscription_id=f"{name}-tx",
+                coin_amount=Decimal("0.1"),
+                status=CoinSubscription.SubscriptionStatus.PENDING,
+            ),
+        )
+    return subscriptions
+
+
+class CheckCoinTransactionStatusTestCase(TestCase):
+    """Test case for the batched coin transaction status polling."""
+
+    def setUp(self) -> None:
+        """Set up two serverowners with pending coin subscriptions."""
+        self.first_owner, self.first_plan = create_coin_serverowner("first")
+        self.second_owner, self.second_plan = create_coin_serverowner("second")
+        self.api_keys = {
+            owner.coinpayment_api_public_key: owner.coinpayment_api_secret_key
+            for owner in (self.first_owner, self.second_owner)
+        }
+
+    def poll(self, standin) -> None:
+        """Run the polling task against the stand-in API."""
+        with override_settings(COINPAYMENTS_API_URL=standin.url):
+            check_coin_transaction_status()
+
+    def test_requests_are_batched_per_serverowner(self) -> None:
+        """Test the transactions are fetched in batches per serverowner."""
+        create_pending_coin_subscriptions(self.first_owner, self.first_plan, 30)
+        create_pending_coin_subscriptions(self.second_owner, self.second_plan, 10)
+
+        with CoinPaymentsStandIn(default_status=0, api_keys=self.api_keys) as standin:
+            self.poll(standin)
+
+        # 30 transactions need 2 requests and 10 transactions need 1 request
+        assert COINPAYMENTS_TX_INFO_BATCH_SIZE == 25
+        assert standin.commands == ["get_tx_info_multi"] * 3
+        assert CoinSubscription.pending_subscriptions.count() == 40
+
+    def test_polling_metrics_per_serverowner(self) -> None:
+        """Test the task returns the polling metrics of each serverowner."""
+        create_pending_coin_subscriptions(self.first_owner, self.first_plan, 30)
+        (failed,) = create_pending_coin_subscriptions(
+            self.second_owner,
+            self.second_plan,
+            1,
+        )
+
+        statuses = {failed.subscription_id: -1}
+        with (
+            CoinPaymentsStandIn(
+                statuses=statuses,
+                default_status=100,
+                api_keys=self.api_keys,
+            ) as standin,
+            override_settings(COINPAYMENTS_API_URL=standin.url),
+        ):
+            metrics = check_coin_transaction_status()
+
+        first, second = metrics[self.first_owner.id], metrics[self.second_owner.id]
+        assert first["subscriptions"] == first["activated"] == 30
+        assert first["requests"] == 2
+        assert first["failed_requests"] == 0
+        assert second["deleted"] == 1
+        assert 0 < second["request_time"] <= second["elapsed"]
+
+    @override_settings(
+        COINPAYMENTS_OWNER_CONCURRENCY=2,
+        COINPAYMENTS_OWNER_RATE_LIMIT=0,
+        COINPAYMENTS_POLL_WORKERS=8,
+    )
+    def test_serverowner_concurrency_is_limited(self) -> None:
+        """Test the requests of a serverowner never exceed its concurrency limit."""
+        create_pending_coin_subscriptions(self.first_owner, self.first_plan, 100)
+        create_pending_coin_subscriptions(self.second_owner, self.second_plan, 25)
+
+        with CoinPaymentsStandIn(default_status=0, latency=0.05) as standin:
+            self.poll(standin)
+
+        assert len(standin.commands) == 5
+        assert standin.max_in_flight["first-public"] == 2
+        assert standin.max_in_flight["second-public"] == 1
+
+    @override_settings(COINPAYMENTS_OWNER_RATE_LIMIT=10)
+    def test_serverowners_are_polled_concurrently(self) -> None:
+        """Test a serverowner's rate limit does not delay the other serverowners."""
+        create_pending_coin_subscriptions(self.first_owner, self.first_plan, 100)
+        create_pending_coin_subscriptions(self.second_owner, self.second_plan, 1)
+
+        with (
+            CoinPaymentsStandIn(default_status=0) as standin,
+            override_settings(COINPAYMENTS_API_URL=standin.url),
+        ):
+            metrics = check_coin_transaction_status()
+
+        # Four requests at 10 per second take the first serverowner 0.3s at least
+        assert metrics[self.first_owner.id]["elapsed"] >= 0.3
+        assert metrics[self.second_owner.id]["elapsed"] < 0.3
+
+    def test_completed_transactions_are_activated(self) -> None:
+        """Test completed transactions activate the subscription and credit earnings."""
+        paid, waiting = create_pending_coin_subscriptions(
+            self.first_owner,
+            self.first_plan,
+            2,
+        )
+
+        statuses = {paid.subscription_id: 100, waiting.subscription_id: 0}
+        with CoinPaymentsStandIn(statuses=statuses, api_keys=self.api_keys) as standin:
+            self.poll(standin)
+
+        paid.refresh_from_db()
+        waiting.refresh_from_db()
+        self.first_plan.refresh_from_db()
+        self.first_owner.refresh_from_db()
+        assert paid.status == CoinSubscription.SubscriptionStatus.ACTIVE
+        assert paid.expiration_date is not None
+        assert waiting.status == CoinSubscription.SubscriptionStatus.PENDING
+        assert self.first_plan.subscriber_count == 1
+        assert self.first_plan.active_subscriber_count == 1
+        assert self.first_owner.total_earnings == Decimal("10.00")
+
+    def test_activation_updates_affiliate_counters(self) -> None:
+        """Test an activated invitee is counted as active and converted."""
+        paid, waiting = create_pending_coin_subscriptions(
+            self.first_owner,
+            self.first_plan,
+            2,
+        )
+        affiliate = create_affiliate(
+            self.first_owner,
+            [subscription.subscriber.discord_id for subscription in (paid, waiting)],
+        )
+
+        statuses = {paid.subscription_id: 100}
+        with CoinPaymentsStandIn(statuses=statuses, api_keys=self.api_keys) as standin:
+            self.poll(standin)
+
+        affiliate.refresh_from_db()
+        assert affiliate.invite_count == 2
+        assert affiliate.active_count == affiliate.converted_count == 1
+        assert affiliate.calculate_conversion_rate() == 50
+
+    def test_failed_transactions_are_deleted(self) -> None:
+        """Test failed transactions delete the pending subscription."""
+        (failed,) = create_pending_coin_subscriptions(
+            self.first_owner,
+            self.first_plan,
+            1,
+        )
+
+        statuses = {failed.subscription_id: -1}
+        with CoinPaymentsStandIn(statuses=statuses, api_keys=self.api_keys) as standin:
+            self.poll(standin)
+
+        assert not CoinSubscription.objects.filter(pk=failed.pk).exists()
+
+    def test_failing_serverowner_does_not_block_others(self) -> None:
+        """Test a serverowner with invalid keys does not stop other serverowners."""
+        create_pending_coin_subscriptions(self.first_owner, self.first_plan, 1)
+        (paid,) = create_pending_coin_subscriptions(
+            self.second_owner,
+            self.second_plan,
+            1,
+        )
+        # Only the second serverowner's keys are valid
+        api_keys = {
+            self.first_owner.coinpayment_api_public_key: "wrong-secret",
+            self.second_owner.coinpayment_api_public_key: "second-secret",
+        }
+
+        with CoinPaymentsStandIn(default_status=100, api_keys=api_keys) as standin:
+            self.poll(standin)
+
+        paid.refresh_from_db()
+        assert paid.status == CoinSubscription.SubscriptionStatus.ACTIVE
+        assert CoinSubscription.pending_subscriptions.count() == 1
+
+
+class CountingEmailBackend(locmem.EmailBackend):
+    """In-memory email backend counting the connections opened."""
+
+    connections = 0
+
+    def __init__(self, *args, **kwargs):
+        """Count the new connection."""
+        super().__init__(*args, **kwargs)
+        CountingEmailBackend.connections += 1
+
+
+class CheckAndMarkExpiredSubscriptionsTestCase(TestCase):
+    """Test case for the bulk expiry of subscriptions."""
+
+    def setUp(self) -> None:
+        """Set up a serverowner with coin and Stripe plans."""
+        self.serverowner, self.coin_plan = create_coin_serverowner("owner")
+        self.stripe_plan = StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Stripe plan",
+            amount=Decimal("10.00"),
+            description="Stripe plan",
+            interval_count=1,
+            discord_role_id="2",
+        )
+        self.now = timezone.now()
+        CountingEmailBackend.connections = 0
+
+    def create_subscription(self, model, plan, name, expiration_date):
+        """Create an active subscription of a new subscriber."""
+        user = User.objects.create(username=name)
+        subscriber = Subscriber.objects.create(
+            user=user,
+            discord_id=name,
+            username=name,
+            email=f"{name}@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        return model.objects.create(
+            subscriber=subscriber,
+            subscribed_via=self.serverowner,
+            plan=plan,
+            expiration_date=expiration_date,
+            status=model.SubscriptionStatus.ACTIVE,
+        )
+
+    def test_expire_subscriptions(self) -> None:
+        """Test expired subscriptions of both kinds are marked in one query each.
+
+        The affiliate and plan counters and the daily revenue rollups take four
+        more queries per kind, and the savepoint of the transaction two more.
+        """
+        expired_coin = self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "coin-expired",
+            self.now - timedelta(minutes=1),
+        )
+        current_coin = self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "coin-current",
+            self.now + timedelta(days=1),
+        )
+        expired_stripe = self.create_subscription(
+            StripeSubscription,
+            self.stripe_plan,
+            "stripe-expired",
+            self.now - STRIPE_RENEWAL_GRACE_PERIOD - timedelta(minutes=1),
+        )
+        renewing_stripe = self.create_subscription(
+            StripeSubscription,
+            self.stripe_plan,
+            "stripe-renewing",
+            self.now - timedelta(minutes=1),
+        )
+
+        with self.assertNumQueries(12):
+            subscriber_ids = expire_subscriptions(self.now)
+
+        assert subscriber_ids == {
+            expired_coin.subscriber_id,
+            expired_stripe.subscriber_id,
+        }
+        for subscription, status in (
+            (expired_coin, CoinSubscription.SubscriptionStatus.EXPIRED),
+            (current_coin, CoinSubscription.SubscriptionStatus.ACTIVE),
+            (expired_stripe, StripeSubscription.SubscriptionStatus.EXPIRED),
+            (renewing_stripe, StripeSubscription.SubscriptionStatus.ACTIVE),
+        ):
+            subscription.refresh_from_db()
+            assert subscription.status == status
+
+    def test_expiry_updates_affiliate_counters(self) -> None:
+        """Test an expired invitee stays converted but is no longer active."""
+        subscription = self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "invitee",
+            self.now - timedelta(minutes=1),
+        )
+        affiliate = create_affiliate(self.serverowner, ["invitee"])
+        affiliate.refresh_from_db()
+        assert (affiliate.active_count, affiliate.converted_count) == (1, 1)
+
+        expire_subscriptions(self.now)
+
+        affiliate.refresh_from_db()
+        subscription.refresh_from_db()
+        assert subscription.status == CoinSubscription.SubscriptionStatus.EXPIRED
+        assert (affiliate.active_count, affiliate.converted_count) == (0, 1)
+
+    @override_settings(
+        EMAIL_BACKEND="accounts.tests.test_tasks.CountingEmailBackend",
+    )
+    def test_expired_subscribers_are_notified_in_batches(self) -> None:
+        """Test one email per subscriber is sent over one connection per batch."""
+        for index in range(3):
+            self.create_subscription(
+                CoinSubscription,
+                self.coin_plan,
+                f"subscriber{index}",
+                self.now - timedelta(minutes=1),
+            )
+
+        assert check_and_mark_expired_subscriptions() == 3
+
+        assert sorted(email.to[0] for email in mail.outbox) == [
+            f"subscriber{index}@gmail.com" for index in range(3)
+        ]
+        for email in mail.outbox:
+            assert f"Dear {email.to[0].split('@')[0]}," in email.body
+        assert CountingEmailBackend.connections == 1
+        assert not CoinSubscription.active_subscriptions.exists()
+
+    def test_nothing_expired(self) -> None:
+        """Test no email is sent when no subscription expired."""
+        assert check_and_mark_expired_subscriptions() == 0
+        assert mail.outbox == []
+
+    def test_expiry_updates_plan_counts(self) -> None:
+        """Test expired subscriptions are no longer counted as active on their plan."""
+        for name in ("first", "second"):
+            self.create_subscription(
+                CoinSubscription,
+                self.coin_plan,
+                name,
+                self.now - timedelta(minutes=1),
+            )
+        self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "current",
+            self.now + timedelta(days=1),
+        )
+        CoinPlan.objects.update(active_subscriber_count=3)
+
+        expire_subscriptions(self.now)
+
+        self.coin_plan.refresh_from_db()
+        assert self.coin_plan.active_subscriber_count == 1
+        assert self.coin_plan.active_subscriptions_count() == 1
+
+    def test_reconcile_plan_active_subscriber_counts(self) -> None:
+        """Test drifted active subscriber counts are recomputed."""
+        self.create_subscription(
+            StripeSubscription,
+            self.stripe_plan,
+            "active",
+            self.now + timedelta(days=1),
+        )
+        StripePlan.objects.update(active_subscriber_count=5)
+
+        assert reconcile_plan_active_subscriber_counts() == 2
+
+        self.coin_plan.refresh_from_db()
+        self.stripe_plan.refresh_from_db()
+        assert self.coin_plan.active_subscriber_count == 0
+        assert self.stripe_plan.active_subscriber_count == 1
+
+    def test_expiry_records_churn(self) -> None:
+        """Test expired subscriptions are counted as churned on the day they expire."""
+        expired = self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "expired",
+            self.now - timedelta(minutes=1),
+        )
+
+        expire_subscriptions(self.now)
+
+        rollup = DailyRevenueRollup.objects.get()
+        assert rollup.plan_id == expired.plan_id
+        assert rollup.day == timezone.localdate(self.now)
+        assert rollup.provider == DailyRevenueRollup.Provider.COIN
+        assert rollup.churned_subscriptions == 1
+
+    def test_backfill_daily_revenue_rollups(self) -> None:
+        """Test the rollups before the recorded ones are rebuilt from the subscriptions."""
+        yesterday = self.now - timedelta(days=1)
+        for name in ("first", "second"):
+            subscription = self.create_subscription(
+                StripeSubscription,
+                self.stripe_plan,
+                name,
+                self.now + timedelta(days=1),
+            )
+            StripeSubscription.objects.filter(pk=subscription.pk).update(
+                subscription_date=yesterday - timedelta(days=30),
+            )
+        churned = self.create_subscription(
+            CoinSubscription,
+            self.coin_plan,
+            "churned",
+            yesterday,
+        )
+        # Saved again today, after it expired yesterday
+        CoinSubscription.objects.filter(pk=churned.pk).update(
+            status=CoinSubscription.SubscriptionStatus.EXPIRED,
+            subscription_date=yesterday - timedelta(days=30),
+            updated=self.now,
+        )
+        DailyRevenueRollup.objects.create(
+            serverowner=self.serverowner,
+            plan_id=self.stripe_plan.pk,
+            day=timezone.localdate(self.now),
+            provider=DailyRevenueRollup.Provider.STRIPE,
+            renewals=1,
+        )
+
+        assert backfill_daily_revenue_rollups() == 3
+        assert backfill_daily_revenue_rollups() == 0
+
+        series = list(self.serverowner.get_daily_revenue(days=40))
+        assert [day["new_subscriptions"] for day in series] == [3, 0, 0]
+        assert series[0]["gross_amount"] == Decimal("30.00")
+        assert [day["churned_subscriptions"] for day in series] == [0, 1, 0]
+        assert series[-1]["renewals"] == 1
@@ -2,11 +2,22 @@
 
 import hashlib
 import hmac
+import threading
+import time
 
 from django.http import QueryDict
+from django.template.loader import render_to_string
 from django.test import RequestFactory, TestCase
+from django.utils import timezone
 
-from accounts.utils import create_hmac_signature, mk_paginator
+from accounts.models import ServerOwner, Subscriber, User
+from accounts.utils import (
+    CursorPaginator,
+    RateLimiter,
+    create_hmac_signature,
+    mk_cursor_paginator,
+    mk_paginator,
+)
 
 
 class MkPaginatorTests(TestCase):
@@ -51,6 +62,109 @@ class MkPaginatorTests(TestCase):
         assert list(paginated_items) == list(range(91, 101))
 
 
+class CursorPaginatorTests(TestCase):
+    """Test cases for the CursorPaginator keyed on (created, id)."""
+
+    def setUp(self) -> None:
+        """Set up 25 subscribers, several of them created at the same time."""
+        self.serverowner = ServerOwner.objects.create(
+            user=User.objects.create(username="Pythonian"),
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        for index in range(25):
+            Subscriber.objects.create(
+                user=User.objects.create(username=f"subscriber{index}"),
+                discord_id=f"{index}",
+                username=f"subscriber{index}",
+                email=f"subscriber{index}@gmail.com",
+                subscribed_via=self.serverowner,
+            )
+        # Ties on created are ordered by id
+        Subscriber.objects.filter(discord_id__in=["5", "6", "7", "8", "9"]).update(
+            created=timezone.now(),
+        )
+        self.subscribers = list(Subscriber.objects.order_by("-created", "-id"))
+
+    def paginate(self, value):
+        """Return the page of a ``page`` value of the subscribers, 10 per page."""
+        return CursorPaginator(Subscriber.objects.all(), 10).page(value)
+
+    def test_next_pages_cover_every_row_once(self) -> None:
+        """Checks if following the next pages returns every row in order."""
+        page = self.paginate("1")
+        rows = list(page)
+        while page.has_next():
+            page = self.paginate(page.next_page_number())
+            rows.extend(page)
+        assert rows == self.subscribers
+        assert page.number == 3
+        assert (page.start_index(), page.end_index()) == (21, 25)
+
+    def test_previous_pages_cover_every_row_once(self) -> None:
+        """Checks if following the previous pages from the last one returns every row."""
+        page = self.paginate("3")
+        rows = list(page)
+        while page.has_previous():
+            page = self.paginate(page.previous_page_number())
+            rows[:0] = page
+        assert rows == self.subscribers
+        assert page.number == 1
+
+    def test_deep_page_costs_one_query(self) -> None:
+        """Checks if a page after a cursor is fetched without counting or offsetting."""
+        cursor = self.paginate("1").next_page_number()
+        with self.assertNumQueries(1) as queries:
+            page = self.paginate(cursor)
+            assert len(page) == 10
+        assert "OFFSET" not in queries.captured_queries[0]["sql"]
+
+    def test_invalid_page(self) -> None:
+        """Checks if an invalid cursor or page number returns the first page."""
+        for value in ("invalid", "next:tampered", "2", None):
+            page = self.paginate(value)
+            assert page.number == 1
+            assert list(page) == self.subscribers[:10]
+
+    def test_out_of_range_page(self) -> None:
+        """Checks if a page number beyond the last page returns the last page."""
+        page = self.paginate("999")
+        assert page.number == 3
+        assert list(page) == self.subscribers[15:]
+        assert not page.has_next()
+
+    def test_last_page_holds_the_last_rows(self) -> None:
+        """Checks if the last page holds the last rows whatever the count says."""
+        paginator = CursorPaginator(Subscriber.objects.all(), 10)
+        # An estimate of the count far from the number of rows
+        paginator.count = 1000
+        page = paginator.page("last")
+        assert list(page) == self.subscribers[15:]
+        assert page.has_previous()
+
+    def test_pager_renders_without_counting(self) -> None:
+        """Checks if the links of a page are rendered without counting the rows."""
+        page = self.paginate(self.paginate("1").next_page_number())
+        request = RequestFactory().get("/test-url/")
+        with self.assertNumQueries(0):
+            html = render_to_string(
+                "partials/_pagination.html",
+                {"page_obj": page, "request": request},
+            )
+        assert "?page=last" in html
+
+    def test_mk_cursor_paginator(self) -> None:
+        """Checks if the function paginates with the page of the request."""
+        request = RequestFactory().get("/test-url/")
+        page = mk_cursor_paginator(request, Subscriber.objects.all(), 10)
+        request = RequestFactory().get("/test-url/", {"page": page.next_page_number()})
+        page = mk_cursor_paginator(request, Subscriber.objects.all(), 10)
+        assert list(page) == self.subscribers[10:20]
+        assert page.paginator.count == 25
+
+
 class HMACSignatureTests(TestCase):
     """Test cases for the create_hmac_signature utility function."""
 
@@ -101,3 +215,27 @@ class HMACSignatureTests(TestCase):
         ).hexdigest()
         signature = create_hmac_signature(data, api_secret_key)
         assert signature == expected_signature
+
+
+class RateLimiterTests(TestCase):
+    """Test cases for the RateLimiter utility class."""
+
+    def test_rate_limiter_spaces_out_calls(self) -> None:
+        """Checks if calls from several threads are spaced out to the allowed rate."""
+        rate_limiter = RateLimiter(20)
+        started = time.monotonic()
+        threads = [threading.Thread(target=rate_limiter.wait) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The first call is immediate and the next four wait 1/20s each
+        assert time.monotonic() - started >= 0.19
+
+    def test_rate_limiter_unlimited(self) -> None:
+        """Checks if a limiter without a rate never waits."""
+        rate_limiter = RateLimiter(None)
+        started = time.monotonic()
+        for _ in range(100):
+            rate_limiter.wait()
+        assert time.monotonic() - started < 0.1
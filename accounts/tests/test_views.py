@@ -0,0 +1,593 @@
+"""Test cases for the views."""
+
+import gzip
+import json
+from decimal import Decimal
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import storages
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import (
+    Affiliate,
+    AffiliateInvitee,
+    AffiliatePayment,
+    PaymentDetail,
+    Server,
+    ServerOwner,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
+
+from .discord import DiscordStandIn
+
+# session, user, serverowner (loaded once per request), dashboard figures and the
+# popular plans, latest subscriptions and payouts cards; the choice server is cached
+DASHBOARD_QUERY_BUDGET = 7
+
+
+class DashboardViewTestCase(TestCase):
+    """Test case for the serverowner dashboard view."""
+
+    def setUp(self) -> None:
+        """Set up an onboarded serverowner with plans and subscriptions."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="Pythonian",
+            is_serverowner=True,
+        )
+        ServerOwner.objects.filter(user=self.user).update(
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_onboarding=True,
+        )
+        self.serverowner = ServerOwner.objects.get(user=self.user)
+        Server.objects.create(
+            owner=self.serverowner,
+            server_id="1",
+            name="Pythonian Server",
+            choice_server=True,
+        )
+        self.client.force_login(self.user)
+
+    def add_subscriptions(self, count) -> None:
+        """Create plans and active subscriptions for the serverowner."""
+        offset = StripePlan.objects.count()
+        for index in range(offset, offset + count):
+            plan = StripePlan.objects.create(
+                serverowner=self.serverowner,
+                name=f"Plan {index}",
+                amount=Decimal("10.00"),
+                description="Test plan",
+                interval_count=1,
+                subscriber_count=1,
+                discord_role_id=str(index),
+            )
+            user = User.objects.create(username=f"subscriber{index}")
+            subscriber = Subscriber.objects.create(
+                user=user,
+                discord_id=f"10{index}",
+                username=f"subscriber{index}",
+                email=f"subscriber{index}@gmail.com",
+                subscribed_via=self.serverowner,
+            )
+            StripeSubscription.objects.create(
+                subscriber=subscriber,
+                subscribed_via=self.serverowner,
+                plan=plan,
+                subscription_date=timezone.now(),
+                status=StripeSubscription.SubscriptionStatus.ACTIVE,
+            )
+
+    def test_dashboard_query_budget(self) -> None:
+        """Test the dashboard renders within a fixed number of queries."""
+        self.add_subscriptions(3)
+        # Warm up the choice server cache
+        self.client.get(reverse("dashboard"))
+
+        with self.assertNumQueries(DASHBOARD_QUERY_BUDGET):
+            response = self.client.get(reverse("dashboard"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["metrics"].plan_count, 3)
+
+    def test_dashboard_query_count_is_constant(self) -> None:
+        """Test the dashboard query count does not grow with the data."""
+        self.add_subscriptions(1)
+        # Warm up the choice server cache
+        self.client.get(reverse("dashboard"))
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(reverse("dashboard"))
+
+        self.add_subscriptions(10)
+        with CaptureQueriesContext(connection) as large:
+            self.client.get(reverse("dashboard"))
+
+        self.assertEqual(len(small), len(large))
+
+    def test_serverowner_pages_use_metrics(self) -> None:
+        """Test the serverowner list pages render with the metrics snapshot."""
+        self.add_subscriptions(2)
+
+        for name in (
+            "plans",
+            "subscribers",
+            "affiliates",
+            "pending_affiliate_payment",
+            "confirmed_affiliate_payment",
+        ):
+            response = self.client.get(reverse(name))
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.context["metrics"].total_subscribers, 2)
+
+
+class AffiliateListViewTestCase(TestCase):
+    """Test case for the serverowner affiliate list pages."""
+
+    def setUp(self) -> None:
+        """Set up an onboarded serverowner."""
+        cache.clear()
+        self.user = User.objects.create_user(
+            username="Pythonian",
+            is_serverowner=True,
+        )
+        ServerOwner.objects.filter(user=self.user).update(
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_onboarding=True,
+        )
+        self.serverowner = ServerOwner.objects.get(user=self.user)
+        Server.objects.create(
+            owner=self.serverowner,
+            server_id="1",
+            name="Pythonian Server",
+            choice_server=True,
+        )
+        self.client.force_login(self.user)
+
+    def add_affiliates(self, count) -> None:
+        """Create affiliates with an invitee, a payment detail and a pending payment."""
+        offset = Affiliate.objects.count()
+        for index in range(offset, offset + count):
+            user = User.objects.create(username=f"affiliate{index}")
+            subscriber = Subscriber.objects.create(
+                user=user,
+                discord_id=f"20{index}",
+                username=f"affiliate{index}",
+                email=f"affiliate{index}@gmail.com",
+                subscribed_via=self.serverowner,
+            )
+            affiliate = Affiliate.objects.create(
+                subscriber=subscriber,
+                discord_id=f"20{index}",
+                server_id="1",
+                serverowner=self.serverowner,
+                pending_commissions=Decimal("5.00"),
+            )
+            PaymentDetail.objects.create(affiliate=affiliate, body="IBAN")
+            AffiliatePayment.objects.create(
+                serverowner=self.serverowner,
+                affiliate=affiliate,
+                subscriber=subscriber,
+                amount=Decimal("5.00"),
+            )
+            AffiliateInvitee.objects.create(
+                affiliate=affiliate,
+                invitee_discord_id=f"30{index}",
+            )
+
+    def assert_constant_queries(self, name) -> None:
+        """Assert a page renders in the same number of queries as affiliates grow."""
+        self.add_affiliates(1)
+        # Warm up the choice server cache
+        self.client.get(reverse(name))
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(reverse(name))
+        self.assertContains(response, "affiliate0")
+
+        self.add_affiliates(20)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse(name))
+        self.assertContains(response, "affiliate20")
+
+        self.assertEqual(len(small), len(large))
+
+    def test_affiliates_constant_queries(self) -> None:
+        """Test the affiliates page does not query each affiliate."""
+        self.assert_constant_queries("affiliates")
+
+    def test_pending_affiliate_payment_constant_queries(self) -> None:
+        """Test the pending payments page does not query each affiliate."""
+        self.assert_constant_queries("pending_affiliate_payment")
+
+    def test_affiliates_sorting(self) -> None:
+        """Test the affiliates page ranks the affiliates by the requested statistic."""
+        self.add_affiliates(2)
+        AffiliateInvitee.objects.create(
+            affiliate=Affiliate.objects.get(discord_id="200"),
+            invitee_discord_id="400",
+        )
+
+        response = self.client.get(reverse("affiliates"), {"sort": "invites"})
+        ranked = [affiliate.pk for affiliate in response.context["affiliates"]]
+        self.assertEqual(ranked, ["200", "201"])
+        self.assertEqual(response.context["affiliates"][0].invite_count, 2)
+
+        response = self.client.get(reverse("affiliates"), {"sort": "unknown"})
+        self.assertEqual(response.context["sort"], "invites")
+
+    def test_affiliates_keyset_pages(self) -> None:
+        """Test the affiliates pages are sought after the last ranked affiliate."""
+        self.add_affiliates(27)
+        ranked = list(
+            self.serverowner.get_affiliate_leaderboard("invites").values_list(
+                "pk",
+                flat=True,
+            ),
+        )
+
+        def get_page(page):
+            response = self.client.get(
+                reverse("affiliates"),
+                {"sort": "invites", "page": page},
+            )
+            return response.context["affiliates"]
+
+        second = get_page(get_page(1).next_page_number())
+        with CaptureQueriesContext(connection) as queries:
+            third = get_page(second.next_page_number())
+        previous = get_page(third.previous_page_number())
+
+        self.assertEqual([affiliate.pk for affiliate in second], ranked[12:24])
+        self.assertEqual([affiliate.pk for affiliate in third], ranked[24:])
+        self.assertEqual([affiliate.pk for affiliate in previous], ranked[12:24])
+        self.assertFalse(
+            any("OFFSET" in query["sql"] for query in queries.captured_queries),
+        )
+
+
+class AffiliateInviteesViewTestCase(TestCase):
+    """Test case for the affiliate invitees page."""
+
+    def setUp(self) -> None:
+        """Set up an affiliate logged in as a subscriber."""
+        owner_user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=owner_user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+        )
+        self.user = User.objects.create_user(username="affiliate", is_subscriber=True)
+        Subscriber.objects.filter(user=self.user).update(
+            discord_id="200",
+            username="affiliate",
+            email="affiliate@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        self.affiliate = Affiliate.objects.create(
+            subscriber=Subscriber.objects.get(user=self.user),
+            discord_id="200",
+            server_id="1",
+            serverowner=self.serverowner,
+        )
+        self.client.force_login(self.user)
+
+    def add_invitees(self, count) -> None:
+        """Create invitees who signed up and were paid a commission for."""
+        offset = AffiliateInvitee.objects.count()
+        for index in range(offset, offset + count):
+            subscriber = Subscriber.objects.create(
+                user=User.objects.create(username=f"invitee{index}"),
+                discord_id=f"30{index}",
+                username=f"invitee{index}",
+                email=f"invitee{index}@gmail.com",
+                subscribed_via=self.serverowner,
+            )
+            AffiliateInvitee.objects.create(
+                affiliate=self.affiliate,
+                invitee_discord_id=f"30{index}",
+            )
+            AffiliatePayment.objects.create(
+                serverowner=self.serverowner,
+                affiliate=self.affiliate,
+                subscriber=subscriber,
+                amount=Decimal("2.00"),
+                paid=True,
+            )
+
+    def test_invitees_constant_queries(self) -> None:
+        """Test the invitees page does not query each invitee."""
+        self.add_invitees(1)
+        with CaptureQueriesContext(connection) as small:
+            response = self.client.get(reverse("affiliate_invitees"))
+        self.assertContains(response, "invitee0")
+        self.assertEqual(response.context["invitations"][0].paid_commission, 2)
+
+        self.add_invitees(5)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(reverse("affiliate_invitees"))
+        self.assertContains(response, "invitee5")
+
+        self.assertEqual(len(small), len(large))
+
+
+class ExportViewTestCase(TestCase):
+    """Test case for the exports of the serverowner's records."""
+
+    def setUp(self) -> None:
+        """Set up an onboarded serverowner with subscribers of its own and another's."""
+        self.user = User.objects.create_user(
+            username="Pythonian",
+            is_serverowner=True,
+        )
+        ServerOwner.objects.filter(user=self.user).update(
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_onboarding=True,
+        )
+        self.serverowner = ServerOwner.objects.get(user=self.user)
+        other = ServerOwner.objects.create(
+            user=User.objects.create(username="Other"),
+            discord_id="987654321",
+            username="Other",
+            subdomain="other",
+            email="other@gmail.com",
+        )
+        for index, (username, serverowner) in enumerate(
+            [("alice", self.serverowner), ("=cmd", self.serverowner), ("eve", other)],
+        ):
+            Subscriber.objects.create(
+                user=User.objects.create(username=f"subscriber{index}"),
+                discord_id=f"10{index}",
+                username=username,
+                email=f"subscriber{index}@gmail.com",
+                subscribed_via=serverowner,
+            )
+        self.client.force_login(self.user)
+
+    def test_csv_export_is_streamed(self) -> None:
+        """Test the subscribers of the serverowner are streamed as CSV."""
+        response = self.client.get(reverse("export", args=["subscribers", "csv"]))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "text/csv")
+        self.assertIn("attachment;", response["Content-Disposition"])
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0].split(",")[:3], ["id", "username", "email"])
+        self.assertEqual(len(lines), 3)
+        self.assertIn(",alice,", lines[1])
+        # Formulas are quoted so spreadsheets do not evaluate them
+        self.assertIn(",'=cmd,", lines[2])
+
+    def test_jsonl_export_is_streamed(self) -> None:
+        """Test the subscribers of the serverowner are streamed as JSON Lines."""
+        response = self.client.get(reverse("export", args=["subscribers", "jsonl"]))
+
+        rows = [
+            json.loads(line)
+            for line in b"".join(response.streaming_content).splitlines()
+        ]
+        self.assertEqual([row["username"] for row in rows], ["alice", "=cmd"])
+
+    def test_unknown_export_is_not_found(self) -> None:
+        """Test an unknown export or format is not found."""
+        for args in (["servers", "csv"], ["subscribers", "xlsx"]):
+            response = self.client.get(reverse("export", args=args))
+            self.assertEqual(response.status_code, 404)
+
+    @override_settings(EXPORT_STREAMING_ROW_LIMIT=1)
+    def test_large_export_is_emailed(self) -> None:
+        """Test a large export is written to a compressed file and emailed."""
+        response = self.client.get(reverse("export", args=["subscribers", "csv"]))
+
+        self.assertRedirects(response, reverse("subscribers"))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, ["pythonian@gmail.com"])
+        _, files = storages["exports"].listdir(str(self.serverowner.pk))
+        self.assertEqual(len(files), 1)
+        self.assertIn(files[0], mail.outbox[0].body)
+
+        response = self.client.get(reverse("export_download", args=files))
+        self.assertEqual(response.status_code, 200)
+        content = gzip.decompress(b"".join(response.streaming_content)).decode()
+        self.assertIn(",alice,", content)
+        self.assertNotIn("eve", content)
+
+    @override_settings(EXPORT_STREAMING_ROW_LIMIT=2)
+    def test_export_at_the_limit_is_streamed(self) -> None:
+        """Test an export of exactly the row limit is streamed without counting."""
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(
+                reverse("export", args=["subscribers", "csv"]),
+            )
+
+        self.assertTrue(response.streaming)
+        self.assertFalse(
+            any("COUNT(" in query["sql"] for query in queries.captured_queries),
+        )
+
+    def test_export_of_another_serverowner_is_not_found(self) -> None:
+        """Test export files are looked up under the serverowner only."""
+        storages["exports"].save("other/subscribers.csv.gz", ContentFile(b""))
+
+        response = self.client.get(
+            reverse("export_download", args=["subscribers.csv.gz"]),
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+
+class SubscriberListViewTestCase(TestCase):
+    """Test case for the paginated subscribers page of the serverowner."""
+
+    def setUp(self) -> None:
+        """Set up an onboarded serverowner with two pages of subscribers."""
+        self.user = User.objects.create_user(
+            username="Pythonian",
+            is_serverowner=True,
+        )
+        ServerOwner.objects.filter(user=self.user).update(
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_onboarding=True,
+        )
+        self.serverowner = ServerOwner.objects.get(user=self.user)
+        for index in range(15):
+            Subscriber.objects.create(
+                user=User.objects.create(username=f"subscriber{index}"),
+                discord_id=f"10{index}",
+                username=f"subscriber{index}",
+                email=f"subscriber{index}@gmail.com",
+                subscribed_via=self.serverowner,
+            )
+        self.client.force_login(self.user)
+
+    def test_next_page_is_linked_by_cursor(self) -> None:
+        """Test the next page is requested with the cursor of the first page."""
+        response = self.client.get(reverse("subscribers"))
+        first = response.context["subscribers"]
+        self.assertEqual((first.start_index(), first.end_index()), (1, 12))
+        self.assertContains(response, f"?page={first.next_page_number()}")
+
+        response = self.client.get(
+            reverse("subscribers"),
+            {"page": first.next_page_number()},
+        )
+        second = response.context["subscribers"]
+        self.assertEqual(second.number, 2)
+        self.assertEqual(len(second), 3)
+        self.assertFalse({row.pk for row in first} & {row.pk for row in second})
+
+
+class DiscordCallbackViewTestCase(TestCase):
+    """Test case for the Discord OAuth callback signing in users."""
+
+    def setUp(self) -> None:
+        """Start a Discord stand-in for a user owning two guilds."""
+        cache.clear()
+        self.standin = DiscordStandIn(
+            guilds=[
+                {"id": "1", "name": "Guild", "icon": None, "owner": True},
+                {"id": "2", "name": "Other", "icon": None, "owner": True},
+                {"id": "3", "name": "Joined", "icon": None, "owner": False},
+            ],
+        ).start()
+        self.discord_api = override_settings(DISCORD_API_URL=self.standin.url)
+        self.discord_api.enable()
+
+    def tearDown(self) -> None:
+        """Stop the stand-in."""
+        self.discord_api.disable()
+        self.standin.stop()
+
+    def test_serverowner_sign_in(self) -> None:
+        """Test a serverowner is created with its guilds and the steps are timed."""
+        response = self.client.get(
+            reverse("discord_callback"),
+            {"code": "code", "state": "state"},
+        )
+
+        self.assertRedirects(
+            response,
+            reverse("dashboard_view"),
+            fetch_redirect_response=False,
+        )
+        serverowner = ServerOwner.objects.get(username="Pythonian")
+        self.assertEqual(
+            sorted(serverowner.servers.values_list("server_id", flat=True)),
+            ["1", "2"],
+        )
+        self.assertEqual(
+            sorted(self.standin.requests),
+            [
+                ("GET", "/api/users/@me"),
+                ("GET", "/api/users/@me/guilds"),
+                ("POST", "/api/oauth2/token"),
+            ],
+        )
+        for step in ("total", "token", "profile"):
+            self.assertIn(f"{step};dur=", response["Server-Timing"])
+
+    def test_repeat_sign_in_refreshes_guilds(self) -> None:
+        """Test a later sign-in updates the guilds without duplicating them."""
+        params = {"code": "code", "state": "state"}
+        self.client.get(reverse("discord_callback"), params)
+        self.client.logout()
+        self.standin.guilds[0].update(name="Renamed", icon="abc")
+
+        self.client.get(reverse("discord_callback"), params)
+
+        server = Server.objects.get(server_id="1")
+        self.assertEqual((server.name, server.icon), ("Renamed", "abc"))
+        self.assertEqual(Server.objects.count(), 2)
+
+    def test_subscriber_sign_in_skips_guilds(self) -> None:
+        """Test the guilds of a subscriber are not requested."""
+        ServerOwner.objects.create(
+            user=User.objects.create(username="Owner"),
+            discord_id="987654321",
+            username="Owner",
+            subdomain="prontomaster",
+            email="owner@gmail.com",
+        )
+        session = self.client.session
+        session["referral_redirect"] = "prontomaster"
+        session.save()
+
+        self.client.get(
+            reverse("discord_callback"),
+            {"code": "code", "state": "subscriber"},
+        )
+
+        self.assertTrue(Subscriber.objects.filter(username="Pythonian").exists())
+        self.assertNotIn(("GET", "/api/users/@me/guilds"), self.standin.requests)
+
+    def test_rate_limited_sign_in_asks_to_retry(self) -> None:
+        """Test a sign-in rate limited for long is turned away with a message."""
+        self.standin.limited = 1
+        self.standin.retry_after = 30
+
+        response = self.client.get(
+            reverse("discord_callback"),
+            {"code": "code", "state": "state"},
+            follow=True,
+        )
+
+        self.assertRedirects(response, reverse("index"))
+        self.assertContains(response, "Please try again in 30 seconds.")
+        self.assertEqual(self.standin.requests, [("POST", "/api/oauth2/token")])
+        self.assertFalse(ServerOwner.objects.exists())
+
+    def test_unreachable_discord_asks_to_retry(self) -> None:
+        """Test a sign-in failing to reach Discord is turned away with a message."""
+        self.standin.stop()
+
+        with self.assertLogs("accounts.views", "ERROR"):
+            response = self.client.get(
+                reverse("discord_callback"),
+                {"code": "code", "state": "state"},
+                follow=True,
+            )
+
+        self.assertRedirects(response, reverse("index"))
+        self.assertContains(response, "communicating with Discord")
+        self.assertFalse(ServerOwner.objects.exists())
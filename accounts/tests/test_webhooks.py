@@ -0,0 +1,371 @@
+"""Test cases for the Stripe webhook endpoint and event inbox."""
+
+import hashlib
+import hmac
+import json
+import time
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from django.urls import reverse
+
+from accounts.models import (
+    Affiliate,
+    AffiliateInvitee,
+    AffiliatePayment,
+    ServerOwner,
+    StripeEvent,
+    StripePlan,
+    StripeSubscription,
+    Subscriber,
+    User,
+)
+from accounts.webhooks import (
+    STRIPE_EVENT_MAX_ATTEMPTS,
+    apply_stripe_event,
+    process_stripe_events,
+)
+
+WEBHOOK_SECRET = "whsec_test"  # noqa: S105
+
+
+def invoice_paid_event(event_id, subscription_id):
+    """Build the payload of an ``invoice.paid`` event."""
+    now = int(time.time())
+    return {
+        "id": event_id,
+        "object": "event",
+        "type": "invoice.paid",
+        "data": {
+            "object": {
+                "object": "invoice",
+                "subscription": subscription_id,
+                "status": "paid",
+                "created": now,
+                "lines": {
+                    "object": "list",
+                    "data": [{"period": {"start": now, "end": now + 2592000}}],
+                },
+            },
+        },
+    }
+
+
+@override_settings(STRIPE_WEBHOOK_SECRET=WEBHOOK_SECRET)
+class StripeWebhookTestCase(TestCase):
+    """Test case for storing webhook events in the inbox."""
+
+    def setUp(self) -> None:
+        """Forget the events delivered in other tests."""
+        cache.clear()
+
+    def post_event(self, event, secret=WEBHOOK_SECRET):
+        """Post a signed event to the webhook endpoint."""
+        payload = json.dumps(event)
+        timestamp = int(time.time())
+        signature = hmac.new(
+            secret.encode(),
+            f"{timestamp}.{payload}".encode(),
+            hashlib.sha256,
+        ).hexdigest()
+        return self.client.post(
+            reverse("stripe_webhook"),
+            data=payload,
+            content_type="application/json",
+            headers={"stripe-signature": f"t={timestamp},v1={signature}"},
+        )
+
+    def test_event_is_stored(self) -> None:
+        """Test a verified event is stored and processing is queued on commit."""
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+        self.assertEqual(response.status_code, 200)
+        inbox_event = StripeEvent.objects.get()
+        self.assertEqual(inbox_event.event_id, "evt_1")
+        self.assertEqual(inbox_event.type, "invoice.paid")
+        self.assertEqual(inbox_event.status, StripeEvent.EventStatus.PENDING)
+        self.assertEqual(inbox_event.payload["data"]["object"]["subscription"], "sub_1")
+        # The event is remembered and processed once committed
+        self.assertEqual(len(callbacks), 2)
+
+    def test_event_is_stored_in_constant_queries(self) -> None:
+        """Test the endpoint does not touch any table but the inbox."""
+        with self.assertNumQueries(1):
+            self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+    def test_redelivered_event_is_skipped(self) -> None:
+        """Test a redelivered event is acknowledged without any query."""
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+        with (
+            self.assertNumQueries(0),
+            self.captureOnCommitCallbacks() as callbacks,
+        ):
+            response = self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+        self.assertEqual(callbacks, [])
+
+    def test_event_is_remembered_once_committed(self) -> None:
+        """Test an event is not remembered until its inbox row is committed."""
+        with self.captureOnCommitCallbacks():
+            self.post_event(invoice_paid_event("evt_1", "sub_1"))
+        # The transaction of the delivery never committed
+        StripeEvent.objects.all().delete()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_redelivered_event_is_stored_once_without_cache(self) -> None:
+        """Test the inbox stores an event once even if the cache forgot it."""
+        self.post_event(invoice_paid_event("evt_1", "sub_1"))
+        cache.clear()
+        response = self.post_event(invoice_paid_event("evt_1", "sub_1"))
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(StripeEvent.objects.count(), 1)
+
+    def test_invalid_signature(self) -> None:
+        """Test an event with an invalid signature is rejected."""
+        response = self.post_event(invoice_paid_event("evt_1", "sub_1"), "wrong")
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(StripeEvent.objects.exists())
+
+
+class ProcessStripeEventsTestCase(TestCase):
+    """Test case for the batch consumer of the event inbox."""
+
+    def setUp(self) -> None:
+        """Set up a pending Stripe subscription."""
+        user = User.objects.create(username="Pythonian")
+        self.serverowner = ServerOwner.objects.create(
+            user=user,
+            discord_id="123456789",
+            username="Pythonian",
+            subdomain="prontomaster",
+            email="pythonian@gmail.com",
+            stripe_account_id="acct_1",
+        )
+        self.plan = StripePlan.objects.create(
+            serverowner=self.serverowner,
+            name="Plan",
+            amount=Decimal("10.00"),
+            description="Test plan",
+            interval_count=1,
+            discord_role_id="1",
+        )
+        subscriber_user = User.objects.create(username="subscriber")
+        subscriber = Subscriber.objects.create(
+            user=subscriber_user,
+            discord_id="100",
+            username="subscriber",
+            email="subscriber@gmail.com",
+            subscribed_via=self.serverowner,
+        )
+        self.subscription = StripeSubscription.objects.create(
+            subscriber=subscriber,
+            subscribed_via=self.serverowner,
+            plan=self.plan,
+            subscription_id="sub_1",
+        )
+
+    def store_event(self, payload):
+        """Store an event in the inbox."""
+        return StripeEvent.objects.create(
+            event_id=payload["id"],
+            type=payload["type"],
+            payload=payload,
+        )
+
+    def test_invoice_paid_is_applied(self) -> None:
+        """Test a paid invoice activates the subscription and credits the plan."""
+        inbox_event = self.store_event(invoice_paid_event("evt_1", "sub_1"))
+
+        self.assertEqual(process_stripe_events(), 1)
+
+        inbox_event.refresh_from_db()
+        self.subscription.refresh_from_db()
+        self.plan.refresh_from_db()
+        self.assertEqual(inbox_event.status, StripeEvent.EventStatus.PROCESSED)
+        self.assertIsNotNone(inbox_event.processed_at)
+        self.assertEqual(
+            self.subscription.status,
+            StripeSubscription.SubscriptionStatus.ACTIVE,
+        )
+        self.assertIsNotNone(self.subscription.expiration_date)
+        self.assertEqual(self.plan.subscriber_count, 1)
+        self.assertEqual(self.plan.active_subscriber_count, 1)
+
+    def create_affiliate(self):
+        """Create an affiliate who invited the subscriber."""
+        affiliate_user = User.objects.create(username="affiliate")
+        affiliate = Affiliate.objects.create(
+            subscriber=Subscriber.objects.create(
+                user=affiliate_user,
+                discord_id="200",
+                username="affiliate",
+                email="affiliate@gmail.com",
+                subscribed_via=self.serverowner,
+            ),
+            discord_id="200",
+            server_id="555",
+            serverowner=self.serverowner,
+        )
+        AffiliateInvitee.objects.create(affiliate=affiliate, invitee_discord_id="100")
+        return affiliate
+
+    def test_invoice_paid_credits_affiliate(self) -> None:
+        """Test a paid invoice of an invitee credits the affiliate commission once."""
+        ServerOwner.objects.filter(pk=self.serverowner.pk).update(
+            affiliate_commission=10,
+        )
+        affiliate = self.create_affiliate()
+        self.store_event(invoice_paid_event("evt_1", "sub_1"))
+
+        process_stripe_events()
+
+        affiliate.refresh_from_db()
+        self.serverowner.refresh_from_db()
+        payment = AffiliatePayment.objects.get()
+        self.assertEqual(payment.amount, Decimal("1.00"))
+        self.assertEqual(affiliate.pending_commissions, Decimal("1.00"))
+        self.assertEqual(self.serverowner.total_pending_commissions, Decimal("1.00"))
+        self.assertEqual(self.serverowner.total_earnings, Decimal("10.00"))
+
+    def test_reactivation_is_not_a_new_conversion(self) -> None:
+        """Test an invoice paid after a failed payment does not convert the invitee again."""
+        affiliate = self.create_affiliate()
+        self.store_event(invoice_paid_event("evt_1", "sub_1"))
+        process_stripe_events()
+        self.store_event(
+            {
+                "id": "evt_2",
+                "object": "event",
+                "type": "invoice.payment_failed",
+                "data": {"object": {"object": "invoice", "subscription": "sub_1"}},
+            },
+        )
+        process_stripe_events()
+        self.subscription.refresh_from_db()
+        self.assertEqual(
+            self.subscription.status,
+            StripeSubscription.SubscriptionStatus.EXPIRED,
+        )
+        renewal = invoice_paid_event("evt_3", "sub_1")
+        renewal["data"]["object"]["lines"]["data"][0]["period"]["end"] += 2592000
+        self.store_event(renewal)
+
+        process_stripe_events()
+
+        affiliate.refresh_from_db()
+        self.assertEqual(affiliate.converted_count, 1)
+        self.assertEqual(affiliate.active_count, 1)
+
+    def test_event_is_applied_once(self) -> None:
+        """Test an event already applied by another worker is skipped."""
+        inbox_event = self.store_event(invoice_paid_event("evt_1", "sub_1"))
+        stale_event = StripeEvent.objects.get(pk=inbox_event.pk)
+
+        process_stripe_events()
+        self.assertTrue(apply_stripe_event(stale_event))
+
+        self.plan.refresh_from_db()
+        self.serverowner.refresh_from_db()
+        self.assertEqual(self.plan.subscriber_count, 1)
+        self.assertEqual(self.plan.subscription_earnings, Decimal("10.00"))
+
+    def test_renewal_is_credited_without_new_subscriber(self) -> None:
+        """Test a renewal invoice credits the plan without counting a new subscriber."""
+        self.store_event(invoice_paid_event("evt_1", "sub_1"))
+        process_stripe_events()
+        renewal = invoice_paid_event("evt_2", "sub_1")
+        renewal["data"]["object"]["lines"]["data"][0]["period"]["end"] += 2592000
+        self.store_event(renewal)
+        # Another delivery of the first invoice does not extend the subscription
+        self.store_event(invoice_paid_event("evt_3", "sub_1"))
+
+        process_stripe_events()
+
+        self.plan.refresh_from_db()
+        self.serverowner.refresh_from_db()
+        self.assertEqual(self.plan.subscriber_count, 1)
+        self.assertEqual(self.plan.active_subscriber_count, 1)
+        self.assertEqual(self.plan.subscription_earnings, Decimal("20.00"))
+        self.assertEqual(self.serverowner.total_earnings, Decimal("20.00"))
+
+    def test_events_are_processed_in_batches(self) -> None:
+        """Test all pending events are handled across several batches."""
+        for index in range(5):
+            self.store_event(
+                {
+                    "id": f"evt_{index}",
+                    "object": "event",
+                    "type": "customer.created",
+                    "data": {"object": {"object": "customer"}},
+                },
+            )
+
+        self.assertEqual(process_stripe_events(batch_size=2), 5)
+        self.assertFalse(StripeEvent.pending_events.exists())
+
+    def test_account_updated_is_applied(self) -> None:
+        """Test an updated account completes the Stripe onboarding."""
+        self.store_event(
+            {
+                "id": "evt_1",
+                "object": "event",
+                "type": "account.updated",
+                "data": {
+                    "object": {
+                        "id": "acct_1",
+                        "object": "account",
+                        "charges_enabled": True,
+                        "payouts_enabled": True,
+                        "details_submitted": True,
+                    },
+                },
+            },
+        )
+
+        process_stripe_events()
+
+        self.serverowner.refresh_from_db()
+        self.assertTrue(self.serverowner.stripe_onboarding)
+
+    def test_failed_event_is_retried(self) -> None:
+        """Test an event of an unknown subscription stays pending until it fails."""
+        inbox_event = self.store_event(invoice_paid_event("evt_1", "sub_unknown"))
+
+        process_stripe_events()
+
+        inbox_event.refresh_from_db()
+        self.assertEqual(inbox_event.status, StripeEvent.EventStatus.PENDING)
+        self.assertEqual(inbox_event.attempts, 1)
+        self.assertIn("DoesNotExist", inbox_event.error)
+
+        for _ in range(STRIPE_EVENT_MAX_ATTEMPTS - 1):
+            process_stripe_events()
+
+        inbox_event.refresh_from_db()
+        self.assertEqual(inbox_event.status, StripeEvent.EventStatus.FAILED)
+        self.assertEqual(inbox_event.attempts, STRIPE_EVENT_MAX_ATTEMPTS)
+
+    def test_failed_event_does_not_block_batch(self) -> None:
+        """Test a failing event does not roll back the other events of its batch."""
+        failing = self.store_event(invoice_paid_event("evt_1", "sub_unknown"))
+        paid = self.store_event(invoice_paid_event("evt_2", "sub_1"))
+
+        process_stripe_events()
+
+        failing.refresh_from_db()
+        paid.refresh_from_db()
+        self.assertEqual(failing.status, StripeEvent.EventStatus.PENDING)
+        self.assertEqual(paid.status, StripeEvent.EventStatus.PROCESSED)
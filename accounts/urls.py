@@ -115,6 +115,16 @@ urlpatterns = [
                     views.confirmed_affiliate_payment,
                     name="confirmed_affiliate_payment",
                 ),
+                path(
+                    "export/<str:name>/<str:export_format>/",
+                    views.export,
+                    name="export",
+                ),
+                path(
+                    "exports/<str:filename>/",
+                    views.export_download,
+                    name="export_download",
+                ),
             ],
         ),
     ),
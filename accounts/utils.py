@@ -2,8 +2,20 @@
 
 import hashlib
 import hmac
+import math
+import threading
+import time
+from collections.abc import Sequence
+from contextlib import contextmanager
+from datetime import datetime
 
+from django.core import signing
 from django.core.paginator import EmptyPage, PageNotAnInteger, Paginator
+from django.db import connections
+from django.db.models import Q, sql
+from django.utils.functional import cached_property
+
+from .counts import get_count_provider
 
 
 def mk_paginator(request, items, num_items):
@@ -30,6 +42,312 @@ def mk_paginator(request, items, num_items):
     return items
 
 
+class CursorPaginator:
+    """Paginator seeking pages from the ``(created, id)`` of the rows of another page.
+
+    Instead of ``OFFSET``, the rows of the next or previous page are filtered on
+    the ``(created, id)`` of the last or first row of the current one, newest
+    first, so a deep page costs the same as the first with an index ending in
+    ``created, id``. Pages are requested with the ``page`` values the pages
+    give as their next and previous page numbers, which are signed cursors,
+    ``1`` for the first page or ``last`` for the last one. The rows are only
+    counted to number the last page, so a page after a cursor costs one query.
+
+    Attributes:
+        object_list (QuerySet): The rows to paginate, in the order of the pages.
+        per_page (int): The number of rows per page.
+        count_key (tuple): The serverowner ID and name of the count of the rows
+            for the count provider, or None to count them exactly.
+        page_range (range): The number of the page last returned.
+    """
+
+    ordering = ("-created", "-pk")
+    cursor_salt = "accounts.utils.CursorPaginator"
+    # The ``page`` value of the last page, linked to without counting the rows
+    last_page_number = "last"
+
+    def __init__(self, object_list, per_page, count_key=None):
+        """Initialize the paginator with the queryset, page size and count key."""
+        self.object_list = object_list.order_by(*self.ordering)
+        self.per_page = int(per_page)
+        self.count_key = count_key
+        self.page_range = range(1, 2)
+
+    @cached_property
+    def count(self):
+        """int: The total number of rows, only counted when displayed."""
+        if self.count_key is None:
+            return self.object_list.count()
+        return get_count_provider().count(self.object_list, *self.count_key)
+
+    @property
+    def num_pages(self):
+        """int: The total number of pages, at least one."""
+        return max(1, math.ceil(self.count / self.per_page))
+
+    def page(self, value):
+        """Return the page of a ``page`` value.
+
+        Only the returned page is numbered in ``page_range`` afterwards, as
+        there is no cursor to the pages around it.
+
+        Args:
+            value (str): A cursor, or a page number; a page number other than
+                the last one or beyond returns the first page.
+
+        Returns:
+            CursorPage: The page.
+        """
+        page = self.seek(value)
+        self.page_range = range(page.number, page.number + 1)
+        return page
+
+    def seek(self, value):
+        """Fetch the rows of the page of a ``page`` value."""
+        try:
+            direction, number, key = signing.loads(value, salt=self.cursor_salt)
+            if direction == "next":
+                rows = self.rows_after(key)
+            else:
+                rows = self.rows_before(key)
+        except (signing.BadSignature, TypeError, ValueError):
+            if value == self.last_page_number:
+                return self.last_page()
+            try:
+                number = int(value)
+            except (TypeError, ValueError):
+                number = 1
+            if number > 1 and number >= self.num_pages:
+                return self.last_page()
+            return self.first_page()
+
+        rows = list(rows[: self.per_page + 1])
+        if direction == "next":
+            if not rows:
+                return self.last_page()
+            return CursorPage(
+                rows[: self.per_page],
+                number,
+                self,
+                has_previous=True,
+                has_next=len(rows) > self.per_page,
+            )
+
+        if not rows:
+            return self.first_page()
+        if len(rows) <= self.per_page:
+            # The first rows, fewer than a page when sought back from the last page
+            return CursorPage(
+                rows[::-1],
+                1,
+                self,
+                has_previous=False,
+                has_next=True,
+            )
+        return CursorPage(
+            rows[self.per_page - 1 :: -1],
+            max(number, 2),
+            self,
+            has_previous=True,
+            has_next=True,
+        )
+
+    def rows_after(self, key):
+        """Select the rows after the row of a key, in the order of the pages.
+
+        Args:
+            key (list): The key of a row, see ``get_key``.
+
+        Returns:
+            QuerySet: The rows.
+        """
+        created, pk = key
+        created = datetime.fromisoformat(created)
+        return self.object_list.filter(
+            Q(created__lte=created),
+            Q(created__lt=created) | Q(pk__lt=pk),
+        )
+
+    def rows_before(self, key):
+        """Select the rows before the row of a key, nearest first.
+
+        Args:
+            key (list): The key of a row, see ``get_key``.
+
+        Returns:
+            QuerySet: The rows.
+        """
+        created, pk = key
+        created = datetime.fromisoformat(created)
+        return self.object_list.reverse().filter(
+            Q(created__gte=created),
+            Q(created__gt=created) | Q(pk__gt=pk),
+        )
+
+    def get_key(self, row):
+        """Return the key of a row the rows after or before it are sought from."""
+        return (row.created.isoformat(), str(row.pk))
+
+    def first_page(self):
+        """Return the first page."""
+        rows = list(self.object_list[: self.per_page + 1])
+        return CursorPage(
+            rows[: self.per_page],
+            1,
+            self,
+            has_previous=False,
+            has_next=len(rows) > self.per_page,
+        )
+
+    def last_page(self):
+        """Return the last page, holding the last ``per_page`` rows.
+
+        The rows are read from the end rather than sized from the count, which
+        may be an estimate, and the pages before it are sought back from it.
+        """
+        rows = list(self.object_list.reverse()[: self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        return CursorPage(
+            rows[self.per_page - 1 :: -1] if has_previous else rows[::-1],
+            max(self.num_pages, 2) if has_previous else 1,
+            self,
+            has_previous=has_previous,
+            has_next=False,
+        )
+
+    def get_cursor(self, direction, number, row):
+        """Return the signed cursor of the page before or after a row.
+
+        Args:
+            direction (str): ``next`` for the page after the row, ``previous``
+                for the page before it.
+            number (int): The number of the page.
+            row (Model): The last row of the current page for the next one,
+                its first row for the previous one.
+
+        Returns:
+            str: The cursor.
+        """
+        return signing.dumps(
+            (direction, number, self.get_key(row)),
+            salt=self.cursor_salt,
+        )
+
+
+class LeaderboardPaginator(CursorPaginator):
+    """Paginator seeking the pages of an affiliate leaderboard from its ranked rows.
+
+    The rows after or before an affiliate are those ranked after or before it,
+    see ``AffiliateQuerySet.leaderboard``, so a cursor only holds the primary
+    key of the affiliate.
+
+    Attributes:
+        affiliates (QuerySet): The affiliates to rank.
+        sort (str): The statistic the affiliates are ranked by.
+    """
+
+    cursor_salt = "accounts.utils.LeaderboardPaginator"
+
+    def __init__(self, affiliates, per_page, sort, count_key=None):
+        """Initialize the paginator with the affiliates, page size and sort key."""
+        self.affiliates = affiliates
+        self.sort = sort
+        self.object_list = affiliates.leaderboard(sort)
+        self.per_page = int(per_page)
+        self.count_key = count_key
+        self.page_range = range(1, 2)
+
+    def rows_after(self, key):
+        """Select the affiliates ranked after the affiliate of a key."""
+        return self.affiliates.leaderboard(self.sort, after=key)
+
+    def rows_before(self, key):
+        """Select the affiliates ranked before the affiliate of a key, nearest first."""
+        return self.affiliates.leaderboard(self.sort, before=key).reverse()
+
+    def get_key(self, row):
+        """Return the primary key of an affiliate."""
+        return row.pk
+
+
+class CursorPage(Sequence):
+    """A page of a CursorPaginator, with the interface of a Django ``Page``.
+
+    Attributes:
+        object_list (list): The rows of the page.
+        number (int): The number of the page.
+        paginator (CursorPaginator): The paginator of the page.
+    """
+
+    def __init__(self, object_list, number, paginator, *, has_previous, has_next):
+        """Initialize the page with its rows and whether pages surround it."""
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self._has_previous = has_previous
+        self._has_next = has_next
+
+    def __repr__(self) -> str:
+        """Return a string representation of the page."""
+        return f"<Page {self.number} of a cursor paginator>"
+
+    def __len__(self) -> int:
+        """Return the number of rows of the page."""
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        """Return a row or a slice of the rows of the page."""
+        return self.object_list[index]
+
+    def has_next(self):
+        """Return whether there is a page after this one."""
+        return self._has_next
+
+    def has_previous(self):
+        """Return whether there is a page before this one."""
+        return self._has_previous
+
+    def has_other_pages(self):
+        """Return whether there is a page before or after this one."""
+        return self._has_next or self._has_previous
+
+    def next_page_number(self):
+        """Return the cursor of the next page."""
+        return self.paginator.get_cursor("next", self.number + 1, self[-1])
+
+    def previous_page_number(self):
+        """Return the cursor of the previous page."""
+        return self.paginator.get_cursor("previous", self.number - 1, self[0])
+
+    def start_index(self):
+        """Return the 1-based index of the first row of the page."""
+        if not self.object_list:
+            return 0
+        return (self.number - 1) * self.paginator.per_page + 1
+
+    def end_index(self):
+        """Return the 1-based index of the last row of the page."""
+        return self.start_index() + len(self) - 1 if self.object_list else 0
+
+
+def mk_cursor_paginator(request, items, num_items, count_key=None):
+    """Create a cursor paginator for querysets of large lists.
+
+    Args:
+        request (HttpRequest): The current request object.
+        items (QuerySet): The queryset to be paginated, whose model has a
+            ``created`` field.
+        num_items (int): The number of items to be displayed per page.
+        count_key (tuple): The serverowner ID and name of the count of the
+            items for the count provider, or None to count them exactly.
+
+    Returns:
+        CursorPage: A paginated queryset representing the current page.
+    """
+    paginator = CursorPaginator(items, num_items, count_key)
+    return paginator.page(request.GET.get("page", 1))
+
+
 def create_hmac_signature(data, api_secret_key):
     """Create an HMAC signature for the provided data.
 
@@ -43,3 +361,101 @@ def create_hmac_signature(data, api_secret_key):
     key_bytes = bytes(api_secret_key, "latin-1")
     data_bytes = bytes(data, "latin-1")
     return hmac.new(key_bytes, data_bytes, hashlib.sha512).hexdigest()
+
+
+def update_returning(queryset, values, returning):
+    """Update the rows of a queryset and return fields of the updated rows.
+
+    Runs a single ``UPDATE ... RETURNING`` statement, supported by PostgreSQL and
+    SQLite 3.35+, instead of selecting the rows and updating them afterwards.
+
+    Args:
+        queryset (QuerySet): The rows to update.
+        values (dict): The new values keyed by field name. Fields with
+            ``auto_now`` are not updated unless given.
+        returning (list): The names of the fields to return.
+
+    Returns:
+        list: A tuple of the returned field values for each updated row.
+    """
+    query = queryset.query.chain(sql.UpdateQuery)
+    query.add_update_values(values)
+    compiler = query.get_compiler(queryset.db)
+    compiler.pre_sql_setup()
+    update_sql, params = compiler.as_sql()
+    if not update_sql:
+        return []
+
+    connection = connections[queryset.db]
+    fields = [queryset.model._meta.get_field(name) for name in returning]  # noqa: SLF001
+    columns = ", ".join(connection.ops.quote_name(field.column) for field in fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f"{update_sql} RETURNING {columns}", params)
+        rows = cursor.fetchall()
+    # Convert the values like a query would, e.g. to aware datetimes
+    table = queryset.model._meta.db_table  # noqa: SLF001
+    converters = compiler.get_converters([field.get_col(table) for field in fields])
+    if converters:
+        rows = compiler.apply_converters(rows, converters)
+    return [
+        tuple(field.to_python(value) for field, value in zip(fields, row, strict=True))
+        for row in rows
+    ]
+
+
+class RateLimiter:
+    """Thread-safe limiter spacing out calls to at most ``rate`` per second.
+
+    Attributes:
+        rate (float): The maximum number of calls per second, unlimited when falsy.
+    """
+
+    def __init__(self, rate):
+        """Initialize the limiter with the allowed number of calls per second."""
+        self.rate = rate
+        self._lock = threading.Lock()
+        self._next_call = 0.0
+
+    def wait(self):
+        """Block until the next call is allowed."""
+        if not self.rate:
+            return
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next_call - now
+            self._next_call = max(now, self._next_call) + 1 / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+
+class StepTimings:
+    """Durations of the steps of a request, for its logs and ``Server-Timing`` header.
+
+    Attributes:
+        durations (dict): The seconds spent on each step, keyed by name, in the
+            order the steps ran.
+    """
+
+    def __init__(self):
+        """Initialize the timings without any step."""
+        self.durations = {}
+
+    @contextmanager
+    def step(self, name):
+        """Time the code run in the context as a step.
+
+        Args:
+            name (str): The name of the step, a token of ``Server-Timing``.
+        """
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.durations[name] = time.monotonic() - started
+
+    def __str__(self) -> str:
+        """Return the timings in milliseconds as a ``Server-Timing`` header value."""
+        return ", ".join(
+            f"{name};dur={duration * 1000:.1f}"
+            for name, duration in self.durations.items()
+        )
@@ -1,12 +1,12 @@
 """Business logic functions."""
 
 import logging
+import math
 import random
 import string
 from datetime import datetime, timedelta, timezone
 from decimal import Decimal
 
-import requests
 import stripe
 from django.conf import settings
 from django.contrib import messages
@@ -14,9 +14,10 @@ from django.contrib.auth import login
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.views import LogoutView
 from django.core.exceptions import ObjectDoesNotExist
+from django.core.files.storage import storages
 from django.db import transaction
 from django.db.models import F
-from django.http import Http404
+from django.http import FileResponse, Http404, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.views.decorators.http import require_POST
@@ -24,11 +25,26 @@ from requests.exceptions import RequestException
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 
+from .clients import coinpayments_request
+from .context_processors import invalidate_choice_server
+from .counts import invalidate_counts
 from .decorators import (
     onboarding_completed,
     redirect_authenticated_user,
     stripe_onboarding_required,
 )
+from .discord import (
+    DiscordRateLimitedError,
+    discord_profile_requests,
+    discord_token_request,
+)
+from .exports import (
+    EXPORT_FORMATS,
+    EXPORTS,
+    export_filename,
+    export_lines,
+    export_to_file,
+)
 from .forms import (
     CoinPaymentDetailForm,
     CoinpaymentsOnboardingForm,
@@ -37,10 +53,11 @@ from .forms import (
     StripePaymentDetailForm,
     StripePlanForm,
 )
+from .middleware import get_serverowner_or_404, get_subscriber_or_404
 from .models import (
     Affiliate,
-    AffiliateInvitee,
     AffiliatePayment,
+    AffiliateQuerySet,
     CoinPlan,
     CoinSubscription,
     Server,
@@ -50,11 +67,20 @@ from .models import (
     Subscriber,
     User,
 )
+from .subscriptions import (
+    SubscriptionPayment,
+    activate_subscriptions,
+    deactivate_subscriptions,
+)
 from .tasks import check_coin_transaction_status, send_affiliate_email
-from .utils import create_hmac_signature, mk_paginator
+from .utils import (
+    LeaderboardPaginator,
+    StepTimings,
+    mk_cursor_paginator,
+    mk_paginator,
+)
 
 discord_oauth2_authorization_url = "https://discord.com/oauth2/authorize"
-discord_token_url = "https://discord.com/api/oauth2/token"  # noqa: S105
 
 logger = logging.getLogger(__name__)
 stripe.api_key = settings.STRIPE_API_KEY
@@ -108,7 +134,42 @@ def subscribe_redirect(request):
 
 @redirect_authenticated_user
 def discord_callback(request):
-    """Handles the callback URL for Discord OAuth authorization."""
+    """Handles the callback URL for Discord OAuth authorization.
+
+    The duration of each step of the sign-in is logged and sent in the
+    ``Server-Timing`` header of the response. A sign-in rate limited by
+    Discord for longer than ``settings.DISCORD_RATE_LIMIT_MAX_WAIT``, or
+    failing to reach Discord, is turned away with a message to try again.
+    """
+    timings = StepTimings()
+    with timings.step("total"):
+        try:
+            response = complete_discord_login(request, timings)
+        except DiscordRateLimitedError as error:
+            messages.error(
+                request,
+                "Discord is busy signing in other users. Please try again in "
+                f"{math.ceil(error.retry_after)} seconds.",
+            )
+            response = redirect("index")
+        except RequestException:
+            logger.exception("Discord API request failed.")
+            messages.error(
+                request,
+                "An error occurred while communicating with Discord. Please try again later.",
+            )
+            response = redirect("index")
+    response["Server-Timing"] = str(timings)
+    logger.info("Discord sign-in timings: %s", timings)
+    return response
+
+
+def complete_discord_login(request, timings):
+    """Sign in the user of a Discord OAuth authorization.
+
+    After the token exchange, the profile of the user and the guilds of a
+    serverowner are fetched concurrently.
+    """
     # Retrieve values from the URL parameters
     code = request.GET.get("code")
     state = request.GET.get("state")
@@ -127,32 +188,23 @@ def discord_callback(request):
         return redirect("index")
 
     if code:
-        # Prepare the payload for the token request
+        # Obtain the access token
         redirect_uri = request.build_absolute_uri(reverse("discord_callback"))
-        payload = {
-            "client_id": settings.DISCORD_CLIENT_ID,
-            "client_secret": settings.DISCORD_CLIENT_SECRET,
-            "grant_type": "authorization_code",
-            "code": code,
-            "redirect_uri": redirect_uri,
-            "scope": "email identify connections guilds",
-        }
-
-        # Make the POST request to obtain the access token
-        token_url = discord_token_url
-        response = requests.post(token_url, data=payload)
+        with timings.step("token"):
+            response = discord_token_request(
+                code,
+                redirect_uri,
+                "email identify connections guilds",
+            )
 
         if response.status_code == HTTP_STATUS_200:
             access_token = response.json().get("access_token")
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {access_token}",
-            }
-
-            response = requests.get(
-                "https://discord.com/api/users/@me",
-                headers=headers,
-            )
+            # Subscribers only grant access to their user information
+            names = ["user"] if state == "subscriber" else ["user", "guilds"]
+            with timings.step("profile"):
+                responses = discord_profile_requests(access_token, names)
+
+            response = responses["user"]
             if response.status_code == HTTP_STATUS_200:
                 # Get the user information from the response
                 user_info = response.json()
@@ -167,25 +219,31 @@ def discord_callback(request):
                             username=user_info["username"],
                             is_subscriber=True,
                         )
-                        # Update the subscriber object created by the signal.
+                        # Update the subscriber object created by the signal and
+                        # connect it to the referring serverowner
                         subscriber = Subscriber.objects.get(user=user)
                         subscriber.discord_id = user_info.get("id")
                         subscriber.username = user_info.get("username")
                         subscriber.avatar = user_info.get("avatar", "")
                         subscriber.email = user_info.get("email")
-                        subscriber.save()
-                        # Connect the subscriber to the referring serverowner
-                        serverowner = ServerOwner.objects.get(subdomain=referral)
-                        subscriber.subscribed_via = serverowner
-                        subscriber.save()
+                        subscriber.subscribed_via = ServerOwner.objects.with_subdomain(
+                            referral,
+                        ).get()
+                        subscriber.save(
+                            update_fields=[
+                                "discord_id",
+                                "username",
+                                "avatar",
+                                "email",
+                                "subscribed_via",
+                                "updated",
+                            ],
+                        )
                     login(request, user)
                     return redirect("dashboard_view")
 
                 # This is a serverowner
-                guild_response = requests.get(
-                    "https://discord.com/api/users/@me/guilds",
-                    headers=headers,
-                )
+                guild_response = responses["guilds"]
                 if guild_response.status_code == HTTP_STATUS_200:
                     # Gets all the discord servers joined by the user
                     server_list = guild_response.json()
@@ -230,13 +288,12 @@ def discord_callback(request):
                     serverowner.avatar = user_info.get("avatar", "")
                     serverowner.email = user_info.get("email")
                     serverowner.save()
-                    # Save server objects associated with the serverowner
-                    for server in owned_servers:
-                        owner_server = Server.objects.create(owner=serverowner)
-                        owner_server.server_id = server["id"]
-                        owner_server.name = server["name"]
-                        owner_server.icon = server["icon"]
-                        owner_server.save()
+                # Create the servers of a new serverowner, or refresh their
+                # names and icons on later logins
+                serverowner = ServerOwner.objects.filter(user=user).first()
+                if serverowner is not None:
+                    Server.objects.sync_guilds(serverowner, owned_servers)
+                    invalidate_choice_server(user.pk)
                 login(request, user)
                 return redirect("dashboard_view")
             messages.error(
@@ -254,7 +311,7 @@ def discord_callback(request):
 @login_required
 def onboarding(request):
     """Handle the onboarding of a Serverowner."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
     if serverowner.stripe_account_id and not serverowner.stripe_onboarding:
         return redirect("collect_user_info")
     if serverowner.stripe_onboarding or serverowner.coinpayment_onboarding:
@@ -294,7 +351,7 @@ def onboarding(request):
 @login_required
 def onboarding_crypto(request):
     """Handle the onboarding process for connecting with coinpayment."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
     try:
         if serverowner.coinpayment_onboarding:
             return redirect("dashboard")
@@ -315,15 +372,11 @@ def onboarding_crypto(request):
             api_public_key = form.cleaned_data["coinpayment_api_public_key"]
             try:
                 # Make the API request to verify the coinpayment API keys
-                endpoint = "https://www.coinpayments.net/api.php"
-                data = f"version=1&cmd=get_basic_info&key={api_public_key}&format=json"
-                headers = {
-                    "Content-Type": "application/x-www-form-urlencoded",
-                    "HMAC": create_hmac_signature(data, api_secret_key),
-                }
-                response = requests.post(endpoint, data=data, headers=headers)
-                response.raise_for_status()
-                result = response.json()["result"]
+                result = coinpayments_request(
+                    "get_basic_info",
+                    api_public_key,
+                    api_secret_key,
+                )["result"]
                 if result:
                     serverowner.coinpayment_api_secret_key = api_secret_key
                     serverowner.coinpayment_api_public_key = api_public_key
@@ -366,7 +419,7 @@ def dashboard_view(request):
     user = request.user
 
     if user.is_serverowner:
-        if not user.serverowner.subdomain:
+        if not request.profile.serverowner.subdomain:
             return redirect("onboarding")
         return redirect("dashboard")
 
@@ -387,7 +440,7 @@ def dashboard_view(request):
 @stripe_onboarding_required
 def create_stripe_account(request):
     """Create a Stripe account for the user."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     connected_account = stripe.Account.create(
         type="standard",
@@ -408,7 +461,7 @@ def create_stripe_account(request):
 @stripe_onboarding_required
 def collect_user_info(request):
     """Collect additional user info for Stripe onboarding."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     # Generate an account link for the onboarding process
     account_link = stripe.AccountLink.create(
@@ -426,7 +479,7 @@ def collect_user_info(request):
 @stripe_onboarding_required
 def stripe_refresh(request):
     """Handle refreshing the Stripe account information."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     # Retrieve the Stripe account ID from the request or the Stripe API response
     stripe_account_id = request.GET.get("account_id")
@@ -457,11 +510,12 @@ def delete_account(request):
 @onboarding_completed
 def dashboard(request):
     """View for rendering the serverowner's dashboard."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     template = "serverowner/dashboard.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "discord_client_id": settings.DISCORD_CLIENT_ID,
     }
 
@@ -472,7 +526,7 @@ def dashboard(request):
 @onboarding_completed
 def plans(request):
     """View to display a serverowner's plans and handle new plan creation."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
     coinpayment_onboarding = serverowner.coinpayment_onboarding
 
     if request.method == "POST":
@@ -537,6 +591,7 @@ def plans(request):
     template = "serverowner/plans/list.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "form": form,
         "plans": plans,
     }
@@ -548,13 +603,18 @@ def plans(request):
 @onboarding_completed
 def plan_detail(request, plan_id):
     """View to display detailed information about a specific plan."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
     coinpayment_onboarding = serverowner.coinpayment_onboarding
 
     plan_model = CoinPlan if coinpayment_onboarding else StripePlan
     plan = get_object_or_404(plan_model, id=plan_id, serverowner=serverowner)
     subscribers = plan.get_plan_subscribers()
-    subscribers = mk_paginator(request, subscribers, PAGINATION_ITEMS)
+    subscribers = mk_cursor_paginator(
+        request,
+        subscribers,
+        PAGINATION_ITEMS,
+        (serverowner.pk, f"plan-subscriptions:{plan.pk}"),
+    )
 
     plan_form = CoinPlanForm if coinpayment_onboarding else StripePlanForm
 
@@ -612,7 +672,7 @@ def plan_detail(request, plan_id):
 @require_POST
 def deactivate_plan(request):
     """View to handle the deactivation of a plan."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     try:
         plan_model = CoinPlan if serverowner.coinpayment_onboarding else StripePlan
@@ -668,14 +728,20 @@ def deactivate_plan(request):
 @onboarding_completed
 def subscribers(request):
     """Display the subscribers of a serverowner's plans."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
 
     subscribers = serverowner.get_subscribed_users()
-    subscribers = mk_paginator(request, subscribers, PAGINATION_ITEMS)
+    subscribers = mk_cursor_paginator(
+        request,
+        subscribers,
+        PAGINATION_ITEMS,
+        (serverowner.pk, "subscribers"),
+    )
 
     template = "serverowner/subscribers/list.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "subscribers": subscribers,
     }
 
@@ -688,11 +754,16 @@ def subscriber_detail(request, subscriber_id):
     """View to display information about a subscriber."""
     subscriber = get_object_or_404(Subscriber, id=subscriber_id)
     subscriptions = subscriber.get_subscriptions()
-    subscriptions = mk_paginator(request, subscriptions, PAGINATION_ITEMS)
+    subscriptions = mk_cursor_paginator(
+        request,
+        subscriptions,
+        PAGINATION_ITEMS,
+        (subscriber.subscribed_via_id, f"subscriber-subscriptions:{subscriber.pk}"),
+    )
 
     subscription_model = (
         CoinSubscription
-        if request.user.serverowner.coinpayment_onboarding
+        if request.profile.serverowner.coinpayment_onboarding
         else StripeSubscription
     )
 
@@ -718,14 +789,23 @@ def subscriber_detail(request, subscriber_id):
 @onboarding_completed
 def affiliates(request):
     """Display a list of affiliates associated with the serverowner."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
-    affiliates = Affiliate.objects.filter(serverowner=serverowner)
-    affiliates = mk_paginator(request, affiliates, PAGINATION_ITEMS)
+    serverowner = get_serverowner_or_404(request)
+    sort = request.GET.get("sort")
+    if sort not in AffiliateQuerySet.LEADERBOARD_ORDERINGS:
+        sort = "invites"
+    affiliates = LeaderboardPaginator(
+        serverowner.get_affiliates(),
+        PAGINATION_ITEMS,
+        sort,
+        (serverowner.pk, "affiliates"),
+    ).page(request.GET.get("page", 1))
 
     template = "serverowner/affiliate/list.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "affiliates": affiliates,
+        "sort": sort,
     }
 
     return render(request, template, context)
@@ -735,8 +815,10 @@ def affiliates(request):
 @onboarding_completed
 def affiliate_detail(request, subscriber_id):
     """Display information about an affiliate and their invitees."""
-    subscriber = get_object_or_404(Subscriber, id=subscriber_id)
-    affiliate = get_object_or_404(Affiliate, subscriber=subscriber)
+    affiliate = get_object_or_404(
+        Affiliate.objects.with_stats(),
+        subscriber_id=subscriber_id,
+    )
     invitations = affiliate.get_affiliate_invitees()
     invitations = mk_paginator(request, invitations, PAGINATION_ITEMS)
 
@@ -753,8 +835,8 @@ def affiliate_detail(request, subscriber_id):
 @onboarding_completed
 def pending_affiliate_payment(request):
     """Handle pending affiliate payment processing."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
-    affiliates = serverowner.get_pending_affiliates()
+    serverowner = get_serverowner_or_404(request)
+    affiliates = serverowner.get_pending_affiliates().with_stats()
     affiliates = mk_paginator(request, affiliates, PAGINATION_ITEMS)
 
     if request.method == "POST":
@@ -763,28 +845,22 @@ def pending_affiliate_payment(request):
             affiliate = get_object_or_404(Affiliate, pk=affiliate_id)
             if serverowner.coinpayment_onboarding:
                 try:
-                    endpoint = "https://www.coinpayments.net/api.php"
-                    data = (
-                        f"version=1&cmd=create_withdrawal&amount={affiliate.pending_coin_commissions}&currency="
-                        f"{settings.COINBASE_CURRENCY}&add_tx_fee=1&auto_confirm=1&address="
-                        f"{affiliate.paymentdetail.litecoin_address}&key={serverowner.coinpayment_api_public_key}&format=json"
-                    )
-                    headers = {
-                        "Content-Type": "application/x-www-form-urlencoded",
-                        "HMAC": create_hmac_signature(
-                            data,
-                            serverowner.coinpayment_api_secret_key,
-                        ),
-                    }
-                    response = requests.post(endpoint, data=data, headers=headers)
-                    response.raise_for_status()
-                    result = response.json()["result"]
+                    result = coinpayments_request(
+                        "create_withdrawal",
+                        serverowner.coinpayment_api_public_key,
+                        serverowner.coinpayment_api_secret_key,
+                        amount=affiliate.pending_coin_commissions,
+                        currency=settings.COINBASE_CURRENCY,
+                        add_tx_fee=1,
+                        auto_confirm=1,
+                        address=affiliate.paymentdetail.litecoin_address,
+                    )["result"]
                     if result.get("status") == 1:
                         process_affiliate_payment(affiliate, serverowner, request)
                         return redirect("pending_affiliate_payment")
                     msg = f"Withdrawal status: {result.get('status')}"
                     logger.warning(msg)
-                except requests.exceptions.RequestException:
+                except RequestException:
                     logger.exception("Coinbase API request failed.")
                     messages.error(
                         request,
@@ -809,6 +885,7 @@ def pending_affiliate_payment(request):
     template = "serverowner/affiliate/payment_pending.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "affiliates": affiliates,
     }
 
@@ -847,6 +924,7 @@ def process_affiliate_payment(affiliate, serverowner, request):
         paid=False,
     )
     affiliate_payments.update(paid=True, date_payment_confirmed=timezone.now())
+    invalidate_counts(serverowner.pk)
 
     if serverowner.coinpayment_onboarding:
         messages.success(
@@ -870,19 +948,77 @@ def process_affiliate_payment(affiliate, serverowner, request):
 @onboarding_completed
 def confirmed_affiliate_payment(request):
     """View to list affiliates a serverowner has paid commissions."""
-    serverowner = get_object_or_404(ServerOwner, user=request.user)
+    serverowner = get_serverowner_or_404(request)
     affiliates = serverowner.get_confirmed_affiliate_payments()
-    affiliates = mk_paginator(request, affiliates, PAGINATION_ITEMS)
+    affiliates = mk_cursor_paginator(
+        request,
+        affiliates,
+        PAGINATION_ITEMS,
+        (serverowner.pk, "confirmed-affiliate-payments"),
+    )
 
     template = "serverowner/affiliate/payment_confirmed.html"
     context = {
         "serverowner": serverowner,
+        "metrics": serverowner.get_dashboard_metrics(),
         "affiliates": affiliates,
     }
 
     return render(request, template, context)
 
 
+@login_required
+@onboarding_completed
+def export(request, name, export_format):
+    """Stream an export of the serverowner's records as CSV or JSON Lines.
+
+    Exports of more than ``EXPORT_STREAMING_ROW_LIMIT`` rows are written to a
+    compressed file in the background instead, and emailed to the serverowner.
+    """
+    serverowner = get_serverowner_or_404(request)
+    if name not in EXPORTS or export_format not in EXPORT_FORMATS:
+        msg = "No export matches the given query."
+        raise Http404(msg)
+
+    export = EXPORTS[name]
+    limit = settings.EXPORT_STREAMING_ROW_LIMIT
+    # Probe for a row past the limit instead of counting them all
+    if export.get_queryset(serverowner)[limit : limit + 1].exists():
+        export_to_file.delay(
+            str(serverowner.pk),
+            name,
+            export_format,
+            request.build_absolute_uri("/"),
+        )
+        messages.success(
+            request,
+            "Your export is being prepared. We will email you a link to download it.",
+        )
+        return redirect(export.list_url_name)
+
+    response = StreamingHttpResponse(
+        export_lines(name, export_format, serverowner),
+        content_type=EXPORT_FORMATS[export_format],
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{export_filename(name, export_format)}"'
+    )
+    return response
+
+
+@login_required
+@onboarding_completed
+def export_download(request, filename):
+    """Download a compressed export file of the serverowner."""
+    serverowner = get_serverowner_or_404(request)
+    storage = storages["exports"]
+    path = f"{serverowner.pk}/{filename}"
+    if not filename.endswith(".gz") or not storage.exists(path):
+        msg = "No export matches the given query."
+        raise Http404(msg)
+    return FileResponse(storage.open(path), as_attachment=True, filename=filename)
+
+
 ##################################################
 #                   SUBSCRIBERS                  #
 ##################################################
@@ -891,7 +1027,7 @@ def confirmed_affiliate_payment(request):
 @login_required
 def subscriber_dashboard(request):
     """Render the subscription information of a subscriber."""
-    subscriber = get_object_or_404(Subscriber, user=request.user)
+    subscriber = get_subscriber_or_404(request)
     serverowner = subscriber.subscribed_via
 
     # Retrieve the plans related to the ServerOwner
@@ -944,7 +1080,7 @@ def subscriber_dashboard(request):
 def check_pending_subscription(request):
     """Check if the logged-in subscriber has any pending subscription."""
     try:
-        subscriber = Subscriber.objects.get(user=request.user)
+        subscriber = request.profile.subscriber
         latest_pending_subscription = subscriber.get_latest_pending_subscription()
 
         if latest_pending_subscription:
@@ -965,25 +1101,18 @@ def check_pending_subscription(request):
 def subscription_coin(request, plan_id):
     """View for subscribing to a plan using the Coinpayments API."""
     plan = get_object_or_404(CoinPlan, id=plan_id)
-    subscriber = get_object_or_404(Subscriber, user=request.user)
+    subscriber = get_subscriber_or_404(request)
 
     try:
-        endpoint = "https://www.coinpayments.net/api.php"
-        data = (
-            f"version=1&cmd=create_transaction&amount={plan.amount}&currency1=USD&currency2="
-            + settings.COINBASE_CURRENCY
-            + f"&buyer_email={subscriber.email}&key={subscriber.subscribed_via.coinpayment_api_public_key}&format=json"
-        )
-        headers = {
-            "Content-Type": "application/x-www-form-urlencoded",
-            "HMAC": create_hmac_signature(
-                data,
-                subscriber.subscribed_via.coinpayment_api_secret_key,
-            ),
-        }
-        response = requests.post(endpoint, data=data, headers=headers)
-        response.raise_for_status()
-        result = response.json()["result"]
+        result = coinpayments_request(
+            "create_transaction",
+            subscriber.subscribed_via.coinpayment_api_public_key,
+            subscriber.subscribed_via.coinpayment_api_secret_key,
+            amount=plan.amount,
+            currency1="USD",
+            currency2=settings.COINBASE_CURRENCY,
+            buyer_email=subscriber.email,
+        )["result"]
         if result:
             checkout_url = result["checkout_url"]
             CoinSubscription.objects.create(
@@ -1006,7 +1135,7 @@ def subscription_coin(request, plan_id):
             "An error occurred during the transaction. Please try again later.",
         )
         return redirect("subscriber_dashboard")
-    except requests.exceptions.RequestException:
+    except RequestException:
         logger.exception("Coinbase API request failed.")
         messages.error(
             request,
@@ -1031,7 +1160,7 @@ def subscription_coin(request, plan_id):
 def subscription_stripe(request, plan_id):
     """View for subscribing to a plan using the Stripe Checkout API."""
     plan = get_object_or_404(StripePlan, id=plan_id)
-    subscriber = get_object_or_404(Subscriber, user=request.user)
+    subscriber = get_subscriber_or_404(request)
 
     session_data = {
         "success_url": request.build_absolute_uri(reverse("subscription_success"))
@@ -1074,7 +1203,7 @@ def subscription_stripe(request, plan_id):
 def subscription_success(request):
     """Process successful subscription payments via Stripe checkout session."""
     if request.method == "GET" and request.GET.get("session_id"):
-        subscriber = get_object_or_404(Subscriber, user=request.user)
+        subscriber = get_subscriber_or_404(request)
         subscription = None
         try:
             session_id = request.GET.get("session_id")
@@ -1106,55 +1235,23 @@ def subscription_success(request):
                     subscriber=subscriber,
                     subscribed_via=subscriber.subscribed_via,
                     plan=plan,
-                    subscription_date=subscription_date,
-                    expiration_date=expiration_date,
                     subscription_id=subscription_id,
                     session_id=session_id,
-                    status=StripeSubscription.SubscriptionStatus.ACTIVE,
+                )
+                activate_subscriptions(
+                    StripeSubscription,
+                    [
+                        SubscriptionPayment(
+                            subscription=subscription,
+                            expiration_date=expiration_date,
+                            paid_at=subscription_date,
+                        ),
+                    ],
                 )
 
                 # Save the customer ID to the subscriber
                 subscriber.stripe_customer_id = session_info.customer
-                subscriber.save()
-
-                # Handle affiliate logic
-                try:
-                    affiliateinvitee = AffiliateInvitee.objects.get(
-                        invitee_discord_id=subscriber.discord_id,
-                    )
-                    AffiliatePayment.objects.create(
-                        serverowner=subscriber.subscribed_via,
-                        affiliate=affiliateinvitee.affiliate,
-                        subscriber=subscriber,
-                        amount=affiliateinvitee.get_affiliate_commission_payment(),
-                    )
-
-                    affiliateinvitee.affiliate.pending_commissions = (
-                        F("pending_commissions")
-                        + affiliateinvitee.get_affiliate_commission_payment()
-                    )
-                    affiliateinvitee.affiliate.save()
-
-                    subscriber.subscribed_via.total_pending_commissions = (
-                        F("total_pending_commissions")
-                        + affiliateinvitee.get_affiliate_commission_payment()
-                    )
-                    subscriber.subscribed_via.save()
-
-                except ObjectDoesNotExist:
-                    affiliateinvitee = None
-
-                # Increment the subscriber count for the plan
-                plan.subscriber_count = F("subscriber_count") + 1
-                # Increment the earnings for this plan
-                plan.subscription_earnings = F("subscription_earnings") + plan.amount
-                plan.save()
-
-                # Increment the total earnings of the serverowner
-                subscriber.subscribed_via.total_earnings = (
-                    F("total_earnings") + plan.amount
-                )
-                subscriber.subscribed_via.save()
+                subscriber.save(update_fields=["stripe_customer_id", "updated"])
 
         except stripe.error.StripeError:
             logger.exception("Stripe Session retrieval error.")
@@ -1183,7 +1280,7 @@ def subscription_success(request):
 @require_POST
 def subscription_cancel(request):
     """View to handle the subscription cancellation for a subscriber."""
-    subscriber = get_object_or_404(Subscriber, user=request.user)
+    subscriber = get_subscriber_or_404(request)
 
     if subscriber.subscribed_via.coinpayment_onboarding:
         try:
@@ -1192,8 +1289,10 @@ def subscription_cancel(request):
                 subscriber=subscriber,
                 status=CoinSubscription.SubscriptionStatus.ACTIVE,
             )
-            coin_subscription.status = CoinSubscription.SubscriptionStatus.CANCELED
-            coin_subscription.save()
+            deactivate_subscriptions(
+                CoinSubscription.objects.filter(pk=coin_subscription.pk),
+                CoinSubscription.SubscriptionStatus.CANCELED,
+            )
             messages.success(
                 request,
                 f"Your subscription has been canceled successfully. It will not be renewed when it expires on {coin_subscription.expiration_date.strftime('%B %d, %Y')}",
@@ -1224,8 +1323,10 @@ def subscription_cancel(request):
                 subscription_stripe.cancel_at_period_end = True
                 subscription_stripe.save()
                 # Update the Subscription object
-                subscription.status = StripeSubscription.SubscriptionStatus.CANCELED
-                subscription.save()
+                deactivate_subscriptions(
+                    StripeSubscription.objects.filter(pk=subscription.pk),
+                    StripeSubscription.SubscriptionStatus.CANCELED,
+                )
 
                 messages.success(
                     request,
@@ -1256,7 +1357,7 @@ def subscription_cancel(request):
 @require_POST
 def affiliate_upgrade(request):
     """Handle the upgrading of a subscriber to an affiliate."""
-    subscriber = get_object_or_404(Subscriber, user=request.user)
+    subscriber = get_subscriber_or_404(request)
 
     # Check if the subscriber already has an affiliate object
     if hasattr(subscriber, "affiliate"):
@@ -1317,7 +1418,7 @@ def affiliate_upgrade(request):
 def affiliate_dashboard(request):
     """Display the affiliate dashboard and allow the affiliate to update payment details."""
     try:
-        affiliate = get_object_or_404(Affiliate, subscriber=request.user.subscriber)
+        affiliate = request.profile.affiliate
 
         # Get the affiliate's payment detail instance
         payment_detail = affiliate.paymentdetail
@@ -1356,9 +1457,14 @@ def affiliate_dashboard(request):
 def affiliate_payments(request):
     """Display a paginated list of payments received by the affiliate."""
     try:
-        affiliate = get_object_or_404(Affiliate, subscriber=request.user.subscriber)
+        affiliate = request.profile.affiliate
         payments = affiliate.get_affiliate_payments()
-        payments = mk_paginator(request, payments, PAGINATION_ITEMS)
+        payments = mk_cursor_paginator(
+            request,
+            payments,
+            PAGINATION_ITEMS,
+            (affiliate.serverowner_id, f"affiliate-payments:{affiliate.pk}"),
+        )
 
         template = "affiliate/payments.html"
         context = {
@@ -1376,7 +1482,7 @@ def affiliate_payments(request):
 def affiliate_invitees(request):
     """Display a paginated list of invitees associated with affiliate."""
     try:
-        affiliate = get_object_or_404(Affiliate, subscriber=request.user.subscriber)
+        affiliate = request.profile.affiliate
         invitations = affiliate.get_affiliate_invitees()
         invitations = mk_paginator(request, invitations, PAGINATION_ITEMS)
 
@@ -1,40 +1,90 @@
-"""Stripe webhook endpoint for real-time event notifications."""
+"""Stripe webhook endpoint for real-time event notifications.
 
+The endpoint only verifies each event and stores it in the StripeEvent inbox, so
+it answers Stripe in constant time. The ``process_stripe_events`` task applies
+the stored events in batches, retrying failed events and allowing replays.
+
+Stripe may deliver an event more than once. The endpoint remembers an event in
+the cache once its inbox row is committed, and drops later deliveries with a
+cache lookup before any database write. The unique event ID of the inbox
+catches those the cache missed, and the consumer claims each event before
+applying it, so every event is applied exactly once.
+"""
+
+import datetime as dt
+import json
 import logging
-from datetime import timezone
 
 import stripe
+from celery import shared_task
 from django.conf import settings
-from django.core.exceptions import ObjectDoesNotExist
+from django.core.cache import cache
 from django.db import transaction
-from django.db.models import F
 from django.http import HttpResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 
 from .models import (
-    AffiliateInvitee,
-    AffiliatePayment,
     ServerOwner,
+    StripeEvent,
     StripeSubscription,
 )
+from .subscriptions import (
+    SubscriptionPayment,
+    activate_subscriptions,
+    deactivate_subscriptions,
+)
 from .tasks import send_payment_failed_email
 
 logger = logging.getLogger(__name__)
 
+# Number of inbox events applied per transaction
+STRIPE_EVENT_BATCH_SIZE = 100
+# Failed processing attempts before an event is marked as failed
+STRIPE_EVENT_MAX_ATTEMPTS = 5
+# Seconds a delivered event ID is remembered, Stripe retries for up to 3 days
+STRIPE_EVENT_DEDUP_TTL = 60 * 60 * 24 * 3
+
+
+def is_stripe_event_stored(event_id):
+    """Check whether a Stripe event was remembered as stored in the inbox.
+
+    Args:
+        event_id (str): The Stripe ID of the event.
+
+    Returns:
+        bool: True if the event is known to be stored, False otherwise.
+    """
+    return cache.has_key(f"stripe-event:{event_id}")
+
+
+def remember_stripe_event(event_id):
+    """Remember in the cache that a Stripe event is stored in the inbox.
+
+    Only called once the inbox row is committed, so an event whose delivery
+    failed before is stored by Stripe's next delivery.
+
+    Args:
+        event_id (str): The Stripe ID of the event.
+    """
+    cache.set(f"stripe-event:{event_id}", 1, STRIPE_EVENT_DEDUP_TTL)
+
 
 @csrf_exempt
 def stripe_webhook(request):
     """Handle incoming Stripe webhook events.
 
-    This function verifies the webhook event, processes different types of events,
-    and updates relevant database records accordingly.
+    This function verifies the webhook event and stores it in the StripeEvent inbox.
+    Events already delivered are acknowledged without touching the database. The
+    ``process_stripe_events`` task is queued to apply the event once the inbox row
+    is committed.
 
     Args:
         request (HttpRequest): The HTTP request object containing the webhook payload.
 
     Returns:
         HttpResponse: HTTP response indicating the status of webhook processing.
-            - 200 OK if the webhook event was processed successfully.
+            - 200 OK if the webhook event was stored.
             - 400 Bad Request if there was an error verifying the webhook event.
     """
     payload = request.body
@@ -58,94 +108,171 @@ def stripe_webhook(request):
         logger.exception(msg)
         return HttpResponse(status=400)
 
+    if is_stripe_event_stored(event.id):
+        logger.info("Skipping redelivered Stripe event %s", event.id)
+        return HttpResponse(status=200)
+
+    # A single INSERT that ignores events already in the inbox
+    StripeEvent.objects.bulk_create(
+        [
+            StripeEvent(
+                event_id=event.id,
+                type=event.type,
+                payload=json.loads(payload),
+            ),
+        ],
+        ignore_conflicts=True,
+    )
+    transaction.on_commit(lambda: remember_stripe_event(event.id), robust=True)
+    # The beat schedule processes the inbox too, should the broker be unreachable
+    transaction.on_commit(process_stripe_events.delay, robust=True)
+
+    return HttpResponse(status=200)
+
+
+@shared_task(name="process_stripe_events")
+def process_stripe_events(batch_size=STRIPE_EVENT_BATCH_SIZE):
+    """Apply the pending Stripe events of the inbox in batches.
+
+    Each batch is locked with ``SKIP LOCKED`` so several workers can drain the
+    inbox at once. Each event is applied in its own savepoint, see
+    ``apply_stripe_event``: a failing event is left pending with its error and
+    retried on a later run, until ``STRIPE_EVENT_MAX_ATTEMPTS`` attempts have failed.
+
+    Args:
+        batch_size (int): The number of events applied per transaction.
+
+    Returns:
+        int: The number of events handled in this run.
+    """
+    handled = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            inbox_events = list(
+                StripeEvent.pending_events.select_for_update(skip_locked=True)
+                .filter(id__gt=last_id)
+                .order_by("id")[:batch_size],
+            )
+            if not inbox_events:
+                return handled
+            failed_events = [
+                inbox_event
+                for inbox_event in inbox_events
+                if not apply_stripe_event(inbox_event)
+            ]
+            StripeEvent.objects.bulk_update(
+                failed_events,
+                ["status", "attempts", "error", "updated"],
+            )
+        last_id = inbox_events[-1].id
+        handled += len(inbox_events)
+
+
+def apply_stripe_event(inbox_event):
+    """Apply an inbox event at most once.
+
+    The event is marked as processed with a conditional UPDATE in the same
+    savepoint as the changes it causes, so an event already applied by another
+    worker is skipped and a failing event is left pending. The failed attempt is
+    recorded on the instance, to be saved by the caller.
+
+    Args:
+        inbox_event (StripeEvent): The pending event to apply.
+
+    Returns:
+        bool: False if the event failed, True otherwise.
+    """
+    now = timezone.now()
+    try:
+        with transaction.atomic():
+            claimed = StripeEvent.pending_events.filter(pk=inbox_event.pk).update(
+                status=StripeEvent.EventStatus.PROCESSED,
+                processed_at=now,
+                error="",
+                updated=now,
+            )
+            if not claimed:
+                logger.info("Skipping processed Stripe event %s", inbox_event.event_id)
+                return True
+            handle_stripe_event(
+                stripe.Event.construct_from(inbox_event.payload, stripe.api_key),
+            )
+    except Exception as e:
+        logger.exception("Failed to process Stripe event %s", inbox_event.event_id)
+        inbox_event.attempts += 1
+        inbox_event.error = repr(e)
+        if inbox_event.attempts >= STRIPE_EVENT_MAX_ATTEMPTS:
+            inbox_event.status = StripeEvent.EventStatus.FAILED
+        inbox_event.updated = now
+        return False
+    return True
+
+
+def handle_stripe_event(event):
+    """Update the database records affected by a Stripe event.
+
+    Args:
+        event (stripe.Event): The verified Stripe event.
+
+    Raises:
+        StripeSubscription.DoesNotExist: If the subscription of an invoice event is
+            not known yet, so the event is retried later.
+    """
     if event.type == "invoice.paid":
         # Process payment success event
         subscription_id = event.data.object.subscription
-        try:
-            subscription = StripeSubscription.objects.get(
-                subscription_id=subscription_id,
-            )
-        except StripeSubscription.DoesNotExist:
-            subscription = None
+        subscription = StripeSubscription.objects.select_related("plan").get(
+            subscription_id=subscription_id,
+        )
 
         if event.data.object.status == "paid":
-            with transaction.atomic():
-                # Update subscription status and dates
-                subscription.status = StripeSubscription.SubscriptionStatus.ACTIVE
-                if subscription.subscription_date is None:
-                    subscription.subscription_date = timezone.datetime.fromtimestamp(
-                        event.data.object.created,
-                        tz=timezone.utc,
-                    )
-                current_period_end = event.data.object.lines.data[0].period.end
-                expiration_date = timezone.datetime.fromtimestamp(
-                    current_period_end,
-                    tz=timezone.utc,
-                )
-                subscription.expiration_date = expiration_date
-                subscription.save()
-
-                # Handle affiliate commission payment and updates
-                subscriber = subscription.subscriber
-                try:
-                    affiliateinvitee = AffiliateInvitee.objects.get(
-                        invitee_discord_id=subscriber.discord_id,
-                    )
-                    AffiliatePayment.objects.create(
-                        serverowner=subscriber.subscribed_via,
-                        affiliate=affiliateinvitee.affiliate,
-                        subscriber=subscriber,
-                        amount=affiliateinvitee.get_affiliate_commission_payment(),
-                    )
-                    affiliateinvitee.affiliate.pending_commissions = (
-                        F("pending_commissions")
-                        + affiliateinvitee.get_affiliate_commission_payment()
-                    )
-                    affiliateinvitee.affiliate.save()
-
-                    subscriber.subscribed_via.total_pending_commissions = (
-                        F("total_pending_commissions")
-                        + affiliateinvitee.get_affiliate_commission_payment()
-                    )
-                    subscriber.subscribed_via.save()
-
-                except ObjectDoesNotExist:
-                    affiliateinvitee = None
-
-                # Update plan statistics
-                plan = subscription.plan
-                plan.subscriber_count = F("subscriber_count") + 1
-                plan.subscription_earnings = F("subscription_earnings") + plan.amount
-                plan.save()
-
-                # Update server owner earnings
-                subscriber.subscribed_via.total_earnings = (
-                    F("total_earnings") + plan.amount
-                )
-                subscriber.subscribed_via.save()
+            current_period_end = event.data.object.lines.data[0].period.end
+            activate_subscriptions(
+                StripeSubscription,
+                [
+                    SubscriptionPayment(
+                        subscription=subscription,
+                        expiration_date=dt.datetime.fromtimestamp(
+                            current_period_end,
+                            tz=dt.timezone.utc,
+                        ),
+                        paid_at=dt.datetime.fromtimestamp(
+                            event.data.object.created,
+                            tz=dt.timezone.utc,
+                        ),
+                    ),
+                ],
+            )
 
     elif event.type == "invoice.payment_failed":
         # Handle payment failure event
         subscription_id = event.data.object.subscription
-        try:
-            subscription = StripeSubscription.objects.get(
-                subscription_id=subscription_id,
-            )
-        except StripeSubscription.DoesNotExist:
-            logger.exception("Subscription not found")
-            return HttpResponse(status=404)
+        subscription = StripeSubscription.objects.get(
+            subscription_id=subscription_id,
+        )
 
         if subscription.status == StripeSubscription.SubscriptionStatus.PENDING:
             # Delete new subscription if payment failed
             subscription.delete()
-        else:
+        elif subscription.status == StripeSubscription.SubscriptionStatus.ACTIVE:
             # Mark renewal subscription as expired if payment failed
+            deactivate_subscriptions(
+                StripeSubscription.objects.filter(pk=subscription.pk),
+                StripeSubscription.SubscriptionStatus.EXPIRED,
+                expiration_date=timezone.now(),
+            )
+        else:
             subscription.status = StripeSubscription.SubscriptionStatus.EXPIRED
             subscription.expiration_date = timezone.now()
-            subscription.save()
+            subscription.save(update_fields=["status", "expiration_date", "updated"])
 
         # Send notification email to subscriber
-        send_payment_failed_email.delay(subscription.subscriber.email)
+        subscriber_email = subscription.subscriber.email
+        transaction.on_commit(
+            lambda: send_payment_failed_email.delay(subscriber_email),
+            robust=True,
+        )
 
     elif event.type == "account.updated":
         # Handle server owner onboarding status update event
@@ -161,5 +288,3 @@ def stripe_webhook(request):
                 serverowner.save()
         except ServerOwner.DoesNotExist:
             pass
-
-    return HttpResponse(status=200)
@@ -33,6 +33,7 @@ MIDDLEWARE = [
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "accounts.middleware.ProfileMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.contrib.flatpages.middleware.FlatpageFallbackMiddleware",
@@ -72,6 +73,19 @@ DATABASES = {
     },
 }
 
+# Redis cache shared by all processes, an in-process cache when not configured
+CACHE_URL = config("CACHE_URL", default="")
+CACHES = {
+    "default": (
+        {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": CACHE_URL,
+        }
+        if CACHE_URL
+        else {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}
+    ),
+}
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         "NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator",
@@ -97,6 +111,20 @@ USE_TZ = True
 
 STATICFILES_DIRS = [BASE_DIR / "static"]
 
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        "BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage",
+    },
+    # Files of the background exports, only served to their serverowner
+    "exports": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+        "OPTIONS": {"location": BASE_DIR / "exports"},
+    },
+}
+
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 MESSAGE_TAGS = {
@@ -114,6 +142,19 @@ STRIPE_API_VERSION = config("STRIPE_API_VERSION")
 
 DISCORD_CLIENT_ID = config("DISCORD_CLIENT_ID")
 DISCORD_CLIENT_SECRET = config("DISCORD_CLIENT_SECRET")
+DISCORD_API_URL = config("DISCORD_API_URL", default="https://discord.com/api")
+# Where the Discord rate-limit buckets are tracked, the cache sharing them
+# between workers, and how long a request may wait for its bucket to reset
+DISCORD_RATE_LIMIT_BUCKETS = config(
+    "DISCORD_RATE_LIMIT_BUCKETS",
+    default="accounts.discord.CacheBuckets",
+)
+DISCORD_RATE_LIMIT_MAX_WAIT = config(
+    "DISCORD_RATE_LIMIT_MAX_WAIT",
+    default=5.0,
+    cast=float,
+)
+DISCORD_RATE_LIMIT_RETRIES = config("DISCORD_RATE_LIMIT_RETRIES", default=1, cast=int)
 
 AUTH_USER_MODEL = "accounts.User"
 
@@ -126,7 +167,59 @@ EMAIL_HOST_PASSWORD = config("EMAIL_HOST_PASSWORD")
 EMAIL_PORT = config("EMAIL_PORT", cast=int)
 EMAIL_USE_TLS = True
 
+# Shared client for outbound calls to CoinPayments and Discord, timeouts in seconds
+OUTBOUND_HTTP_CONNECT_TIMEOUT = config(
+    "OUTBOUND_HTTP_CONNECT_TIMEOUT",
+    default=3.05,
+    cast=float,
+)
+OUTBOUND_HTTP_READ_TIMEOUT = config(
+    "OUTBOUND_HTTP_READ_TIMEOUT",
+    default=15.0,
+    cast=float,
+)
+OUTBOUND_HTTP_RETRIES = config("OUTBOUND_HTTP_RETRIES", default=2, cast=int)
+OUTBOUND_HTTP_BACKOFF = config("OUTBOUND_HTTP_BACKOFF", default=0.5, cast=float)
+# Kept connections per host, at least COINPAYMENTS_POLL_WORKERS
+OUTBOUND_HTTP_POOL_SIZE = config("OUTBOUND_HTTP_POOL_SIZE", default=10, cast=int)
+
 COINBASE_CURRENCY = "LTC"
+COINPAYMENTS_API_URL = config(
+    "COINPAYMENTS_API_URL",
+    default="https://www.coinpayments.net/api.php",
+)
+# Threads shared by all serverowners when polling pending coin transactions
+COINPAYMENTS_POLL_WORKERS = config("COINPAYMENTS_POLL_WORKERS", default=8, cast=int)
+# Concurrent requests and requests per second allowed for a single serverowner
+COINPAYMENTS_OWNER_CONCURRENCY = config(
+    "COINPAYMENTS_OWNER_CONCURRENCY",
+    default=2,
+    cast=int,
+)
+COINPAYMENTS_OWNER_RATE_LIMIT = config(
+    "COINPAYMENTS_OWNER_RATE_LIMIT",
+    default=5.0,
+    cast=float,
+)
+
+# Provider of the counts of the list pagers and header figures, see accounts.counts
+COUNT_PROVIDER = config(
+    "COUNT_PROVIDER",
+    default="accounts.counts.CachedCountProvider",
+)
+# Counts estimated above this number of rows by the estimating provider
+COUNT_ESTIMATE_THRESHOLD = config(
+    "COUNT_ESTIMATE_THRESHOLD",
+    default=10000,
+    cast=int,
+)
+
+# Exports with more rows are written to a file in the background and emailed
+EXPORT_STREAMING_ROW_LIMIT = config(
+    "EXPORT_STREAMING_ROW_LIMIT",
+    default=100000,
+    cast=int,
+)
 
 CELERY_BROKER_URL = config("CELERY_BROKER_URL")
 CELERY_RESULT_BACKEND = CELERY_BROKER_URL
@@ -139,11 +232,21 @@ CELERY_BEAT_SCHEDULE = {
         "task": "check_coin_transaction_status",
         "schedule": 60.0,
     },
+    "process_stripe_events_every_60_seconds": {
+        "task": "process_stripe_events",
+        "schedule": 60.0,
+    },
     "check_and_mark_expired_subscriptions_daily": {
         "task": "check_and_mark_expired_subscriptions",
         "schedule": crontab(hour=0, minute=0),
     },
+    "reconcile_plan_active_subscriber_counts_daily": {
+        "task": "reconcile_plan_active_subscriber_counts",
+        "schedule": crontab(hour=3, minute=0),
+    },
 }
 CELERY_IMPORTS = [
+    "accounts.exports",
     "accounts.tasks",
+    "accounts.webhooks",
 ]
@@ -23,7 +23,16 @@ AWS_S3_OBJECT_PARAMETERS = {"CacheControl": "max-age=86400"}
 # s3 static settings
 STATIC_LOCATION = "static"
 STATIC_URL = f"https://{AWS_S3_CUSTOM_DOMAIN}/{STATIC_LOCATION}/"
-STATICFILES_STORAGE = "config.storage_backends.StaticStorage"
+# s3 static and private export files
+STORAGES = {
+    **STORAGES,
+    "staticfiles": {
+        "BACKEND": "config.storage_backends.StaticStorage",
+    },
+    "exports": {
+        "BACKEND": "config.storage_backends.ExportStorage",
+    },
+}
 
 CORS_REPLACE_HTTPS_REFERER = True
 HOST_SCHEME = "https://"
@@ -13,3 +13,24 @@ DATABASES = {
         "NAME": ":memory:",
     },
 }
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+}
+
+STATIC_URL = "/static/"
+
+STORAGES = {
+    **STORAGES,
+    "exports": {
+        "BACKEND": "django.core.files.storage.InMemoryStorage",
+    },
+}
+
+# Count exactly, as transactions of test cases never commit to invalidate counts
+COUNT_PROVIDER = "accounts.counts.CountProvider"
+
+# Run tasks queued with delay() in the test process
+CELERY_TASK_ALWAYS_EAGER = True
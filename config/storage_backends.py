@@ -4,3 +4,9 @@ from storages.backends.s3boto3 import S3Boto3Storage
 class StaticStorage(S3Boto3Storage):
     location = "static"
     default_acl = "public-read"
+
+
+class ExportStorage(S3Boto3Storage):
+    location = "exports"
+    default_acl = "private"
+    file_overwrite = False